@@ -0,0 +1,295 @@
+"""
+Async integrated RAG system.
+IntegratedRAGSystem 的 asyncio 版本：Qdrant 和 LLM 请求使用异步客户端，
+嵌入和重排等模型推理放到线程池中执行，多个并发查询可以共享同一个进程。
+"""
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, List
+
+from dotenv import load_dotenv
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from embeddings.embed_model import EmbeddingModel
+from embeddings.reranker import Reranker
+from embeddings.batching_reranker import BatchingReranker
+from storage.factory import create_async_vector_store
+from llm.llm_client import get_llm_client
+from retrieval.basic_rag_demo import build_answer_prompt
+from retrieval.rag_fusion_demo import (
+    build_rewrite_prompt,
+    parse_rewrites,
+    fallback_rewrites,
+    reciprocal_rank_fusion,
+)
+from app.integrated_rag_system import build_context
+from retrieval.config import load_config
+from observability.tracing import get_tracer
+
+load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+
+class AsyncIntegratedRAGSystem:
+    """异步 RAG 系统：查询改写 → 检索 → 重排 → 生成，全流程非阻塞"""
+
+    def __init__(
+        self,
+        use_rag_fusion: bool = True,
+        use_reranker: bool = True,
+        llm_provider: str = None,
+        embedding_model_name: str = "BAAI/bge-large-zh",
+        reranker_model_name: str = "BAAI/bge-reranker-base",
+        qdrant_url: str = "http://localhost:6333",
+        collection_name: str = "rag_documents",
+        inference_workers: int = 2,
+        rerank_max_batch_size: int = 64,
+        rerank_max_wait_ms: float = 5.0
+    ):
+        """
+        初始化异步 RAG 系统
+
+        Args:
+            use_rag_fusion: 是否使用 RAG-Fusion
+            use_reranker: 是否使用重排（仅基础检索模式）
+            llm_provider: LLM 提供商，None 表示从环境变量读取
+            embedding_model_name: 嵌入模型名称
+            reranker_model_name: 重排模型名称
+            qdrant_url: Qdrant 服务地址
+            collection_name: 集合名称
+            inference_workers: 执行模型推理的线程数
+            rerank_max_batch_size: 并发重排请求合并后的最大 pair 数量
+            rerank_max_wait_ms: 重排请求合并的最长等待时间（毫秒）
+        """
+        self.use_rag_fusion = use_rag_fusion
+        self.use_reranker = use_reranker
+
+        # 模型通过注册表共享，与同进程内的同步系统使用同一份权重
+        self.embedder = EmbeddingModel(model_name=embedding_model_name)
+        # 并发查询的重排请求在几毫秒窗口内合并为一个批次
+        self.reranker = None
+        if use_reranker:
+            self.reranker = BatchingReranker(
+                Reranker(model_name=reranker_model_name),
+                max_batch_size=rerank_max_batch_size,
+                max_wait_ms=rerank_max_wait_ms
+            )
+        # transport（连接池、gRPC、重试、熔断）和量化检索参数与同步客户端一样读取 config.yaml
+        store_config = load_config().get("vector_store", {})
+        self.vector_db = create_async_vector_store(
+            store_type=store_config.get("type", "qdrant"),
+            url=qdrant_url,
+            collection_name=collection_name,
+            store_config=store_config
+        )
+
+        try:
+            self.llm_client = get_llm_client(provider=llm_provider)
+        except Exception as e:
+            print(f"警告: LLM 客户端初始化失败: {e}")
+            self.llm_client = None
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=inference_workers,
+            thread_name_prefix="rag-inference"
+        )
+
+    async def _run_inference(self, fn, *args, **kwargs):
+        """在推理线程池中执行阻塞的模型调用"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def encode(self, texts):
+        """异步编码文本（numpy 输出）"""
+        return await self._run_inference(
+            self.embedder.encode, texts, show_progress_bar=False, output="numpy"
+        )
+
+    async def ensure_collection(self) -> bool:
+        """确保集合存在"""
+        return await self.vector_db.create_collection(vector_size=self.embedder.get_dimension())
+
+    async def add_documents(self, documents: List[str], metadatas: List[Dict] = None) -> List[str]:
+        """向量化并写入文档"""
+        embeddings = await self.encode(documents)
+        return await self.vector_db.add_documents(documents, embeddings, metadatas)
+
+    async def generate_queries(self, original_query: str, num_queries: int = 3) -> List[str]:
+        """使用 LLM 异步生成改写查询"""
+        if self.llm_client is None:
+            return [original_query]
+        try:
+            response = await self.llm_client.agenerate(
+                prompt=build_rewrite_prompt(original_query, num_queries),
+                temperature=0.7
+            )
+            return parse_rewrites(response, original_query, num_queries)
+        except Exception as e:
+            print(f"[LLM Error: {e}] 使用原始查询")
+            return fallback_rewrites(original_query, num_queries)
+
+    async def retrieve_fusion(
+        self,
+        query: str,
+        num_queries: int = 3,
+        top_k_per_query: int = 8,
+        final_top_k: int = 8
+    ) -> List[Dict]:
+        """RAG-Fusion 检索：改写 → 批量编码 → 批量检索 → RRF"""
+        tracer = get_tracer()
+        with tracer.span("rewrite", num_queries=num_queries):
+            queries = await self.generate_queries(query, num_queries=num_queries)
+        query_vectors = await self.encode(queries)
+        with tracer.span("search", num_queries=len(queries), top_k=top_k_per_query):
+            all_results = await self.vector_db.search_batch(query_vectors, top_k=top_k_per_query)
+        with tracer.span("fusion", method="rrf"):
+            return reciprocal_rank_fusion(all_results, top_k=final_top_k)
+
+    async def retrieve(
+        self,
+        query: str,
+        top_k: int = 8,
+        rerank_top_k: int = 3
+    ) -> List[Dict]:
+        """基础检索：编码 → 检索 → 重排（可选）"""
+        query_vector = await self.encode(query)
+        with get_tracer().span("search", top_k=top_k):
+            results = await self.vector_db.search(query_vector, top_k=top_k)
+
+        if self.reranker is not None and results:
+            documents = [r["text"] for r in results]
+            rerank_results = await self.reranker.arerank(query, documents, top_k=rerank_top_k)
+            reranked_results = []
+            for idx, score in rerank_results:
+                result = results[idx].copy()
+                result["rerank_score"] = score
+                reranked_results.append(result)
+            return reranked_results
+
+        return results
+
+    async def generate_answer(self, query: str, context: str) -> str:
+        """基于上下文异步生成答案"""
+        if self.llm_client is None:
+            return "[LLM Error] 请配置 LLM API Key（支持: OPENAI_API_KEY, DOUBAO_API_KEY, DASHSCOPE_API_KEY 等）"
+        with get_tracer().span("generate", provider=self.llm_client.provider) as span:
+            try:
+                return await self.llm_client.agenerate(
+                    prompt=build_answer_prompt(query, context),
+                    temperature=0.7,
+                    max_tokens=1000
+                )
+            except Exception as e:
+                if span is not None:
+                    span.error = str(e)
+                return f"[LLM Error: {e}] 请检查 API Key 配置"
+
+    async def query(self, query: str) -> Dict:
+        """
+        完整的异步 RAG 查询流程
+
+        Returns:
+            包含检索结果和生成答案的字典（格式同 IntegratedRAGSystem.query）
+        """
+        with get_tracer().span("query", rag_fusion=self.use_rag_fusion):
+            if self.use_rag_fusion:
+                retrieved_docs = await self.retrieve_fusion(query)
+            else:
+                retrieved_docs = await self.retrieve(query)
+
+            context, _ = build_context(retrieved_docs)
+            answer = await self.generate_answer(query, context)
+
+        return {
+            "query": query,
+            "retrieved_documents": retrieved_docs,
+            "context": context,
+            "answer": answer,
+            "structured_output": None
+        }
+
+    async def query_stream(self, query: str) -> AsyncIterator[Dict]:
+        """
+        流式异步 RAG 查询：先返回检索结果，再逐段返回答案
+
+        Yields:
+            事件字典，格式同 IntegratedRAGSystem.query_stream
+        """
+        start = time.perf_counter()
+
+        if self.use_rag_fusion:
+            retrieved_docs = await self.retrieve_fusion(query)
+        else:
+            retrieved_docs = await self.retrieve(query)
+        context, _ = build_context(retrieved_docs)
+        yield {
+            "type": "retrieval",
+            "query": query,
+            "retrieved_documents": retrieved_docs,
+            "context": context
+        }
+
+        parts = []
+        time_to_first_token = None
+
+        async def chunks() -> AsyncIterator[str]:
+            if self.llm_client is None:
+                yield "[LLM Error] 请配置 LLM API Key（支持: OPENAI_API_KEY, DOUBAO_API_KEY, DASHSCOPE_API_KEY 等）"
+                return
+            try:
+                async for chunk in self.llm_client.agenerate_stream(
+                    prompt=build_answer_prompt(query, context),
+                    temperature=0.7,
+                    max_tokens=1000
+                ):
+                    yield chunk
+            except Exception as e:
+                yield f"[LLM Error: {e}] 请检查 API Key 配置"
+
+        async for chunk in chunks():
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start
+            parts.append(chunk)
+            yield {"type": "token", "content": chunk}
+
+        yield {
+            "type": "done",
+            "answer": "".join(parts),
+            "time_to_first_token": time_to_first_token,
+            "total_time": time.perf_counter() - start
+        }
+
+    async def close(self):
+        """释放连接和线程池"""
+        await self.vector_db.close()
+        if self.reranker is not None:
+            self.reranker.close()
+        self._executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    # 示例：在同一个进程中并发处理多个查询
+    async def main():
+        system = AsyncIntegratedRAGSystem(llm_provider=os.getenv("LLM_PROVIDER"))
+        await system.ensure_collection()
+
+        queries = [
+            "什么是人工智能？",
+            "机器学习和深度学习有什么区别？",
+            "自然语言处理的应用有哪些？"
+        ]
+        results = await asyncio.gather(*[system.query(q) for q in queries])
+        for result in results:
+            print(f"\n查询: {result['query']}")
+            print(f"答案: {result['answer'][:200]}")
+
+        await system.close()
+
+    asyncio.run(main())
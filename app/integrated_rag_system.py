@@ -5,7 +5,10 @@ Day 14: 系统整合
 
 import sys
 import os
-from typing import Dict, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
 from dotenv import load_dotenv
 
 # 添加项目根目录到 Python 路径
@@ -14,12 +17,85 @@ sys.path.insert(0, project_root)
 
 from retrieval.basic_rag_demo import BasicRAG
 from retrieval.rag_fusion_demo import RAGFusion
+from retrieval.answer_cache import SemanticAnswerCache
 from llm.structured_output_demo import StructuredOutputDemo
+from observability.tracing import get_tracer
 
 # 确保从项目根目录加载 .env 文件
 load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
 
 
+def build_context(retrieved_docs: List[Dict], verbose: bool = False) -> Tuple[str, List[Dict]]:
+    """
+    对检索结果去重并格式化为 LLM 上下文
+    
+    Args:
+        retrieved_docs: 检索结果列表
+        verbose: 是否打印上下文统计（批量 / 异步查询不打印，统计记录在 context span 的属性中）
+        
+    Returns:
+        (上下文字符串, 去重后的文档列表)
+    """
+    with get_tracer().span("context", num_docs=len(retrieved_docs)) as span:
+        context, unique_docs = _build_context(retrieved_docs, verbose)
+        if span is not None:
+            span.set_attribute("unique_docs", len(unique_docs))
+            span.set_attribute("context_chars", len(context))
+    return context, unique_docs
+
+
+def _build_context(retrieved_docs: List[Dict], verbose: bool) -> Tuple[str, List[Dict]]:
+    """build_context 的实现（在 context span 内执行）"""
+    seen_texts = set()
+    unique_docs = []
+    seen_ids = set()
+    
+    for doc in retrieved_docs:
+        # 优先使用 ID 去重，如果没有 ID 则使用文本内容
+        doc_id = doc.get("id")
+        text = doc.get("text", "").strip()
+        
+        # 去重逻辑：优先使用 ID，否则使用文本内容
+        if doc_id and doc_id not in seen_ids:
+            seen_ids.add(doc_id)
+            unique_docs.append(doc)
+        elif text and text not in seen_texts:
+            seen_texts.add(text)
+            unique_docs.append(doc)
+    
+    # 如果去重后没有文档，使用原始结果的前几个
+    if not unique_docs:
+        print("⚠️  警告: 去重后没有文档，使用原始结果")
+        unique_docs = retrieved_docs[:min(5, len(retrieved_docs))]
+    
+    # 格式化上下文，添加更多信息
+    context_parts = []
+    for i, doc in enumerate(unique_docs, 1):
+        text = doc.get("text", "").strip()
+        if not text:
+            continue
+        score = doc.get("fusion_score") or doc.get("rerank_score") or doc.get("score", 0)
+        context_parts.append(f"文档{i}（相关度: {score:.3f}）: {text}")
+    
+    context = "\n\n".join(context_parts)
+    
+    if not verbose:
+        return context, unique_docs
+    
+    # 调试信息
+    print(f"\n📝 上下文构建:")
+    print(f"   检索总数: {len(retrieved_docs)}")
+    print(f"   去重后: {len(unique_docs)} 个唯一文档")
+    print(f"   上下文长度: {len(context)} 字符")
+    
+    # 如果上下文为空或太短，给出提示
+    if not context or len(context) < 50:
+        print("⚠️  警告: 检索到的上下文内容较少，可能影响答案质量")
+        print(f"   上下文预览: {context[:200]}...")
+    
+    return context, unique_docs
+
+
 class IntegratedRAGSystem:
     """完整的 RAG 系统：整合所有组件"""
     
@@ -28,7 +104,10 @@ class IntegratedRAGSystem:
         use_rag_fusion: bool = True,
         use_reranker: bool = True,
         use_structured_output: bool = False,
-        llm_provider: str = None  # None 表示从环境变量读取
+        llm_provider: str = None,  # None 表示从环境变量读取
+        use_answer_cache: bool = True,
+        cache_ttl: float = 3600.0,
+        cache_similarity_threshold: float = 0.95
     ):
         """
         初始化完整 RAG 系统
@@ -38,6 +117,9 @@ class IntegratedRAGSystem:
             use_reranker: 是否使用重排
             use_structured_output: 是否使用结构化输出
             llm_provider: LLM 提供商（doubao, openai, qwen 等）
+            use_answer_cache: 是否启用答案缓存（精确匹配 + 语义相似匹配）
+            cache_ttl: 缓存条目存活秒数
+            cache_similarity_threshold: 语义缓存命中所需的最小余弦相似度
         """
         self.use_rag_fusion = use_rag_fusion
         self.use_reranker = use_reranker
@@ -50,24 +132,266 @@ class IntegratedRAGSystem:
         if use_structured_output:
             self.structured_output = StructuredOutputDemo()
         
-        # 标记是否已添加文档（避免重复添加）
-        self._documents_added = False
+        # 答案缓存：语料版本变化（文档增删）时整体失效
+        self.corpus_version = 0
+        self.answer_cache = None
+        if use_answer_cache:
+            self.answer_cache = SemanticAnswerCache(
+                ttl=cache_ttl,
+                similarity_threshold=cache_similarity_threshold
+            )
+    
+    def invalidate_cache(self):
+        """语料发生变化：递增语料版本并清空答案缓存"""
+        self.corpus_version += 1
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
     
     def add_documents(self, documents: List[str], metadatas: List[Dict] = None, force: bool = False):
         """
         添加文档到知识库
         
+        点 ID 由内容确定性生成，重复添加相同文档是幂等的：已入库的文档会被跳过，
+        不会重复向量化，也不会在集合中产生重复数据。
+        
         Args:
             documents: 文档列表
             metadatas: 元数据列表
-            force: 是否强制添加（即使已添加过）
+            force: 是否强制重新向量化并覆盖已存在的文档
         """
-        if self._documents_added and not force:
-            print("⚠️  文档已添加过，跳过。如需重新添加，请设置 force=True 或清理集合")
-            return
+        stats = self.basic_rag.add_documents(documents, metadatas, skip_existing=not force)
+        if stats["embedded"]:
+            self.invalidate_cache()
+        return stats
+    
+    def ingest_directory(self, directory: str = None, incremental: bool = True) -> Dict:
+        """读取目录中的文件并分块入库（见 BasicRAG.ingest_directory）"""
+        stats = self.basic_rag.ingest_directory(directory, incremental=incremental)
+        if stats["embedded"] or stats["deleted"]:
+            self.invalidate_cache()
+        return stats
+    
+    def _cache_lookup(self, query: str) -> Tuple[Optional[Dict], Optional[np.ndarray]]:
+        """
+        查询答案缓存
         
-        self.basic_rag.add_documents(documents, metadatas)
-        self._documents_added = True
+        Returns:
+            (命中信息或 None, 查询向量)
+        """
+        if self.answer_cache is None:
+            return None, None
+        tracer = get_tracer()
+        hit = self.answer_cache.lookup_exact(query, self.corpus_version)
+        if hit is not None:
+            tracer.increment("answer_cache.exact")
+            return hit, None
+        query_embedding = self.basic_rag.embedder.encode(
+            query, show_progress_bar=False, output="numpy"
+        )
+        hit = self.answer_cache.lookup(query, self.corpus_version, query_embedding)
+        tracer.increment(f"answer_cache.{hit['hit_type']}" if hit is not None else "answer_cache.miss")
+        return hit, query_embedding
+    
+    def retrieve(self, query: str, query_vector: Optional[np.ndarray] = None) -> List[Dict]:
+        """检索（使用 RAG-Fusion 或基础 RAG），query_vector 为答案缓存查询时已计算的向量"""
+        if self.use_rag_fusion:
+            # RAG-Fusion 使用自己的嵌入模型，模型不同时向量不能复用
+            if self.rag_fusion.embedder.model_name != self.basic_rag.embedder.model_name:
+                query_vector = None
+            return self.rag_fusion.retrieve_fusion(
+                query,
+                num_queries=3,
+                top_k_per_query=8,  # 增加每个查询的检索数量
+                final_top_k=8,  # 增加最终返回数量
+                query_vector=query_vector
+            )
+        else:
+            return self.basic_rag.retrieve(
+                query,
+                top_k=8,  # 增加检索数量
+                use_reranker=self.use_reranker,
+                query_vector=query_vector
+            )
+    
+    def retrieve_many(
+        self,
+        queries: List[str],
+        query_vectors: Optional[np.ndarray] = None,
+        concurrency: int = 8
+    ) -> List[List[Dict]]:
+        """批量检索，参数与 retrieve 一致（query_vectors 仅基础 RAG 使用）"""
+        if self.use_rag_fusion:
+            return self.rag_fusion.retrieve_fusion_many(
+                queries,
+                num_queries=3,
+                top_k_per_query=8,
+                final_top_k=8,
+                concurrency=concurrency
+            )
+        return self.basic_rag.retrieve_many(
+            queries,
+            top_k=8,
+            use_reranker=self.use_reranker,
+            query_vectors=query_vectors
+        )
+    
+    def _cache_lookup_many(
+        self,
+        queries: List[str]
+    ) -> Tuple[Dict[str, Dict], List[str], Optional[np.ndarray]]:
+        """
+        批量查询答案缓存：先精确匹配，未命中的查询一次编码后再做语义匹配
+        
+        Returns:
+            (命中 {查询: 命中信息}, 未命中的查询, 未命中查询的向量或 None)
+        """
+        hits = {}
+        tracer = get_tracer()
+        if self.answer_cache is not None:
+            for query in queries:
+                hit = self.answer_cache.lookup_exact(query, self.corpus_version)
+                if hit is not None:
+                    hits[query] = hit
+                    tracer.increment("answer_cache.exact")
+        remaining = [query for query in queries if query not in hits]
+        
+        # 语义缓存和基础 RAG 检索都需要查询向量；RAG-Fusion 会对改写查询重新编码
+        if not remaining or (self.answer_cache is None and self.use_rag_fusion):
+            return hits, remaining, None
+        try:
+            vectors = self.basic_rag.embedder.encode(remaining, show_progress_bar=False, output="numpy")
+        except Exception as e:
+            print(f"⚠️  批量编码失败: {e}")
+            return hits, remaining, None
+        
+        if self.answer_cache is not None:
+            keep = []
+            for i, query in enumerate(remaining):
+                hit = self.answer_cache.lookup(query, self.corpus_version, vectors[i])
+                tracer.increment(f"answer_cache.{hit['hit_type']}" if hit is not None else "answer_cache.miss")
+                if hit is not None:
+                    hits[query] = hit
+                else:
+                    keep.append(i)
+            remaining = [remaining[i] for i in keep]
+            vectors = vectors[keep]
+        return hits, remaining, vectors
+    
+    def _retrieve_batch(
+        self,
+        queries: List[str],
+        query_vectors: Optional[np.ndarray],
+        concurrency: int
+    ) -> List:
+        """批量检索；整批失败时逐个查询重试，单个失败的位置返回异常对象"""
+        try:
+            return self.retrieve_many(queries, query_vectors, concurrency)
+        except Exception as e:
+            print(f"⚠️  批量检索失败（{e}），逐个查询重试")
+        results = []
+        for query in queries:
+            try:
+                results.append(self.retrieve(query))
+            except Exception as item_error:
+                results.append(item_error)
+        return results
+    
+    def query_many(
+        self,
+        queries: List[str],
+        concurrency: int = 8,
+        batch_size: int = 64
+    ) -> List[Dict]:
+        """
+        批量 RAG 查询（离线评测、回填、FAQ 预生成）
+        
+        查询按 batch_size 分批：每批一次编码、一次批量检索、所有重排对合并打分；
+        答案生成提交到 concurrency 个线程的 LLM 调用池，与后续批次的检索同时进行。
+        相同的查询只处理一次；单个查询失败不影响其他查询。
+        
+        Args:
+            queries: 查询列表
+            concurrency: 同时进行的 LLM 调用数量（包括 RAG-Fusion 的查询改写）
+            batch_size: 每批检索的查询数量
+            
+        Returns:
+            与 queries 顺序一致的结果列表，格式同 query，另含 error 字段（成功时为 None）
+        """
+        results: List[Optional[Dict]] = [None] * len(queries)
+        positions: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            positions.setdefault(query, []).append(i)
+        unique_queries = list(positions)
+        
+        def finish(query: str, result: Dict):
+            for i in positions[query]:
+                results[i] = dict(result)
+        
+        def error_result(query: str, error) -> Dict:
+            return {
+                "query": query,
+                "retrieved_documents": [],
+                "context": "",
+                "answer": None,
+                "structured_output": None,
+                "cache_hit": None,
+                "error": str(error)
+            }
+        
+        start = time.perf_counter()
+        pending = []
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="rag-llm") as llm_pool:
+            for batch_start in range(0, len(unique_queries), batch_size):
+                batch = unique_queries[batch_start:batch_start + batch_size]
+                
+                # 0. 答案缓存
+                hits, misses, query_vectors = self._cache_lookup_many(batch)
+                for query, hit in hits.items():
+                    finish(query, {**hit["result"], "query": query, "cache_hit": hit["hit_type"], "error": None})
+                if not misses:
+                    continue
+                
+                # 1. 批量检索；2. 构建上下文；3. 答案生成交给 LLM 调用池
+                retrieved = self._retrieve_batch(misses, query_vectors, concurrency)
+                for i, (query, docs) in enumerate(zip(misses, retrieved)):
+                    if isinstance(docs, Exception):
+                        finish(query, error_result(query, docs))
+                        continue
+                    context, _ = build_context(docs)
+                    future = llm_pool.submit(self.basic_rag.generate_answer, query, context)
+                    embedding = query_vectors[i] if query_vectors is not None else None
+                    pending.append((query, embedding, docs, context, future))
+            
+            for query, embedding, docs, context, future in pending:
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    finish(query, error_result(query, e))
+                    continue
+                result = {
+                    "query": query,
+                    "retrieved_documents": docs,
+                    "context": context,
+                    "answer": answer,
+                    "structured_output": None,
+                    "cache_hit": None,
+                    "error": answer if answer.startswith("[LLM Error") else None
+                }
+                if self.answer_cache is not None and result["error"] is None:
+                    self.answer_cache.store(
+                        query,
+                        {k: v for k, v in result.items() if k != "error"},
+                        self.corpus_version,
+                        embedding
+                    )
+                finish(query, result)
+        
+        elapsed = time.perf_counter() - start
+        get_tracer().record("query_many", elapsed * 1000)
+        failed = sum(1 for result in results if result["error"] is not None)
+        print(f"\n批量查询完成: {len(queries)} 个查询（{len(unique_queries)} 个不同），"
+              f"{failed} 个失败，耗时 {elapsed:.2f}s（{len(queries) / max(elapsed, 1e-9):.1f} queries/s）")
+        return results
     
     def query(
         self,
@@ -84,67 +408,34 @@ class IntegratedRAGSystem:
             output_fields: 结构化输出的字段列表
             
         Returns:
-            包含检索结果和生成答案的字典
+            包含检索结果和生成答案的字典；cache_hit 为 None、"exact" 或 "semantic"
         """
+        with get_tracer().span("query", rag_fusion=self.use_rag_fusion) as span:
+            result = self._query(query, return_structured, output_fields)
+            if span is not None:
+                span.set_attribute("cache_hit", result["cache_hit"] or "none")
+            return result
+    
+    def _query(
+        self,
+        query: str,
+        return_structured: bool,
+        output_fields: Optional[List[str]]
+    ) -> Dict:
+        """query 的实现（在 query span 内执行）"""
+        # 0. 答案缓存（结构化输出请求不走缓存）
+        query_embedding = None
+        if not return_structured:
+            hit, query_embedding = self._cache_lookup(query)
+            if hit is not None:
+                print(f"⚡ 答案缓存命中（{hit['hit_type']}，相似度 {hit['similarity']:.3f}）")
+                return {**hit["result"], "query": query, "cache_hit": hit["hit_type"]}
+        
         # 1. 检索（使用 RAG-Fusion 或基础 RAG）
-        if self.use_rag_fusion:
-            retrieved_docs = self.rag_fusion.retrieve_fusion(
-                query,
-                num_queries=3,
-                top_k_per_query=8,  # 增加每个查询的检索数量
-                final_top_k=8  # 增加最终返回数量
-            )
-        else:
-            retrieved_docs = self.basic_rag.retrieve(
-                query,
-                top_k=8,  # 增加检索数量
-                use_reranker=self.use_reranker
-            )
+        retrieved_docs = self.retrieve(query, query_embedding)
         
         # 2. 构建上下文（去重并格式化）
-        seen_texts = set()
-        unique_docs = []
-        seen_ids = set()
-        
-        for doc in retrieved_docs:
-            # 优先使用 ID 去重，如果没有 ID 则使用文本内容
-            doc_id = doc.get("id")
-            text = doc.get("text", "").strip()
-            
-            # 去重逻辑：优先使用 ID，否则使用文本内容
-            if doc_id and doc_id not in seen_ids:
-                seen_ids.add(doc_id)
-                unique_docs.append(doc)
-            elif text and text not in seen_texts:
-                seen_texts.add(text)
-                unique_docs.append(doc)
-        
-        # 如果去重后没有文档，使用原始结果的前几个
-        if not unique_docs:
-            print("⚠️  警告: 去重后没有文档，使用原始结果")
-            unique_docs = retrieved_docs[:min(5, len(retrieved_docs))]
-        
-        # 格式化上下文，添加更多信息
-        context_parts = []
-        for i, doc in enumerate(unique_docs, 1):
-            text = doc.get("text", "").strip()
-            if not text:
-                continue
-            score = doc.get("fusion_score") or doc.get("rerank_score") or doc.get("score", 0)
-            context_parts.append(f"文档{i}（相关度: {score:.3f}）: {text}")
-        
-        context = "\n\n".join(context_parts)
-        
-        # 调试信息
-        print(f"\n📝 上下文构建:")
-        print(f"   检索总数: {len(retrieved_docs)}")
-        print(f"   去重后: {len(unique_docs)} 个唯一文档")
-        print(f"   上下文长度: {len(context)} 字符")
-        
-        # 如果上下文为空或太短，给出提示
-        if not context or len(context) < 50:
-            print("⚠️  警告: 检索到的上下文内容较少，可能影响答案质量")
-            print(f"   上下文预览: {context[:200]}...")
+        context, unique_docs = build_context(retrieved_docs, verbose=True)
         
         # 3. 生成答案
         answer = self.basic_rag.generate_answer(query, context)
@@ -158,12 +449,96 @@ class IntegratedRAGSystem:
                     output_fields
                 )
         
-        return {
+        result = {
             "query": query,
             "retrieved_documents": retrieved_docs,
             "context": context,
             "answer": answer,
-            "structured_output": structured_data
+            "structured_output": structured_data,
+            "cache_hit": None
+        }
+        
+        # LLM 调用失败的结果不缓存
+        cacheable = not answer.startswith("[LLM Error")
+        if self.answer_cache is not None and not return_structured and cacheable:
+            self.answer_cache.store(query, result, self.corpus_version, query_embedding)
+        
+        return result
+    
+    def query_stream(self, query: str) -> Iterator[Dict]:
+        """
+        流式 RAG 查询：先返回检索结果，再逐段返回答案
+        
+        Yields:
+            事件字典，按顺序为：
+            - {"type": "retrieval", "retrieved_documents": [...], "context": "..."}
+            - {"type": "token", "content": "..."}（多次）
+            - {"type": "done", "answer": "...", "time_to_first_token": 秒, "total_time": 秒}
+        """
+        start = time.perf_counter()
+        
+        hit, query_embedding = self._cache_lookup(query)
+        if hit is not None:
+            cached = hit["result"]
+            yield {
+                "type": "retrieval",
+                "query": query,
+                "retrieved_documents": cached["retrieved_documents"],
+                "context": cached["context"],
+                "cache_hit": hit["hit_type"]
+            }
+            yield {"type": "token", "content": cached["answer"]}
+            elapsed = time.perf_counter() - start
+            yield {
+                "type": "done",
+                "answer": cached["answer"],
+                "time_to_first_token": elapsed,
+                "total_time": elapsed,
+                "cache_hit": hit["hit_type"]
+            }
+            return
+        
+        retrieved_docs = self.retrieve(query, query_embedding)
+        context, _ = build_context(retrieved_docs, verbose=True)
+        yield {
+            "type": "retrieval",
+            "query": query,
+            "retrieved_documents": retrieved_docs,
+            "context": context
+        }
+        
+        parts = []
+        time_to_first_token = None
+        for chunk in self.basic_rag.generate_answer_stream(query, context):
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start
+            parts.append(chunk)
+            yield {"type": "token", "content": chunk}
+        
+        answer = "".join(parts)
+        if self.answer_cache is not None and not answer.startswith("[LLM Error"):
+            self.answer_cache.store(
+                query,
+                {
+                    "query": query,
+                    "retrieved_documents": retrieved_docs,
+                    "context": context,
+                    "answer": answer,
+                    "structured_output": None,
+                    "cache_hit": None
+                },
+                self.corpus_version,
+                query_embedding
+            )
+        
+        total_time = time.perf_counter() - start
+        get_tracer().record("query", total_time * 1000)
+        yield {
+            "type": "done",
+            "answer": answer,
+            "time_to_first_token": time_to_first_token,
+            "total_time": total_time,
+            "cache_hit": None
         }
 
 
@@ -251,4 +626,21 @@ if __name__ == "__main__":
     
     print(f"\n【生成的答案】")
     print(f"  {result['answer']}")
+    
+    print("\n【各阶段耗时】")
+    print(get_tracer().report())
+    
+    # 批量查询：离线评测、FAQ 预生成等场景
+    faq_queries = [
+        "什么是机器学习？",
+        "深度学习和神经网络有什么关系？",
+        "Transformer 被用在哪些模型中？",
+        "什么是机器学习？"
+    ]
+    print(f"\n{'='*50}")
+    print(f"批量查询: {len(faq_queries)} 个")
+    print('='*50)
+    for item in system.query_many(faq_queries, concurrency=4):
+        status = f"错误: {item['error']}" if item["error"] else f"答案: {item['answer'][:80]}..."
+        print(f"\n- {item['query']} (缓存: {item['cache_hit']})\n  {status}")
 
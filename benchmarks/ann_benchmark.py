@@ -0,0 +1,93 @@
+"""
+ANN benchmark: recall@k vs QPS.
+在合成的聚类数据上对比 LocalVectorIndex 的精确检索（flat）与 IVF 近似检索，
+不同 nprobe 下的召回率和吞吐量。
+
+用法:
+    python benchmarks/ann_benchmark.py --num-vectors 200000 --dimension 256
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from storage.local_index import LocalVectorIndex
+
+
+def make_clustered_vectors(num_vectors: int, dimension: int, num_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """生成带簇结构的向量（比纯随机向量更接近真实嵌入的分布）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, num_clusters, num_vectors)
+    return centers[labels] + 0.5 * rng.standard_normal((num_vectors, dimension)).astype(np.float32)
+
+
+def timed_search(index: LocalVectorIndex, queries: np.ndarray, top_k: int, **kwargs):
+    start = time.perf_counter()
+    results = index.search_batch(queries, top_k=top_k, **kwargs)
+    elapsed = time.perf_counter() - start
+    return [[hit["id"] for hit in hits] for hits in results], len(queries) / elapsed
+
+
+def recall_at_k(approx, exact) -> float:
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+    return hits / sum(len(e) for e in exact)
+
+
+def run(num_vectors: int, dimension: int, num_queries: int, top_k: int, dtype: str, nlist: int = None):
+    vectors = make_clustered_vectors(num_vectors, dimension)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(num_vectors, num_queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    texts = [f"doc-{i}" for i in range(num_vectors)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = LocalVectorIndex(
+            tmp_dir,
+            dtype=dtype,
+            index_type="ivf",
+            nlist=nlist,
+            ivf_min_train_size=num_vectors
+        )
+        index.create_collection(vector_size=dimension)
+        start = time.perf_counter()
+        for offset in range(0, num_vectors, 50000):
+            index.add_documents(texts[offset:offset + 50000], vectors[offset:offset + 50000])
+        build_time = time.perf_counter() - start
+        print(f"\n构建耗时 {build_time:.1f}s（含 IVF 训练）: {index._ann.stats()}")
+
+        exact, exact_qps = timed_search(index, queries, top_k, exact=True)
+        print(f"\n{'mode':<14} {'recall@' + str(top_k):>10} {'QPS':>10}")
+        print(f"{'flat (exact)':<14} {1.0:>10.3f} {exact_qps:>10.1f}")
+        for nprobe in (1, 4, 8, 16, 32, 64):
+            approx, qps = timed_search(index, queries, top_k, nprobe=nprobe)
+            print(f"{'ivf nprobe=' + str(nprobe):<14} {recall_at_k(approx, exact):>10.3f} {qps:>10.1f}")
+
+        # 保存后重新加载（倒排列表通过 mmap 映射）
+        index.flush()
+        start = time.perf_counter()
+        reopened = LocalVectorIndex(tmp_dir, index_type="ivf", nlist=nlist)
+        print(f"\n重新加载耗时 {time.perf_counter() - start:.2f}s")
+        approx, qps = timed_search(reopened, queries, top_k, nprobe=16)
+        print(f"{'reloaded n=16':<14} {recall_at_k(approx, exact):>10.3f} {qps:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LocalVectorIndex flat vs IVF benchmark")
+    parser.add_argument("--num-vectors", type=int, default=200000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--nlist", type=int, default=None)
+    args = parser.parse_args()
+    run(args.num_vectors, args.dimension, args.num_queries, args.top_k, args.dtype, args.nlist)
@@ -0,0 +1,116 @@
+"""
+Embedding batching benchmark.
+在长短混合的文档块上对比 EmbeddingModel 的两种批处理方式：
+固定条数（fixed, batch_size=32）与按 token 预算分批（token_budget），
+输出 padding 效率（有效 token / padding 后 token）和吞吐量，并检查两种方式的结果一致。
+
+默认加载真实模型（--backend torch / onnx）；--fake 使用 benchmarks.fakes 的替身，
+按 padding 后的 token 数和每批固定开销模拟耗时，不需要下载模型。
+
+用法:
+    python benchmarks/embedding_batching_benchmark.py --num-texts 2000
+    python benchmarks/embedding_batching_benchmark.py --fake
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks.corpus import iter_corpus
+from embeddings.embed_model import EmbeddingModel, token_budget_batches
+
+
+def make_mixed_texts(num_texts: int, seed: int = 0) -> List[str]:
+    """长短混合的文档块：大多数为短块，少数由多个块拼接成接近 512 token 的长块"""
+    rng = random.Random(seed)
+    chunks = [text for text, _ in iter_corpus(num_texts * 4, seed=seed)]
+    texts = []
+    for _ in range(num_texts):
+        pieces = rng.choice([1, 1, 1, 2, 3, 6])
+        start = rng.randrange(len(chunks) - pieces)
+        texts.append("".join(chunks[start:start + pieces])[:rng.choice([40, 120, 500])])
+    rng.shuffle(texts)
+    return texts
+
+
+def fixed_batches(lengths: np.ndarray, batch_size: int) -> List[np.ndarray]:
+    """固定条数分批（与 SentenceTransformer 一样在一次调用内按长度排序）"""
+    order = np.argsort(-lengths, kind="stable")
+    return [order[start:start + batch_size] for start in range(0, order.size, batch_size)]
+
+
+def padding_efficiency(lengths: np.ndarray, batches: List[np.ndarray]) -> float:
+    padded = sum(int(lengths[batch].max()) * len(batch) for batch in batches)
+    return float(lengths.sum()) / padded
+
+
+def timed_encode(embedder: EmbeddingModel, texts: List[str], repeat: int) -> tuple:
+    best = float("inf")
+    embeddings = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embeddings = embedder.encode(texts, batch_size=32, show_progress_bar=False, output="numpy")
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best, embeddings
+
+
+def run(args):
+    if args.fake:
+        from benchmarks.fakes import FakeSentenceTransformer
+        from embeddings.model_registry import get_model_registry
+        get_model_registry().register_loader(
+            "embedding",
+            lambda model_name, device, dtype: FakeSentenceTransformer(
+                dimension=256,
+                seconds_per_batch=args.fake_ms_per_batch / 1000,
+                seconds_per_token=args.fake_us_per_token / 1_000_000
+            )
+        )
+        backend = "torch"
+    else:
+        backend = args.backend
+
+    texts = make_mixed_texts(args.num_texts)
+    embedder = EmbeddingModel(model_name=args.model, backend=backend, batching="fixed")
+    lengths = embedder.token_lengths(texts)
+    print(f"\n{len(texts)} 个文本，token 数: min={lengths.min()} p50={int(np.median(lengths))} max={lengths.max()}")
+
+    print(f"\n{'mode':<22} {'batches':>8} {'padding eff':>12} {'texts/s':>10} {'speedup':>8}")
+    fixed_speed, reference = timed_encode(embedder, texts, args.repeat)
+    batches = fixed_batches(lengths, 32)
+    print(f"{'fixed (32)':<22} {len(batches):>8} {padding_efficiency(lengths, batches):>12.2%} "
+          f"{fixed_speed:>10.1f} {1.0:>7.2f}x")
+
+    embedder.batching = "token_budget"
+    for budget in args.budgets:
+        embedder.max_tokens_per_batch = budget
+        speed, embeddings = timed_encode(embedder, texts, args.repeat)
+        batches = token_budget_batches(lengths, budget)
+        max_diff = float(np.abs(embeddings - reference).max())
+        print(f"{'token_budget (' + str(budget) + ')':<22} {len(batches):>8} "
+              f"{padding_efficiency(lengths, batches):>12.2%} {speed:>10.1f} {speed / fixed_speed:>7.2f}x"
+              f"  (max |Δ| = {max_diff:.2e})")
+    embedder.close(unload=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EmbeddingModel fixed vs token-budget batching")
+    parser.add_argument("--model", default="BAAI/bge-large-zh")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx"])
+    parser.add_argument("--num-texts", type=int, default=2000)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[4096, 8192, 16384])
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--fake", action="store_true", help="使用替身模型（按 padding 后的 token 数模拟耗时）")
+    parser.add_argument("--fake-ms-per-batch", type=float, default=5.0)
+    parser.add_argument("--fake-us-per-token", type=float, default=2.0)
+    run(parser.parse_args())
@@ -0,0 +1,82 @@
+"""
+Encode pool scaling benchmark.
+对比单进程 EmbeddingModel 与不同进程数的 EncodePool 的编码吞吐量，
+输出每种配置的 texts/s、相对单进程的加速比和并行效率（加速比 / 进程数），并检查结果一致。
+
+默认加载真实模型；--fake 在每个编码进程中安装 benchmarks.fakes 的替身，
+按每条文本固定耗时模拟编码，不需要下载模型。
+
+用法:
+    python benchmarks/encode_pool_benchmark.py --workers 1 2 4 8 --threads-per-worker 4
+    python benchmarks/encode_pool_benchmark.py --fake --workers 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks.corpus import iter_corpus
+from benchmarks.fakes import install_fakes
+from embeddings.embed_model import EmbeddingModel
+from embeddings.encode_pool import EncodePool, available_cpus
+
+
+def timed_encode(encoder, texts, repeat: int) -> tuple:
+    best = float("inf")
+    embeddings = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embeddings = encoder.encode(texts, show_progress_bar=False, output="numpy")
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best, embeddings
+
+
+def run(args):
+    initializer, initargs = None, ()
+    if args.fake:
+        initargs = (256, args.fake_ms_per_text / 1000)
+        initializer = install_fakes
+        install_fakes(*initargs)
+
+    texts = [text for text, _ in iter_corpus(args.num_texts)]
+    print(f"\n{len(texts)} 个文本，可用 CPU: {len(available_cpus())}")
+
+    embedder = EmbeddingModel(model_name=args.model, device="cpu")
+    base_speed, reference = timed_encode(embedder, texts, args.repeat)
+    embedder.close(unload=True)
+
+    print(f"\n{'config':<24} {'texts/s':>10} {'speedup':>8} {'efficiency':>11}")
+    print(f"{'single process':<24} {base_speed:>10.1f} {1.0:>7.2f}x {'-':>11}")
+    for num_workers in args.workers:
+        with EncodePool(
+            model_name=args.model,
+            num_workers=num_workers,
+            threads_per_worker=args.threads_per_worker,
+            initializer=initializer,
+            initargs=initargs
+        ) as pool:
+            speed, embeddings = timed_encode(pool, texts, args.repeat)
+        max_diff = float(np.abs(embeddings - reference).max())
+        label = f"pool {num_workers}×{pool.threads_per_worker}"
+        print(f"{label:<24} {speed:>10.1f} {speed / base_speed:>7.2f}x "
+              f"{speed / base_speed / num_workers:>11.2%}  (max |Δ| = {max_diff:.2e})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EncodePool multi-process scaling")
+    parser.add_argument("--model", default="BAAI/bge-large-zh")
+    parser.add_argument("--num-texts", type=int, default=4000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--fake", action="store_true", help="使用替身模型（按每条文本固定耗时模拟编码）")
+    parser.add_argument("--fake-ms-per-text", type=float, default=0.5)
+    run(parser.parse_args())
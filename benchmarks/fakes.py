@@ -0,0 +1,469 @@
+"""
+Offline stand-ins for benchmarks.
+基准测试用的离线替身：不需要下载模型、启动 Qdrant 或配置 API Key。
+
+    FakeSentenceTransformer  字符二元组哈希向量（相同用词的文本向量相近）
+    FakeCrossEncoder         查询与文档的二元组重合度打分
+    FakeLLMClient            固定延迟的 LLM，经过真实的 LLMScheduler
+    InMemoryQdrant           进程内的 Qdrant 替身（同名集合在同一进程内共享）
+
+install_fakes() 把替身注册到模型注册表和向量库工厂，之后 BasicRAG / RAGFusion
+使用 vector_store_type="memory" 即可运行完整流程；嵌入和重排走的仍是
+EmbeddingModel / Reranker 的真实代码路径，只有模型前向被替换。
+可选的 *_seconds 参数用来模拟模型和网络耗时。
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Union
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from embeddings.model_registry import INFERENCE_BACKENDS, get_model_registry, registry_kind
+from llm.scheduler import LLMScheduler, estimate_tokens
+from storage.factory import register_vector_store
+from storage.qdrant_wrapper import make_point_id
+
+FAKE_STORE_TYPE = "memory"
+
+
+def _bigram_codes(texts: Sequence[str]):
+    """把一批文本的相邻字符对哈希为整数，返回 (所属文本下标, 哈希值)"""
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    joined = "\x00".join(texts)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    rows = np.repeat(np.arange(len(texts)), lengths + 1)[:codes.size]
+    valid = (rows[:-1] == rows[1:]) & (codes[:-1] != 0) & (codes[1:] != 0)
+    hashes = (codes[:-1] * np.uint64(1000003) + codes[1:]) * np.uint64(2654435761)
+    return rows[:-1][valid], hashes[valid]
+
+
+class FakeSentenceTransformer:
+    """
+    SentenceTransformer 替身：字符二元组特征哈希到固定维度
+
+    模拟耗时 = seconds_per_text × 文本数 + Σ(seconds_per_batch + seconds_per_token × 批内 padding 后的 token 数)，
+    分批方式与 SentenceTransformer 一致（先按长度排序，再每 batch_size 条一批），token 数按字符数 + 2 估计。
+    """
+
+    def __init__(
+        self,
+        dimension: int = 256,
+        seconds_per_text: float = 0.0,
+        seconds_per_batch: float = 0.0,
+        seconds_per_token: float = 0.0,
+        max_seq_length: int = 512
+    ):
+        self.dimension = dimension
+        self.seconds_per_text = seconds_per_text
+        self.seconds_per_batch = seconds_per_batch
+        self.seconds_per_token = seconds_per_token
+        self.max_seq_length = max_seq_length
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def simulated_seconds(self, texts: List[str], batch_size: int) -> float:
+        """按 padding 后的 token 数估计一次 encode 的模型耗时"""
+        lengths = sorted((min(len(text) + 2, self.max_seq_length) for text in texts), reverse=True)
+        seconds = self.seconds_per_text * len(texts)
+        for start in range(0, len(lengths), batch_size):
+            batch = lengths[start:start + batch_size]
+            seconds += self.seconds_per_batch + self.seconds_per_token * batch[0] * len(batch)
+        return seconds
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = True,
+        **kwargs
+    ) -> np.ndarray:
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        seconds = self.simulated_seconds(texts, batch_size)
+        if seconds:
+            time.sleep(seconds)
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        rows, hashes = _bigram_codes(texts)
+        columns = (hashes % np.uint64(self.dimension)).astype(np.int64)
+        signs = np.where((hashes >> np.uint64(40)) & np.uint64(1), 1.0, -1.0)
+        embeddings = np.bincount(
+            rows * self.dimension + columns,
+            weights=signs,
+            minlength=len(texts) * self.dimension
+        ).reshape(len(texts), self.dimension).astype(np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+class FakeCrossEncoder:
+    """CrossEncoder 替身：查询二元组在文档中出现的比例作为相关性分数"""
+
+    def __init__(self, seconds_per_pair: float = 0.0):
+        self.seconds_per_pair = seconds_per_pair
+
+    @staticmethod
+    def _bigrams(text: str) -> Set[str]:
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def predict(
+        self,
+        pairs: List[List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        **kwargs
+    ) -> np.ndarray:
+        if self.seconds_per_pair:
+            time.sleep(self.seconds_per_pair * len(pairs))
+        scores = np.empty(len(pairs), dtype=np.float32)
+        query_cache: Dict[str, Set[str]] = {}
+        for i, (query, document) in enumerate(pairs):
+            query_bigrams = query_cache.get(query)
+            if query_bigrams is None:
+                query_bigrams = query_cache[query] = self._bigrams(query)
+            hits = sum(1 for bigram in query_bigrams if bigram in document)
+            scores[i] = hits / max(1, len(query_bigrams))
+        return scores
+
+
+class FakeLLMClient:
+    """
+    LLMClient 替身
+
+    请求经过真实的 LLMScheduler（并发槽位、重试、统计），响应内容由 prompt 推出：
+    查询改写 prompt 返回若干行改写问题，其余 prompt 返回截取的上下文。
+    """
+
+    def __init__(
+        self,
+        latency_seconds: float = 0.02,
+        tokens_per_second: float = 200.0,
+        max_concurrency: int = 8
+    ):
+        """
+        Args:
+            latency_seconds: 每次请求的固定耗时（模拟网络和首 token 延迟）
+            tokens_per_second: 流式输出的速度
+            max_concurrency: 调度器的并发上限
+        """
+        self.provider = "fake"
+        self.model_name = "fake-llm"
+        self.latency_seconds = latency_seconds
+        self.tokens_per_second = tokens_per_second
+        self.scheduler = LLMScheduler(provider="fake", rpm=None, tpm=None, max_concurrency=max_concurrency)
+
+    @staticmethod
+    def _respond(prompt: str) -> str:
+        if "原始问题：" in prompt:
+            original = prompt.split("原始问题：", 1)[1].split("\n", 1)[0].strip()
+            return "\n".join([
+                original,
+                f"{original}的具体含义是什么",
+                f"请从工程实践的角度说明{original}",
+                f"{original}有哪些典型的应用场景",
+            ])
+        context = prompt.split("【上下文信息】", 1)[-1].split("【问题】", 1)[0].strip()
+        return "根据上下文：" + context[:200]
+
+    @staticmethod
+    def _to_prompt(messages: List[Dict[str, str]]) -> str:
+        return "\n".join(message["content"] for message in messages)
+
+    def _chunks(self, answer: str) -> Iterator[str]:
+        for start in range(0, len(answer), 8):
+            yield answer[start:start + 8]
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        prompt = self._to_prompt(messages)
+
+        def send(timeout: float):
+            time.sleep(self.latency_seconds)
+            answer = self._respond(prompt)
+            return answer, estimate_tokens(messages) + len(answer)
+
+        return self.scheduler.call(send, estimate_tokens(messages, max_tokens or 0), deadline)
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        prompt = self._to_prompt(messages)
+
+        async def send(timeout: float):
+            await asyncio.sleep(self.latency_seconds)
+            answer = self._respond(prompt)
+            return answer, estimate_tokens(messages) + len(answer)
+
+        return await self.scheduler.acall(send, estimate_tokens(messages, max_tokens or 0), deadline)
+
+    def generate(self, prompt: str, system_prompt: Optional[str] = None, temperature: Optional[float] = None,
+                 max_tokens: Optional[int] = None, deadline: Optional[float] = None) -> str:
+        return self.chat([{"role": "user", "content": prompt}], temperature, max_tokens, deadline)
+
+    async def agenerate(self, prompt: str, system_prompt: Optional[str] = None, temperature: Optional[float] = None,
+                        max_tokens: Optional[int] = None, deadline: Optional[float] = None) -> str:
+        return await self.achat([{"role": "user", "content": prompt}], temperature, max_tokens, deadline)
+
+    def generate_stream(self, prompt: str, system_prompt: Optional[str] = None, temperature: Optional[float] = None,
+                        max_tokens: Optional[int] = None) -> Iterator[str]:
+        with self.scheduler.slot(estimate_tokens([{"content": prompt}], max_tokens or 0)):
+            time.sleep(self.latency_seconds)
+            for chunk in self._chunks(self._respond(prompt)):
+                time.sleep(len(chunk) / self.tokens_per_second)
+                yield chunk
+
+    async def agenerate_stream(self, prompt: str, system_prompt: Optional[str] = None,
+                               temperature: Optional[float] = None,
+                               max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        async with self.scheduler.aslot(estimate_tokens([{"content": prompt}], max_tokens or 0)):
+            await asyncio.sleep(self.latency_seconds)
+            for chunk in self._chunks(self._respond(prompt)):
+                await asyncio.sleep(len(chunk) / self.tokens_per_second)
+                yield chunk
+
+
+class _Collection:
+    """InMemoryQdrant 中一个集合的数据（向量按行追加，删除只打标记）"""
+
+    def __init__(self, vector_size: int):
+        self.vector_size = vector_size
+        self.vectors = np.empty((1024, vector_size), dtype=np.float32)
+        self.alive = np.zeros(1024, dtype=bool)
+        self.payloads: List[Optional[Dict[str, Any]]] = []
+        self.row_ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.count = 0
+        self.lock = threading.RLock()
+
+    def reserve(self, extra: int):
+        needed = self.count + extra
+        if needed <= len(self.vectors):
+            return
+        capacity = max(needed, 2 * len(self.vectors))
+        vectors = np.empty((capacity, self.vector_size), dtype=np.float32)
+        vectors[:self.count] = self.vectors[:self.count]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.count] = self.alive[:self.count]
+        self.vectors, self.alive = vectors, alive
+
+
+class InMemoryQdrant:
+    """
+    进程内的 Qdrant 替身，接口与 QdrantClient / LocalVectorIndex 一致
+
+    同一 collection_name 的实例共享数据（模拟多个客户端连接同一个 Qdrant 服务），
+    检索为余弦相似度的精确检索，过滤条件只支持字典形式的等值匹配。
+    """
+
+    _collections: Dict[str, _Collection] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, collection_name: str = "rag_documents"):
+        self.collection_name = collection_name
+
+    @classmethod
+    def reset(cls):
+        """删除所有集合"""
+        with cls._registry_lock:
+            cls._collections = {}
+
+    @property
+    def _collection(self) -> _Collection:
+        collection = self._collections.get(self.collection_name)
+        if collection is None:
+            raise RuntimeError(f"集合不存在: {self.collection_name}，请先调用 create_collection")
+        return collection
+
+    def create_collection(self, vector_size: int, distance=None, on_disk: Optional[bool] = None) -> bool:
+        with self._registry_lock:
+            if self.collection_name in self._collections:
+                return False
+            self._collections[self.collection_name] = _Collection(vector_size)
+            return True
+
+    def add_documents(
+        self,
+        texts: List[str],
+        embeddings: Union[List[List[float]], np.ndarray],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        batch_size: Optional[int] = None,
+        parallel: Optional[int] = None
+    ) -> List[str]:
+        metadatas = metadatas or [{}] * len(texts)
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        ids = [make_point_id(text, str(metadata.get("source", ""))) for text, metadata in zip(texts, metadatas)]
+
+        collection = self._collection
+        with collection.lock:
+            collection.reserve(len(ids))
+            for point_id, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+                row = collection.rows.get(point_id)
+                payload = {"text": text, **metadata}
+                if row is None:
+                    row = collection.count
+                    collection.count += 1
+                    collection.rows[point_id] = row
+                    collection.row_ids.append(point_id)
+                    collection.payloads.append(payload)
+                else:
+                    collection.payloads[row] = payload
+                collection.vectors[row] = vector
+                collection.alive[row] = True
+        return ids
+
+    def _mask(self, collection: _Collection, filter_conditions: Optional[Dict]) -> np.ndarray:
+        mask = collection.alive[:collection.count].copy()
+        if filter_conditions:
+            for row in np.flatnonzero(mask):
+                payload = collection.payloads[row]
+                if any(payload.get(key) != value for key, value in filter_conditions.items()):
+                    mask[row] = False
+        return mask
+
+    def search_batch(
+        self,
+        query_vectors: Union[List[List[float]], np.ndarray],
+        top_k: int = 5,
+        filter_conditions: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        if len(query_vectors) == 0:
+            return []
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        collection = self._collection
+        with collection.lock:
+            count = collection.count
+            candidates = np.flatnonzero(self._mask(collection, filter_conditions))
+            scores = collection.vectors[:count] @ queries.T
+            payloads = collection.payloads
+            row_ids = collection.row_ids
+
+        results = []
+        for i in range(len(queries)):
+            column = scores[candidates, i]
+            k = min(top_k, column.size)
+            if k <= 0:
+                results.append([])
+                continue
+            part = np.argpartition(-column, k - 1)[:k] if k < column.size else np.arange(column.size)
+            order = part[np.argsort(-column[part], kind="stable")]
+            hits = []
+            for position in order:
+                row = candidates[position]
+                payload = payloads[row]
+                hits.append({
+                    "id": row_ids[row],
+                    "score": float(column[position]),
+                    "text": payload.get("text", ""),
+                    "metadata": {key: value for key, value in payload.items() if key != "text"}
+                })
+            results.append(hits)
+        return results
+
+    def search(self, query_vector, top_k: int = 5, filter_conditions: Optional[Dict] = None) -> List[Dict]:
+        return self.search_batch([query_vector], top_k=top_k, filter_conditions=filter_conditions)[0]
+
+    def existing_ids(self, ids: Sequence[str], batch_size: int = 1000) -> Set[str]:
+        collection = self._collection
+        with collection.lock:
+            return {
+                point_id for point_id in ids
+                if point_id in collection.rows and collection.alive[collection.rows[point_id]]
+            }
+
+    def scroll_ids(self, match: Optional[Dict[str, Any]] = None, batch_size: int = 1000) -> Set[str]:
+        collection = self._collection
+        with collection.lock:
+            return {collection.row_ids[row] for row in np.flatnonzero(self._mask(collection, match))}
+
+    def scroll_documents(self, batch_size: int = 1000) -> Iterator[tuple]:
+        collection = self._collection
+        with collection.lock:
+            rows = np.flatnonzero(collection.alive[:collection.count])
+            records = [(collection.row_ids[row], collection.payloads[row]) for row in rows]
+        for start in range(0, len(records), batch_size):
+            page = records[start:start + batch_size]
+            yield (
+                [point_id for point_id, _ in page],
+                [payload.get("text", "") for _, payload in page],
+                [{k: v for k, v in payload.items() if k != "text"} for _, payload in page]
+            )
+
+    def delete_points(self, ids: Iterable[str], batch_size: int = 1000) -> int:
+        collection = self._collection
+        deleted = 0
+        with collection.lock:
+            for point_id in ids:
+                row = collection.rows.get(point_id)
+                if row is not None and collection.alive[row]:
+                    collection.alive[row] = False
+                    deleted += 1
+        return deleted
+
+    def count(self) -> int:
+        collection = self._collection
+        with collection.lock:
+            return int(collection.alive[:collection.count].sum())
+
+    def delete_collection(self) -> bool:
+        with self._registry_lock:
+            return self._collections.pop(self.collection_name, None) is not None
+
+    def close(self):
+        pass
+
+
+def install_fakes(
+    dimension: int = 256,
+    embed_seconds_per_text: float = 0.0,
+    rerank_seconds_per_pair: float = 0.0
+):
+    """
+    注册离线替身：模型注册表中的 embedding / reranker 加载函数（所有推理后端），以及 "memory" 向量库
+
+    Args:
+        dimension: 嵌入向量维度
+        embed_seconds_per_text: 每个文本的模拟编码耗时（秒）
+        rerank_seconds_per_pair: 每个 (query, document) 对的模拟打分耗时（秒）
+    """
+    registry = get_model_registry()
+    registry.unload(force=True)
+    for backend in INFERENCE_BACKENDS:
+        registry.register_loader(
+            registry_kind("embedding", backend),
+            lambda model_name, device, dtype: FakeSentenceTransformer(dimension, embed_seconds_per_text)
+        )
+        registry.register_loader(
+            registry_kind("reranker", backend),
+            lambda model_name, device, dtype: FakeCrossEncoder(rerank_seconds_per_pair)
+        )
+    register_vector_store(
+        FAKE_STORE_TYPE,
+        lambda url, collection_name, store_config: InMemoryQdrant(collection_name)
+    )
@@ -0,0 +1,114 @@
+"""
+Fusion benchmark.
+对比基于字典的旧版 RRF 与数组化融合（retrieval.fusion）的耗时，
+并检查两者在 RRF 上的结果是否一致。
+
+用法:
+    python benchmarks/fusion_benchmark.py
+"""
+
+import hashlib
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from retrieval.fusion import FUSION_METHODS, flatten_ranked_lists, fuse, fuse_arrays, top_k_indices
+
+
+def legacy_reciprocal_rank_fusion(ranked_lists: List[List[Dict]], k: int = 60) -> List[Dict]:
+    """旧版 RRF 实现（逐条字典操作 + 全量排序），仅用于对比"""
+    doc_scores = defaultdict(float)
+    doc_map = {}
+    for ranked_list in ranked_lists:
+        for rank, doc in enumerate(ranked_list, 1):
+            doc_id = doc.get("id")
+            doc_text = doc.get("text", "").strip()
+            if not doc_id:
+                doc_id = hashlib.md5(doc_text.encode()).hexdigest()
+            if doc_id in doc_map:
+                if doc.get("score", 0) > doc_map[doc_id].get("score", 0):
+                    doc_map[doc_id] = doc.copy()
+            else:
+                doc_map[doc_id] = doc.copy()
+            doc_scores[doc_id] += 1 / (k + rank)
+
+    fused_results = []
+    for doc_id, fusion_score in sorted(doc_scores.items(), key=lambda x: x[1], reverse=True):
+        doc = doc_map[doc_id].copy()
+        doc["fusion_score"] = fusion_score
+        if "score" not in doc:
+            doc["score"] = 0.0
+        fused_results.append(doc)
+    return fused_results
+
+
+def make_ranked_lists(num_lists: int, hits_per_list: int, corpus_size: int, seed: int = 0) -> List[List[Dict]]:
+    """生成模拟的检索结果：每个列表从同一语料中抽取 hits_per_list 个文档"""
+    rng = random.Random(seed)
+    ranked_lists = []
+    for _ in range(num_lists):
+        doc_indices = rng.sample(range(corpus_size), hits_per_list)
+        scores = sorted((rng.random() for _ in doc_indices), reverse=True)
+        ranked_lists.append([
+            {"id": f"doc-{idx}", "text": f"文档 {idx}", "score": score, "metadata": {}}
+            for idx, score in zip(doc_indices, scores)
+        ])
+    return ranked_lists
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    """多次运行取最短耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(top_k: int = 10):
+    print(
+        f"{'lists':>6} {'hits':>6} {'legacy(ms)':>12} {'rrf(ms)':>10} "
+        f"{'rrf top-k(ms)':>14} {'arrays(ms)':>11} {'speedup':>8}  match"
+    )
+    for num_lists in (10, 25, 50):
+        for hits_per_list in (100, 500, 1000):
+            ranked_lists = make_ranked_lists(num_lists, hits_per_list, corpus_size=hits_per_list * 5)
+
+            legacy = legacy_reciprocal_rank_fusion(ranked_lists)
+            fused = fuse(ranked_lists, method="rrf")
+            match = [d["id"] for d in legacy[:top_k]] == [d["id"] for d in fused[:top_k]]
+
+            legacy_time = best_of(lambda: legacy_reciprocal_rank_fusion(ranked_lists))
+            full_time = best_of(lambda: fuse(ranked_lists, method="rrf"))
+            top_k_time = best_of(lambda: fuse(ranked_lists, method="rrf", top_k=top_k))
+
+            # 仅数组阶段：调用方已持有 ID/分数数组时的开销
+            doc_ids, list_ids, ranks, scores, _ = flatten_ranked_lists(ranked_lists)
+            num_docs = int(doc_ids.max()) + 1
+            array_time = best_of(lambda: top_k_indices(
+                fuse_arrays(doc_ids, list_ids, ranks, scores, num_docs, num_lists), top_k
+            ))
+            print(
+                f"{num_lists:>6} {hits_per_list:>6} {legacy_time * 1000:>12.2f} "
+                f"{full_time * 1000:>10.2f} {top_k_time * 1000:>14.2f} {array_time * 1000:>11.2f} "
+                f"{legacy_time / top_k_time:>7.1f}x  {match}"
+            )
+
+    print("\n各融合方法耗时（50 lists × 1000 hits, top_k=%d）:" % top_k)
+    ranked_lists = make_ranked_lists(50, 1000, corpus_size=5000)
+    for method in FUSION_METHODS:
+        elapsed = best_of(lambda: fuse(ranked_lists, method=method, top_k=top_k))
+        print(f"  {method:<18} {elapsed * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    run()
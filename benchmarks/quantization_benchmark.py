@@ -0,0 +1,120 @@
+"""
+Quantization benchmark: memory vs latency vs recall@k.
+对比 LocalVectorIndex 不量化、int8 标量量化和二值量化，
+不同 oversampling / rescore 组合下的存储占用、检索延迟和召回率。
+
+默认使用合成的聚类向量；--vectors 加载真实嵌入（.npy 文件，或 EmbeddingCache 的缓存目录，
+例如 EMBEDDING_CACHE_DIR 下按模型划分的子目录），查询为随机抽取的文档向量加少量噪声。
+只测量 LocalVectorIndex；Qdrant 集合的量化（vector_store.quantization）需在 Qdrant 服务上另行测量。
+
+用法:
+    python benchmarks/quantization_benchmark.py --num-vectors 100000 --dimension 384
+    python benchmarks/quantization_benchmark.py --vectors data/embedding_cache/<model>
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from storage.local_index import LocalVectorIndex
+from benchmarks.ann_benchmark import make_clustered_vectors, recall_at_k, timed_search
+
+
+def load_vectors(path: str, limit: int = None) -> np.ndarray:
+    """
+    加载真实嵌入向量
+
+    Args:
+        path: .npy 文件（形状为 (n, dim)），或 EmbeddingCache 的缓存目录（index.json + vectors.bin）
+        limit: 最多加载的向量数量
+
+    Returns:
+        float32 向量矩阵
+    """
+    if os.path.isdir(path):
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        stored = np.memmap(
+            os.path.join(path, "vectors.bin"),
+            dtype=np.dtype(meta["dtype"]),
+            mode="r",
+            shape=(meta["capacity"], meta["dimension"])
+        )
+        slots = np.sort(np.fromiter((slot for slot, _ in meta["entries"].values()), dtype=np.int64))
+        vectors = np.asarray(stored[slots[:limit]], dtype=np.float32)
+    else:
+        vectors = np.asarray(np.load(path, mmap_mode="r")[:limit], dtype=np.float32)
+    if vectors.ndim != 2 or not len(vectors):
+        raise ValueError(f"没有可用的向量: {path}")
+    return vectors
+
+
+def build_index(tmp_dir: str, vectors: np.ndarray, quantization: str = None) -> LocalVectorIndex:
+    index = LocalVectorIndex(tmp_dir, collection_name=quantization or "none", quantization=quantization)
+    index.create_collection(vector_size=vectors.shape[1])
+    texts = [f"doc-{i}" for i in range(len(vectors))]
+    for offset in range(0, len(vectors), 50000):
+        index.add_documents(texts[offset:offset + 50000], vectors[offset:offset + 50000])
+    return index
+
+
+def run(num_vectors: int, dimension: int, num_queries: int, top_k: int, vectors_path: str = None):
+    if vectors_path:
+        vectors = load_vectors(vectors_path, num_vectors)
+        num_vectors, dimension = vectors.shape
+        print(f"Loaded {num_vectors} vectors (dim={dimension}) from {vectors_path}")
+    else:
+        vectors = make_clustered_vectors(num_vectors, dimension)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    num_queries = min(num_queries, num_vectors)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(num_vectors, num_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        baseline = build_index(tmp_dir, vectors)
+        exact, exact_qps = timed_search(baseline, queries, top_k)
+        usage = baseline.memory_usage()
+
+        header = f"{'mode':<10} {'oversample':>10} {'rescore':>8} {'bytes/vec':>10} {'MB':>8} {'QPS':>9} {'ms/q':>7} {'recall@' + str(top_k):>10}"
+        print("\n" + header)
+        print("-" * len(header))
+        print(f"{'none':<10} {'-':>10} {'-':>8} {usage['bytes_per_vector']:>10} "
+              f"{usage['vector_bytes'] / 1e6:>8.1f} {exact_qps:>9.1f} {1000 / exact_qps:>7.2f} {1.0:>10.3f}")
+
+        for quantization in ("scalar", "binary"):
+            index = build_index(tmp_dir, vectors, quantization)
+            usage = index.memory_usage()
+            for rescore in (False, True):
+                for oversampling in (1.0, 2.0, 4.0, 8.0):
+                    if not rescore and oversampling > 1.0:
+                        continue  # 不重新打分时多取的候选不影响前 top_k 的顺序
+                    index.rescore = rescore
+                    index.oversampling = oversampling
+                    approx, qps = timed_search(index, queries, top_k)
+                    print(f"{quantization:<10} {oversampling:>10.1f} {str(rescore):>8} {usage['bytes_per_code']:>10} "
+                          f"{usage['code_bytes'] / 1e6:>8.1f} {qps:>9.1f} {1000 / qps:>7.2f} "
+                          f"{recall_at_k(approx, exact):>10.3f}")
+
+    print("\nMB 列为粗排时需要常驻内存的数据量；rescore=True 时还会按候选行读取原始向量（可放在磁盘上）。")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LocalVectorIndex quantization benchmark")
+    parser.add_argument("--num-vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--vectors", default=None,
+                        help="真实嵌入：.npy 文件或 EmbeddingCache 目录（--num-vectors 为加载上限，忽略 --dimension）")
+    args = parser.parse_args()
+    run(args.num_vectors, args.dimension, args.num_queries, args.top_k, args.vectors)
@@ -0,0 +1,309 @@
+"""
+End-to-end benchmark suite with offline stand-ins.
+使用 benchmarks.fakes 中的替身（哈希嵌入、重合度重排、固定延迟 LLM、内存 Qdrant）
+和合成中文语料，测量各规模下的：
+
+    ingest   入库吞吐（docs/sec）
+    query    完整查询（检索 + 重排 + 生成）的 p50/p95/p99 延迟
+    fusion   RAG-Fusion 检索吞吐，以及 retrieval.fusion.fuse 的融合吞吐
+    rerank   重排吞吐（pairs/sec）
+    peak RSS 进程峰值内存
+
+每个规模在独立的子进程中运行（峰值内存互不影响），结果连同各阶段的 tracing 统计
+写入 JSON，可以用 --baseline 与之前的结果对比。
+
+用法:
+    python benchmarks/run_benchmarks.py --sizes 1k,100k
+    python benchmarks/run_benchmarks.py --sizes 1m --num-queries 100 --dimension 128
+    python benchmarks/run_benchmarks.py --sizes 1k --baseline benchmarks/results/20260101-120000.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+DEFAULT_OUTPUT_DIR = os.path.join(project_root, "benchmarks", "results")
+
+# 对比时展示的指标：(路径, 是否越大越好)
+COMPARE_METRICS = [
+    ("ingest.docs_per_sec", True),
+    ("query.p50_ms", False),
+    ("query.p95_ms", False),
+    ("query.p99_ms", False),
+    ("fusion.queries_per_sec", True),
+    ("fusion.fuse_lists_per_sec", True),
+    ("rerank.pairs_per_sec", True),
+    ("peak_rss_mb", False),
+]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """进程峰值常驻内存（MB），不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """延迟列表（秒）转换为毫秒分位数"""
+    values = np.asarray(latencies) * 1000
+    return {
+        "count": int(values.size),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def timed_each(fn, items) -> List[float]:
+    """逐个调用 fn(item)，返回每次的耗时（秒）"""
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_size(num_chunks: int, args) -> Dict:
+    """在当前进程中运行一个规模的全部基准"""
+    from benchmarks.corpus import make_corpus, make_queries
+    from benchmarks.fakes import FAKE_STORE_TYPE, FakeLLMClient, InMemoryQdrant, install_fakes
+    from observability.tracing import Tracer, set_tracer
+    from retrieval.basic_rag_demo import BasicRAG
+    from retrieval.fusion import fuse
+    from retrieval.rag_fusion_demo import RAGFusion
+
+    install_fakes(
+        dimension=args.dimension,
+        embed_seconds_per_text=args.embed_ms_per_text / 1000,
+        rerank_seconds_per_pair=args.rerank_ms_per_pair / 1000
+    )
+    InMemoryQdrant.reset()
+    tracer = Tracer()
+    set_tracer(tracer)
+    llm_client = FakeLLMClient(latency_seconds=args.llm_latency_ms / 1000)
+    collection_name = f"bench_{num_chunks}"
+    result = {"num_chunks": num_chunks}
+
+    start = time.perf_counter()
+    texts, metadatas = make_corpus(num_chunks, seed=args.seed)
+    queries = make_queries(args.num_queries, seed=args.seed + 1)
+    result["corpus_seconds"] = time.perf_counter() - start
+
+    # 1. 入库
+    rag = BasicRAG(
+        collection_name=collection_name,
+        vector_store_type=FAKE_STORE_TYPE,
+        search_type="similarity"
+    )
+    rag.llm_client = llm_client
+    start = time.perf_counter()
+    stats = rag.add_documents(texts, metadatas, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    result["ingest"] = {
+        "documents": stats["documents"],
+        "embedded": stats["embedded"],
+        "seconds": elapsed,
+        "docs_per_sec": stats["documents"] / elapsed,
+    }
+    print(f"[{num_chunks}] 入库 {stats['documents']} 块，{result['ingest']['docs_per_sec']:.0f} docs/sec")
+    del texts, metadatas
+
+    # 2. 完整查询（预热后计时）
+    for query in queries[:args.warmup]:
+        rag.query(query, top_k=args.top_k)
+    tracer.reset()
+    latencies = timed_each(lambda q: rag.query(q, top_k=args.top_k), queries)
+    result["query"] = latency_summary(latencies)
+    result["query"]["queries_per_sec"] = len(latencies) / sum(latencies)
+    retrieve_latencies = timed_each(lambda q: rag.retrieve(q, top_k=args.top_k, use_reranker=False), queries)
+    result["retrieve"] = latency_summary(retrieve_latencies)
+    print(f"[{num_chunks}] 查询 p50={result['query']['p50_ms']:.2f}ms p99={result['query']['p99_ms']:.2f}ms")
+
+    # 3. RAG-Fusion（关闭改写缓存，每次都经过 LLM 替身）
+    fusion = RAGFusion(
+        collection_name=collection_name,
+        vector_store_type=FAKE_STORE_TYPE,
+        rewrite_cache_size=0
+    )
+    fusion.llm_client = llm_client
+    start = time.perf_counter()
+    for query in queries:
+        fusion.retrieve_fusion(query, num_queries=args.num_rewrites, top_k_per_query=args.top_k, final_top_k=args.top_k)
+    fusion_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    fusion.retrieve_fusion_many(queries, num_queries=args.num_rewrites, top_k_per_query=args.top_k, final_top_k=args.top_k)
+    batched_seconds = time.perf_counter() - start
+
+    ranked_lists = rag.vector_db.search_batch(rag.embedder.encode(queries[:args.num_rewrites], output="numpy"), top_k=50)
+    repeat = 200
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fuse(ranked_lists, method="rrf", k=rag.rrf_k, top_k=args.top_k)
+    fuse_seconds = time.perf_counter() - start
+    result["fusion"] = {
+        "queries_per_sec": len(queries) / fusion_seconds,
+        "batched_queries_per_sec": len(queries) / batched_seconds,
+        "fuse_lists_per_sec": repeat * len(ranked_lists) / fuse_seconds,
+    }
+    print(f"[{num_chunks}] RAG-Fusion {result['fusion']['queries_per_sec']:.1f} queries/sec"
+          f"（批量 {result['fusion']['batched_queries_per_sec']:.1f}）")
+
+    # 4. 重排吞吐：每个查询取 rerank_candidates 个候选，合并打分
+    candidates = rag.vector_db.search_batch(rag.embedder.encode(queries, output="numpy"), top_k=args.rerank_candidates)
+    documents_list = [[hit["text"] for hit in hits] for hits in candidates]
+    num_pairs = sum(len(documents) for documents in documents_list)
+    start = time.perf_counter()
+    rag.reranker.rerank_many(queries, documents_list, top_k=args.top_k)
+    rerank_seconds = time.perf_counter() - start
+    result["rerank"] = {"pairs": num_pairs, "pairs_per_sec": num_pairs / rerank_seconds}
+    print(f"[{num_chunks}] 重排 {result['rerank']['pairs_per_sec']:.0f} pairs/sec")
+
+    result["llm"] = llm_client.scheduler.stats()
+    result["stages"] = tracer.summary()
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(f"[{num_chunks}] 峰值内存 {result['peak_rss_mb']:.0f} MB")
+    return result
+
+
+def run_in_subprocess(size: str, argv: List[str]) -> Dict:
+    """在子进程中运行一个规模，返回其结果"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_file = os.path.join(tmp_dir, "result.json")
+        command = [sys.executable, os.path.abspath(__file__), *argv, "--worker", size, "--result-file", result_file]
+        subprocess.run(command, check=True)
+        with open(result_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=project_root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lookup(result: Dict, path: str) -> Optional[float]:
+    value = result
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(current: Dict, baseline: Dict):
+    """按规模打印与基线结果的对比（>1 表示变好）"""
+    baseline_runs = {run["size"]: run for run in baseline.get("runs", [])}
+    print(f"\n与基线对比（{baseline.get('meta', {}).get('git_commit')} @ {baseline.get('meta', {}).get('timestamp')}）")
+    print(f"{'size':<6} {'metric':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for run in current["runs"]:
+        previous = baseline_runs.get(run["size"])
+        if previous is None:
+            continue
+        for path, higher_is_better in COMPARE_METRICS:
+            old, new = lookup(previous, path), lookup(run, path)
+            if not old or not new:
+                continue
+            ratio = new / old if higher_is_better else old / new
+            print(f"{run['size']:<6} {path:<28} {old:>12.2f} {new:>12.2f} {ratio:>7.2f}x")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="RAG pipeline benchmark with offline stand-ins")
+    parser.add_argument("--sizes", default="1k,100k", help="逗号分隔的语料规模：1k / 100k / 1m 或块数量")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--num-rewrites", type=int, default=3, help="RAG-Fusion 改写查询数量")
+    parser.add_argument("--rerank-candidates", type=int, default=50, help="重排基准中每个查询的候选数")
+    parser.add_argument("--batch-size", type=int, default=256, help="入库批大小")
+    parser.add_argument("--dimension", type=int, default=256, help="替身嵌入维度")
+    parser.add_argument("--embed-ms-per-text", type=float, default=0.0, help="模拟每个文本的编码耗时")
+    parser.add_argument("--rerank-ms-per-pair", type=float, default=0.0, help="模拟每个文本对的重排耗时")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0, help="模拟每次 LLM 请求的耗时")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="结果 JSON 路径，默认 benchmarks/results/<时间>.json")
+    parser.add_argument("--baseline", default=None, help="用于对比的历史结果 JSON")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    from benchmarks.corpus import parse_size
+
+    argv = sys.argv[1:]
+    args = parse_args(argv)
+
+    if args.worker is not None:
+        result = run_size(parse_size(args.worker), args)
+        result["size"] = args.worker
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("worker", "result_file")},
+        },
+        "runs": [],
+    }
+    for size in sizes:
+        print("=" * 60)
+        print(f"规模: {size} ({parse_size(size)} 块)")
+        print("=" * 60)
+        report["runs"].append(run_in_subprocess(size, argv))
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'size':<6} {'ingest docs/s':>14} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} "
+          f"{'fusion q/s':>11} {'rerank pairs/s':>15} {'RSS(MB)':>8}")
+    for run in report["runs"]:
+        print(
+            f"{run['size']:<6} {run['ingest']['docs_per_sec']:>14.0f} {run['query']['p50_ms']:>9.2f} "
+            f"{run['query']['p95_ms']:>9.2f} {run['query']['p99_ms']:>9.2f} "
+            f"{run['fusion']['queries_per_sec']:>11.1f} {run['rerank']['pairs_per_sec']:>15.0f} "
+            f"{run['peak_rss_mb'] or 0:>8.0f}"
+        )
+    print(f"\n结果已保存到 {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,18 @@ Embedding models module for RAG system.
 
 from .embed_model import EmbeddingModel
 from .reranker import Reranker
+from .model_registry import ModelRegistry, get_model_registry
+from .embedding_cache import EmbeddingCache
+from .batching_reranker import BatchingReranker
+from .encode_pool import EncodePool
 
-__all__ = ["EmbeddingModel", "Reranker"]
+__all__ = [
+    "EmbeddingModel",
+    "Reranker",
+    "ModelRegistry",
+    "get_model_registry",
+    "EmbeddingCache",
+    "BatchingReranker",
+    "EncodePool",
+]
 
@@ -0,0 +1,215 @@
+"""
+Dynamic micro-batching reranker.
+把并发调用方的 (query, document) 对在几毫秒的窗口内合并成一个批次，
+按长度排序后做一次前向计算，再把分数分发回各个调用方。
+"""
+
+import asyncio
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from embeddings.reranker import Reranker
+
+
+class _Request:
+    """一个调用方的重排请求"""
+
+    __slots__ = ("pairs", "future")
+
+    def __init__(self, pairs: List[List[str]]):
+        self.pairs = pairs
+        self.future: Future = Future()
+
+
+_STOP = object()
+
+
+class BatchingReranker:
+    """
+    请求合并的重排服务，接口与 Reranker.rerank 一致
+
+    后台线程从队列中取出第一个请求后，最多再等待 max_wait_ms 收集其他请求，
+    直到累计的 pair 数量达到 max_batch_size。合并后的 pair 按文本长度排序，
+    使同一前向批次内的 padding 尽量少。
+    """
+
+    def __init__(
+        self,
+        reranker: Optional[Reranker] = None,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        初始化重排服务
+
+        Args:
+            reranker: 底层 Reranker，None 表示使用默认模型创建
+            max_batch_size: 每个合并批次的最大 pair 数量
+            max_wait_ms: 收到第一个请求后最多等待多少毫秒来合并后续请求
+        """
+        self.reranker = reranker or Reranker()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._batches = 0
+        self._pairs = 0
+        self._requests = 0
+
+        self._worker = threading.Thread(
+            target=self._run,
+            name="batching-reranker",
+            daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, query: str, documents: List[str]) -> Future:
+        """
+        提交打分请求
+
+        Returns:
+            Future，结果为与 documents 顺序一致的分数列表
+        """
+        if self._closed:
+            raise RuntimeError("BatchingReranker 已关闭")
+        request = _Request([[query, doc] for doc in documents])
+        if not request.pairs:
+            request.future.set_result([])
+            return request.future
+        self._queue.put(request)
+        return request.future
+
+    def rerank(
+        self,
+        query: str,
+        documents: List[str],
+        top_k: int = None
+    ) -> List[Tuple[int, float]]:
+        """对文档进行重排序（阻塞等待合并批次的结果），返回格式同 Reranker.rerank"""
+        scores = self.submit(query, documents).result()
+        return Reranker.rank_scores(scores, top_k)
+
+    def rerank_many(
+        self,
+        queries: List[str],
+        documents_list: List[List[str]],
+        top_k: int = None
+    ) -> List[List[Tuple[int, float]]]:
+        """批量重排：调用方已经打包好批次，直接交给底层 Reranker（不经过合并队列）"""
+        return self.reranker.rerank_many(queries, documents_list, top_k=top_k, batch_size=self.max_batch_size)
+
+    async def arerank(
+        self,
+        query: str,
+        documents: List[str],
+        top_k: int = None
+    ) -> List[Tuple[int, float]]:
+        """对文档进行重排序（异步版本）"""
+        scores = await asyncio.wrap_future(self.submit(query, documents))
+        return Reranker.rank_scores(scores, top_k)
+
+    def _collect(self, first: _Request) -> Tuple[List[_Request], bool]:
+        """从第一个请求开始，在等待窗口内收集更多请求"""
+        batch = [first]
+        num_pairs = len(first.pairs)
+        deadline = time.monotonic() + self.max_wait
+        while num_pairs < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            num_pairs += len(item.pairs)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch, stop = self._collect(item)
+            self._process(batch)
+
+    def _process(self, batch: List[_Request]):
+        """执行一次合并前向，并把分数分发回各个请求"""
+        pairs = []
+        owners = []
+        for request_idx, request in enumerate(batch):
+            pairs.extend(request.pairs)
+            owners.extend([request_idx] * len(request.pairs))
+
+        # 按长度排序，减少同一前向批次内的 padding
+        try:
+            scores = self.reranker.predict_packed(pairs, batch_size=self.max_batch_size)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        results: List[List[float]] = [[] for _ in batch]
+        for pair_idx, request_idx in enumerate(owners):
+            results[request_idx].append(scores[pair_idx])
+        for request, request_scores in zip(batch, results):
+            request.future.set_result(request_scores)
+
+        self._batches += 1
+        self._requests += len(batch)
+        self._pairs += len(pairs)
+
+    def stats(self) -> Dict[str, float]:
+        """返回合并统计：批次数、请求数、平均每批 pair 数"""
+        return {
+            "batches": self._batches,
+            "requests": self._requests,
+            "pairs": self._pairs,
+            "avg_requests_per_batch": self._requests / self._batches if self._batches else 0.0,
+            "avg_pairs_per_batch": self._pairs / self._batches if self._batches else 0.0,
+        }
+
+    def close(self, timeout: float = 5.0):
+        """停止后台线程（已提交的请求会先处理完）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._worker.join(timeout=timeout)
+
+
+if __name__ == "__main__":
+    # 示例：多个线程并发重排，观察请求合并效果
+    from concurrent.futures import ThreadPoolExecutor
+
+    service = BatchingReranker(max_batch_size=64, max_wait_ms=5)
+    documents = [
+        "人工智能是计算机科学的一个分支，致力于创建能够执行通常需要人类智能的任务的系统。",
+        "机器学习是人工智能的一个子领域，通过算法让计算机从数据中学习。",
+        "今天天气很好，适合出去散步。",
+        "深度学习使用神经网络来模拟人脑的学习过程。",
+    ]
+    queries = ["什么是人工智能？", "机器学习是什么？", "深度学习用什么模型？"] * 10
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda q: service.rerank(q, documents, top_k=1), queries))
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(queries)} 个请求耗时 {elapsed:.3f}s")
+    print(f"合并统计: {service.stats()}")
+    service.close()
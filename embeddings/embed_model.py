@@ -3,9 +3,62 @@ Embedding model wrapper for bge-large-zh and m3e-large.
 Day 1-2: 语义嵌入与向量基础
 """
 
-from typing import List, Union
-from sentence_transformers import SentenceTransformer
-import torch
+import os
+import sys
+from typing import List, Optional, Union
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from embeddings.model_registry import get_model_registry, load_model_config, registry_kind, resolve_device
+from embeddings.embedding_cache import EmbeddingCache, open_embedding_cache
+from observability.tracing import get_tracer
+
+# 批处理方式："fixed" 按固定条数分批；"token_budget" 按长度排序后按 token 预算分批
+BATCHING_MODES = ("fixed", "token_budget")
+DEFAULT_MAX_TOKENS_PER_BATCH = 8192
+
+
+def token_budget_batches(lengths: Union[List[int], np.ndarray], max_tokens_per_batch: int) -> List[np.ndarray]:
+    """
+    按长度降序排列后切分批次：每批 padding 后的 token 数（最长长度 × 条数）不超过预算
+    
+    Args:
+        lengths: 每个文本的 token 数
+        max_tokens_per_batch: 每批的 token 预算（单个文本超出预算时单独成批）
+        
+    Returns:
+        每批在原始输入中的下标数组
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(-lengths, kind="stable")
+    batches = []
+    start = 0
+    while start < order.size:
+        # 批内第一个文本最长，决定整批的 padding 长度
+        batch_len = max(1, int(lengths[order[start]]))
+        count = max(1, max_tokens_per_batch // batch_len)
+        batches.append(order[start:start + count])
+        start += count
+    return batches
+
+
+def embedding_cache_subdir(
+    model_name: str,
+    normalize_embeddings: bool,
+    backend: str = "torch",
+    dtype: Optional[str] = None
+) -> str:
+    """嵌入缓存目录下按模型 / 归一化 / 推理后端划分的子目录名"""
+    subdir = model_name.replace("/", "__") + ("-norm" if normalize_embeddings else "-raw")
+    if backend != "torch":
+        # 量化模型的向量与原模型略有差异，分开缓存
+        subdir += f"-{backend}-{dtype}"
+    return subdir
 
 
 class EmbeddingModel:
@@ -15,62 +68,239 @@ class EmbeddingModel:
         self,
         model_name: str = "BAAI/bge-large-zh",
         device: str = None,
-        normalize_embeddings: bool = True
+        normalize_embeddings: bool = True,
+        dtype: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        cache_max_entries: int = 200_000,
+        backend: Optional[str] = None,
+        batching: Optional[str] = None,
+        max_tokens_per_batch: Optional[int] = None
     ):
         """
         初始化嵌入模型
         
+        模型实例通过进程级注册表共享，同一 (模型名, 设备, 精度) 只加载一次。
+        
         Args:
             model_name: 模型名称，支持 "BAAI/bge-large-zh" 或 "moka-ai/m3e-large"
-            device: 设备，"cuda" 或 "cpu"，None 表示自动选择
+            device: 设备，"cuda" 或 "cpu"，None 表示读取 config.yaml 的
+                    embedding.model_kwargs.device，仍为空则自动选择（onnx 后端固定为 cpu）
             normalize_embeddings: 是否归一化向量
+            dtype: 模型精度，torch 后端为 "float32" 或 "float16"（默认 float32），
+                   onnx 后端为 "int8"（动态量化）或 "float32"，默认读取 config.yaml 的 onnx.dtype
+            cache_dir: 嵌入缓存目录，None 表示读取环境变量 EMBEDDING_CACHE_DIR，
+                       仍为空则不启用缓存
+            cache_max_entries: 磁盘缓存最多保存的向量数量
+            backend: 推理后端，"torch" 或 "onnx"（onnxruntime CPU 推理），
+                     None 表示读取 config.yaml 的 embedding.backend，默认 torch
+            batching: 批处理方式，"fixed"（每批 batch_size 条）或 "token_budget"
+                      （按 token 长度排序，每批 padding 后不超过 max_tokens_per_batch 个 token），
+                      None 表示读取 config.yaml 的 embedding.batching，默认 fixed；
+                      token_budget 需要先额外做一遍分词统计长度，目前只在替身模型上测过收益，需显式开启
+            max_tokens_per_batch: token_budget 模式下每批的 token 预算
         """
+        config = load_model_config("embedding")
+        model_kwargs = config.get("model_kwargs", {}) or {}
         self.model_name = model_name
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.backend = backend or config.get("backend") or "torch"
+        self._kind = registry_kind("embedding", self.backend)
+        if self.backend == "onnx":
+            self.device = "cpu"
+            self.dtype = dtype or load_model_config("onnx").get("dtype") or "int8"
+        else:
+            self.device = resolve_device(device or model_kwargs.get("device"))
+            self.dtype = dtype or model_kwargs.get("dtype") or "float32"
         self.normalize_embeddings = normalize_embeddings
+        batching_config = config.get("batching", {}) or {}
+        self.batching = batching or batching_config.get("mode") or "fixed"
+        if self.batching not in BATCHING_MODES:
+            raise ValueError(f"不支持的批处理方式: {self.batching}，可选: {', '.join(BATCHING_MODES)}")
+        self.max_tokens_per_batch = (
+            max_tokens_per_batch
+            or batching_config.get("max_tokens_per_batch")
+            or DEFAULT_MAX_TOKENS_PER_BATCH
+        )
         
-        print(f"Loading embedding model: {model_name}")
-        print(f"Device: {self.device}")
+        print(f"Embedding model: {model_name}")
+        print(f"Device: {self.device} ({self.backend}, {self.dtype})")
         
-        self.model = SentenceTransformer(
+        self.model = get_model_registry().acquire(
+            self._kind,
             model_name,
-            device=self.device
+            device=self.device,
+            dtype=self.dtype
         )
+        self._released = False
+        
+        # 可选的持久化嵌入缓存（按模型和归一化配置分目录）
+        self.cache = None
+        cache_dir = cache_dir or os.getenv("EMBEDDING_CACHE_DIR")
+        if cache_dir:
+            subdir = embedding_cache_subdir(model_name, normalize_embeddings, self.backend, self.dtype)
+            self.cache = open_embedding_cache(
+                os.path.join(cache_dir, subdir),
+                dimension=self.get_dimension(),
+                max_entries=cache_max_entries
+            )
+            print(f"Embedding cache: {self.cache.cache_dir}")
         
     def encode(
         self,
         texts: Union[str, List[str]],
         batch_size: int = 32,
-        show_progress_bar: bool = True
-    ) -> Union[List[float], List[List[float]]]:
+        show_progress_bar: bool = True,
+        output: str = "list",
+        output_dtype: str = "float32"
+    ) -> Union[List[float], List[List[float]], np.ndarray]:
         """
         将文本编码为向量
         
         Args:
             texts: 单个文本或文本列表
-            batch_size: 批处理大小
+            batch_size: 批处理大小（token_budget 模式下不使用）
             show_progress_bar: 是否显示进度条
+            output: 返回格式，"list"（Python 列表）或 "numpy"（连续的 ndarray）
+            output_dtype: output="numpy" 时的数组精度，"float32" 或 "float16"
             
         Returns:
-            单个向量或向量列表
+            输入为单个文本时返回单个向量（一维），输入为列表时返回向量列表（二维），
+            即使列表中只有一个元素
         """
-        if isinstance(texts, str):
+        if output not in ("list", "numpy"):
+            raise ValueError(f"不支持的输出格式: {output}，可选: list, numpy")
+        
+        single = isinstance(texts, str)
+        if single:
             texts = [texts]
-            
-        embeddings = self.model.encode(
+        
+        with get_tracer().span("embed", num_texts=len(texts)):
+            if not texts:
+                embeddings = np.empty((0, self.get_dimension()), dtype=np.float32)
+            elif self.cache is None:
+                embeddings = self._encode_batch(texts, batch_size, show_progress_bar)
+            else:
+                embeddings = self._encode_cached(texts, batch_size, show_progress_bar)
+        
+        if output == "numpy":
+            embeddings = np.ascontiguousarray(embeddings, dtype=output_dtype)
+            return embeddings[0] if single else embeddings
+        
+        if single:
+            return embeddings[0].tolist()
+        return embeddings.tolist()
+    
+    def _encode_batch(
+        self,
+        texts: List[str],
+        batch_size: int,
+        show_progress_bar: bool
+    ) -> np.ndarray:
+        """直接调用模型编码"""
+        if self.batching == "token_budget" and len(texts) > 1:
+            return self._encode_token_budget(texts, show_progress_bar)
+        return self.model.encode(
             texts,
             batch_size=batch_size,
             show_progress_bar=show_progress_bar,
             normalize_embeddings=self.normalize_embeddings
         )
+    
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """
+        每个文本的 token 数（含特殊 token，按模型最大长度截断）
         
-        if len(embeddings) == 1:
-            return embeddings[0].tolist()
-        return embeddings.tolist()
+        模型没有 tokenizer 时按字符数估计（bge / m3e 的中文基本是一字一 token）。
+        """
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            lengths = np.fromiter((len(text) + 2 for text in texts), dtype=np.int64, count=len(texts))
+        else:
+            input_ids = tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+            lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(texts))
+        return np.minimum(lengths, max_length)
+    
+    def _encode_token_budget(self, texts: List[str], show_progress_bar: bool) -> np.ndarray:
+        """按 token 长度排序分批编码（长度相近的文本同批，padding 最少），再恢复原顺序"""
+        batches = token_budget_batches(self.token_lengths(texts), self.max_tokens_per_batch)
+        if show_progress_bar:
+            from tqdm import tqdm
+            batches = tqdm(batches, desc="Batches")
+        
+        embeddings = None
+        for indices in batches:
+            batch_embeddings = self.model.encode(
+                [texts[i] for i in indices],
+                batch_size=len(indices),
+                show_progress_bar=False,
+                normalize_embeddings=self.normalize_embeddings
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            embeddings[indices] = batch_embeddings
+        return embeddings
+    
+    def _encode_cached(
+        self,
+        texts: List[str],
+        batch_size: int,
+        show_progress_bar: bool
+    ) -> np.ndarray:
+        """先查缓存，只对未命中的文本（去重后）调用模型"""
+        keys = [
+            EmbeddingCache.make_key(self.model_name, self.normalize_embeddings, text)
+            for text in texts
+        ]
+        vectors = self.cache.get_many(keys)
+        
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+        tracer = get_tracer()
+        tracer.increment("embed.cache_hit", len(texts) - len(missing))
+        tracer.increment("embed.cache_miss", len(missing))
+        
+        if missing:
+            missing_keys = list(missing.keys())
+            new_vectors = self._encode_batch(
+                list(missing.values()),
+                batch_size,
+                show_progress_bar
+            )
+            self.cache.put_many(missing_keys, new_vectors)
+            by_key = dict(zip(missing_keys, new_vectors))
+            vectors = [v if v is not None else by_key[k] for k, v in zip(keys, vectors)]
+        
+        return np.stack(vectors).astype(np.float32, copy=False)
+    
+    def cache_stats(self) -> Optional[dict]:
+        """返回嵌入缓存命中统计，未启用缓存时返回 None"""
+        if self.cache is None:
+            return None
+        return self.cache.stats()
     
     def get_dimension(self) -> int:
         """获取向量维度"""
         return self.model.get_sentence_embedding_dimension()
+    
+    def close(self, unload: bool = False):
+        """
+        释放对共享模型的引用
+        
+        Args:
+            unload: 没有其他引用时是否立即卸载模型
+        """
+        if self._released:
+            return
+        self._released = True
+        get_model_registry().release(
+            self._kind,
+            self.model_name,
+            device=self.device,
+            dtype=self.dtype,
+            unload=unload
+        )
 
 
 if __name__ == "__main__":
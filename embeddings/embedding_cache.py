@@ -0,0 +1,295 @@
+"""
+Persistent content-addressed embedding cache.
+按 (模型名, 是否归一化, 文本哈希) 缓存向量：
+内存 LRU 作为前端，磁盘上使用 memmap 存储向量矩阵，超出容量时按 LRU 淘汰。
+"""
+
+import atexit
+import hashlib
+import heapq
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """嵌入向量缓存：内存 LRU + 磁盘 memmap"""
+
+    VECTORS_FILE = "vectors.bin"
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        cache_dir: str,
+        dimension: int,
+        max_entries: int = 200_000,
+        memory_entries: int = 10_000,
+        dtype: str = "float32",
+        flush_every: int = 10_000
+    ):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录（每个模型/归一化配置应使用独立目录）
+            dimension: 向量维度
+            max_entries: 磁盘上最多保存的向量数量，超出后按 LRU 淘汰
+            memory_entries: 内存 LRU 前端保存的向量数量
+            dtype: 磁盘存储精度，"float32" 或 "float16"
+            flush_every: 累计写入多少条新向量后自动 flush（批量入库时不只在退出时落盘）
+        """
+        self.cache_dir = cache_dir
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.dtype = np.dtype(dtype)
+        self.flush_every = flush_every
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # key -> [slot, last_used]
+        self._index: Dict[str, List[int]] = {}
+        self._free_slots: List[int] = []
+        # 被淘汰但磁盘上的 index.json 仍指向的槽位：flush 写出不含旧键的索引后才能复用，
+        # 否则进程在 flush 前退出时，重新加载的索引会把旧键映射到已被覆盖的向量
+        self._pending_slots: List[int] = []
+        self._unflushed = 0
+        self._clock = 0
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._dirty = False
+        self._lock = threading.RLock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(model_name: str, normalize: bool, text: str) -> str:
+        """生成缓存键"""
+        raw = f"{model_name}\x00{int(bool(normalize))}\x00{text}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.cache_dir, self.VECTORS_FILE)
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, self.INDEX_FILE)
+
+    def _load(self):
+        """从磁盘加载索引和向量文件"""
+        if os.path.exists(self._index_path) and os.path.exists(self._vectors_path):
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if (
+                meta.get("dimension") == self.dimension
+                and meta.get("dtype") == self.dtype.name
+            ):
+                self._index = meta["entries"]
+                self._clock = meta.get("clock", 0)
+                self._capacity = meta["capacity"]
+                used = {slot for slot, _ in self._index.values()}
+                self._free_slots = [s for s in range(self._capacity) if s not in used]
+                self._open_vectors()
+                return
+            print(f"Embedding cache at {self.cache_dir} has incompatible layout, resetting")
+
+        self._index = {}
+        self._clock = 0
+        self._resize(min(1024, self.max_entries))
+
+    def _open_vectors(self):
+        self._vectors = np.memmap(
+            self._vectors_path,
+            dtype=self.dtype,
+            mode="r+",
+            shape=(self._capacity, self.dimension)
+        )
+
+    def _resize(self, capacity: int):
+        """扩容磁盘向量文件"""
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        nbytes = capacity * self.dimension * self.dtype.itemsize
+        mode = "r+b" if os.path.exists(self._vectors_path) else "w+b"
+        with open(self._vectors_path, mode) as f:
+            f.truncate(nbytes)
+        self._free_slots.extend(range(self._capacity, capacity))
+        self._capacity = capacity
+        self._open_vectors()
+
+    def _allocate_slots(self, count: int) -> List[int]:
+        """分配 count 个空闲槽位，必要时扩容或淘汰最久未使用的条目"""
+        if len(self._free_slots) < count and self._capacity < self.max_entries:
+            target = self._capacity
+            while target - self._capacity + len(self._free_slots) < count and target < self.max_entries:
+                target = min(self.max_entries, max(target * 2, 1))
+            self._resize(target)
+
+        shortfall = count - len(self._free_slots)
+        if shortfall > 0:
+            # 一次多淘汰一些（容量的 1/16），摊薄每次淘汰后写索引的开销
+            victims = heapq.nsmallest(
+                max(shortfall, self.max_entries // 16), self._index.items(), key=lambda item: item[1][1]
+            )
+            for key, (slot, _) in victims:
+                del self._index[key]
+                self._memory.pop(key, None)
+                self._pending_slots.append(slot)
+            self._dirty = True
+            self.flush()
+
+        slots = self._free_slots[:count]
+        del self._free_slots[:count]
+        return slots
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量查询缓存
+
+        Returns:
+            与 keys 顺序一致的列表，未命中的位置为 None
+        """
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    results.append(vector)
+                    continue
+
+                entry = self._index.get(key)
+                if entry is not None:
+                    self._clock += 1
+                    entry[1] = self._clock
+                    vector = np.array(self._vectors[entry[0]], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    self._dirty = True
+                    results.append(vector)
+                    continue
+
+                self.misses += 1
+                results.append(None)
+        return results
+
+    def put_many(self, keys: Sequence[str], vectors: np.ndarray):
+        """批量写入缓存"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.dimension)
+        with self._lock:
+            new_rows = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._index:
+                    new_rows[key] = vector
+                self._remember(key, vector)
+            if not new_rows:
+                return
+
+            # 单次写入超过磁盘容量时只保留最后 max_entries 条
+            items = list(new_rows.items())[-self.max_entries:]
+            slots = self._allocate_slots(len(items))
+            for (key, vector), slot in zip(items, slots):
+                self._clock += 1
+                self._vectors[slot] = vector
+                self._index[key] = [slot, self._clock]
+            self._dirty = True
+            self._unflushed += len(items)
+            if self._unflushed >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        """将向量和索引写回磁盘"""
+        with self._lock:
+            if not self._dirty or self._vectors is None:
+                return
+            self._vectors.flush()
+            meta = {
+                "dimension": self.dimension,
+                "dtype": self.dtype.name,
+                "capacity": self._capacity,
+                "clock": self._clock,
+                "entries": self._index,
+            }
+            tmp_path = self._index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._index_path)
+            self._dirty = False
+            self._unflushed = 0
+            # 磁盘上的索引已不再引用被淘汰的槽位，可以安全复用
+            self._free_slots.extend(self._pending_slots)
+            self._pending_slots = []
+
+    def clear(self):
+        """清空缓存（内存和磁盘）"""
+        with self._lock:
+            self._memory.clear()
+            self._index = {}
+            self._free_slots = []
+            self._pending_slots = list(range(self._capacity))
+            self._clock = 0
+            self._dirty = True
+            self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中统计"""
+        with self._lock:
+            total = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / total if total else 0.0,
+                "entries": len(self._index),
+                "memory_entries": len(self._memory),
+                "capacity": self._capacity,
+                "disk_bytes": self._capacity * self.dimension * self.dtype.itemsize,
+            }
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def open_embedding_cache(
+    cache_dir: str,
+    dimension: int,
+    max_entries: int = 200_000,
+    memory_entries: int = 10_000
+) -> EmbeddingCache:
+    """
+    打开（或复用）指定目录的嵌入缓存
+
+    同一目录在进程内只对应一个 EmbeddingCache 实例，避免多个 EmbeddingModel
+    同时写同一份磁盘文件。
+    """
+    path = os.path.abspath(cache_dir)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = EmbeddingCache(
+                path,
+                dimension=dimension,
+                max_entries=max_entries,
+                memory_entries=memory_entries
+            )
+            _caches[path] = cache
+        return cache
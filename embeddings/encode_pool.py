@@ -0,0 +1,452 @@
+"""
+Multi-process embedding pool for bulk ingestion.
+CPU 上单个 EmbeddingModel 处理小批次时 torch 的算子内并行利用不满所有核心。
+EncodePool 启动多个编码进程，每个进程只加载一次模型，并把 CPU 核心按进程切分
+（每个进程 threads_per_worker 个线程，Linux 上同时绑定 CPU 亲和性）。
+
+输入和输出都通过共享内存传递：主进程把一批文本写成 UTF-8 缓冲区 + 偏移量数组，
+编码进程把向量直接写入共享的 float32 输出缓冲区，管道中只传递很小的控制消息，
+不会逐个向量 pickle。
+
+用法:
+    with EncodePool("BAAI/bge-large-zh", num_workers=8, threads_per_worker=4) as pool:
+        embeddings = pool.encode(texts)
+"""
+
+import multiprocessing as mp
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait as wait_connections
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# 线程数相关的环境变量（需要在编码进程导入 torch / onnxruntime 之前设置）
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "ONNX_INTRA_OP_THREADS")
+
+
+def available_cpus() -> List[int]:
+    """当前进程可用的 CPU 编号"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    连接主进程创建的共享内存（由主进程负责 unlink）
+
+    spawn 出的编码进程与主进程共用同一个 resource_tracker，连接时的重复登记会被合并，
+    这里不能取消登记，否则主进程 unlink 时 tracker 找不到记录。
+    """
+    return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(conn, model_kwargs: Dict[str, Any], threads: int, cpus: Optional[List[int]],
+                 initializer: Optional[Callable], initargs: tuple):
+    """编码进程：加载模型后循环处理主进程发来的批次"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    # 嵌入缓存由主进程在 EncodePool.encode 中查询和写入，编码进程不打开磁盘缓存
+    os.environ.pop("EMBEDDING_CACHE_DIR", None)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    buffers: Dict[str, shared_memory.SharedMemory] = {}
+    try:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        if initializer is not None:
+            initializer(*initargs)
+
+        from embeddings.embed_model import EmbeddingModel
+        embedder = EmbeddingModel(**model_kwargs)
+        dimension = embedder.get_dimension()
+        conn.send(("ready", dimension))
+    except Exception as e:
+        conn.send(("error", None, f"{type(e).__name__}: {e}"))
+        return
+
+    def attach(role: str, name: str) -> shared_memory.SharedMemory:
+        shm = buffers.get(role)
+        if shm is None or shm.name != name:
+            if shm is not None:
+                shm.close()
+            shm = buffers[role] = _attach(name)
+        return shm
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        _, task_id, num_texts, names = message
+        output = None
+        try:
+            text_shm = attach("texts", names[0])
+            offsets = np.ndarray((num_texts + 1,), dtype=np.int64, buffer=attach("offsets", names[1]).buf).tolist()
+            raw = bytes(text_shm.buf[:offsets[num_texts]])
+            texts = [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(num_texts)]
+            embeddings = embedder.encode(texts, show_progress_bar=False, output="numpy")
+            output = np.ndarray((num_texts, dimension), dtype=np.float32, buffer=attach("output", names[2]).buf)
+            output[:] = embeddings
+            conn.send(("done", task_id))
+        except Exception as e:
+            conn.send(("error", task_id, f"{type(e).__name__}: {e}"))
+        finally:
+            # 释放对共享内存的引用，之后才能 close
+            output = None
+
+    for shm in buffers.values():
+        shm.close()
+    embedder.close()
+
+
+class _Worker:
+    """主进程中对单个编码进程的记录：进程、管道和三段共享内存"""
+
+    def __init__(self, process, conn, task_size: int):
+        self.process = process
+        self.conn = conn
+        self.task_size = task_size
+        self.texts: Optional[shared_memory.SharedMemory] = None
+        self.offsets: Optional[shared_memory.SharedMemory] = None
+        self.output: Optional[shared_memory.SharedMemory] = None
+        self.task: Optional[Tuple[int, np.ndarray]] = None
+
+    @staticmethod
+    def _replace(shm: Optional[shared_memory.SharedMemory], size: int) -> shared_memory.SharedMemory:
+        if shm is not None and shm.size >= size:
+            return shm
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    def ensure_capacity(self, num_bytes: int, dimension: int):
+        """按需扩大共享内存（只在编码进程空闲时调用）"""
+        current = self.texts.size if self.texts is not None else 0
+        if num_bytes > current:
+            self.texts = self._replace(self.texts, max(num_bytes, 2 * current, 1 << 20))
+        self.offsets = self._replace(self.offsets, (self.task_size + 1) * 8)
+        self.output = self._replace(self.output, self.task_size * dimension * 4)
+
+    def release(self):
+        for shm in (self.texts, self.offsets, self.output):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.texts = self.offsets = self.output = None
+
+
+class EncodePool:
+    """多进程编码池，encode 接口与 EmbeddingModel.encode 一致"""
+
+    def __init__(
+        self,
+        model_name: str = "BAAI/bge-large-zh",
+        num_workers: Optional[int] = None,
+        threads_per_worker: Optional[int] = None,
+        task_size: Optional[int] = None,
+        normalize_embeddings: bool = True,
+        backend: Optional[str] = None,
+        dtype: Optional[str] = None,
+        batching: Optional[str] = None,
+        max_tokens_per_batch: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        cache_max_entries: int = 200_000,
+        pin_cpus: bool = True,
+        initializer: Optional[Callable] = None,
+        initargs: tuple = ()
+    ):
+        """
+        启动编码进程（每个进程加载一份模型，全部就绪后返回）
+
+        Args:
+            model_name: 嵌入模型名称
+            num_workers: 编码进程数量，None 表示读取 config.yaml 的 embedding.pool.num_workers，
+                         仍为空则为 可用核数 // threads_per_worker
+            threads_per_worker: 每个进程的线程数，None 表示读取 embedding.pool.threads_per_worker（默认 4）
+            task_size: 每次发给一个进程的文本数量，None 表示读取 embedding.pool.task_size（默认 256）
+            normalize_embeddings / backend / dtype / batching / max_tokens_per_batch:
+                传给每个进程中的 EmbeddingModel（device 固定为 cpu）
+            cache_dir / cache_max_entries: 嵌入缓存，同 EmbeddingModel（None 表示读取 EMBEDDING_CACHE_DIR）；
+                由主进程查询和写入，与同配置的 EmbeddingModel 共用同一份缓存
+            pin_cpus: 是否把每个进程绑定到互不重叠的 CPU 核心（仅 Linux）
+            initializer: 编码进程加载模型前调用的函数（需要可 pickle，例如模块级函数）
+            initargs: initializer 的参数
+        """
+        from embeddings.model_registry import load_model_config
+
+        pool_config = load_model_config("embedding").get("pool", {}) or {}
+        cpus = available_cpus()
+        self.threads_per_worker = max(1, threads_per_worker or pool_config.get("threads_per_worker") or 4)
+        self.threads_per_worker = min(self.threads_per_worker, len(cpus))
+        self.num_workers = max(
+            1, num_workers or pool_config.get("num_workers") or len(cpus) // self.threads_per_worker
+        )
+        self.task_size = task_size or pool_config.get("task_size") or 256
+        self.model_name = model_name
+        self.dimension = None
+        self._closed = False
+
+        model_kwargs = {
+            "model_name": model_name,
+            "device": "cpu",
+            "normalize_embeddings": normalize_embeddings,
+            "dtype": dtype,
+            "backend": backend,
+            "batching": batching,
+            "max_tokens_per_batch": max_tokens_per_batch,
+        }
+        resolved_backend = backend or load_model_config("embedding").get("backend") or "torch"
+        onnx_dtype = dtype or load_model_config("onnx").get("dtype") or "int8"
+        if resolved_backend == "onnx":
+            # 在主进程中先完成导出，避免所有编码进程同时导出同一个模型
+            from embeddings.onnx_backend import ensure_exported
+            ensure_exported("embedding", model_name, onnx_dtype)
+        context = mp.get_context("spawn")
+        self._workers: List[_Worker] = []
+        print(f"Starting encode pool: {self.num_workers} workers × {self.threads_per_worker} threads ({model_name})")
+        start = time.perf_counter()
+        for i in range(self.num_workers):
+            worker_cpus = None
+            if pin_cpus and len(cpus) >= self.num_workers * self.threads_per_worker:
+                worker_cpus = cpus[i * self.threads_per_worker:(i + 1) * self.threads_per_worker]
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker_main,
+                args=(child_conn, model_kwargs, self.threads_per_worker, worker_cpus, initializer, initargs),
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append(_Worker(process, parent_conn, self.task_size))
+
+        try:
+            for worker in self._workers:
+                message = self._receive(worker)
+                if message[0] != "ready":
+                    raise RuntimeError(f"编码进程启动失败: {message[2]}")
+                self.dimension = message[1]
+        except Exception:
+            self.close()
+            raise
+        print(f"Encode pool ready in {time.perf_counter() - start:.1f}s (dimension={self.dimension})")
+
+        self.normalize_embeddings = normalize_embeddings
+        self.cache = None
+        cache_dir = cache_dir or os.getenv("EMBEDDING_CACHE_DIR")
+        if cache_dir:
+            from embeddings.embed_model import embedding_cache_subdir
+            from embeddings.embedding_cache import open_embedding_cache
+            subdir = embedding_cache_subdir(model_name, normalize_embeddings, resolved_backend, onnx_dtype)
+            self.cache = open_embedding_cache(
+                os.path.join(cache_dir, subdir),
+                dimension=self.dimension,
+                max_entries=cache_max_entries
+            )
+            print(f"Embedding cache: {self.cache.cache_dir}")
+
+    @staticmethod
+    def _receive(worker: _Worker):
+        try:
+            return worker.conn.recv()
+        except EOFError:
+            raise RuntimeError(f"编码进程意外退出 (exitcode={worker.process.exitcode})")
+
+    def get_dimension(self) -> int:
+        """获取向量维度"""
+        return self.dimension
+    
+    @property
+    def preferred_batch_size(self) -> int:
+        """一次 encode 调用让所有进程都领到一个完整任务所需的文本数量"""
+        return self.task_size * self.num_workers
+
+    def _submit(self, worker: _Worker, task_id: int, texts: List[str], indices: np.ndarray):
+        """把一批文本写入该进程的共享内存并通知其编码"""
+        encoded = [texts[i].encode("utf-8") for i in indices]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        worker.ensure_capacity(int(offsets[-1]), self.dimension)
+        worker.texts.buf[:offsets[-1]] = b"".join(encoded)
+        np.ndarray(offsets.shape, dtype=np.int64, buffer=worker.offsets.buf)[:] = offsets
+        worker.task = (task_id, indices)
+        worker.conn.send((
+            "encode", task_id, len(encoded),
+            (worker.texts.name, worker.offsets.name, worker.output.name)
+        ))
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        output: str = "numpy",
+        output_dtype: str = "float32"
+    ) -> Union[List[float], List[List[float]], np.ndarray]:
+        """
+        将文本编码为向量（参数和返回值同 EmbeddingModel.encode，batch_size 不使用）
+
+        文本先按长度排序后切分为任务（同一任务内长度相近，padding 少；每个任务最多 task_size 条，
+        文本较少时平均分给所有进程），各进程空闲时领取下一个任务，结果按原顺序返回。
+        启用嵌入缓存时先查缓存，只把未命中的文本（去重后）分发给编码进程。
+        """
+        if self._closed:
+            raise RuntimeError("EncodePool 已关闭")
+        if output not in ("list", "numpy"):
+            raise ValueError(f"不支持的输出格式: {output}，可选: list, numpy")
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        if self.cache is not None and texts:
+            embeddings = self._encode_cached(texts, show_progress_bar)
+        else:
+            embeddings = self._dispatch(texts, show_progress_bar)
+
+        if output == "numpy":
+            embeddings = embeddings.astype(output_dtype, copy=False)
+            return embeddings[0] if single else embeddings
+        if single:
+            return embeddings[0].tolist()
+        return embeddings.tolist()
+
+    def _encode_cached(self, texts: List[str], show_progress_bar: bool) -> np.ndarray:
+        """先查缓存，只对未命中的文本（去重后）分发编码，与 EmbeddingModel._encode_cached 一致"""
+        from embeddings.embedding_cache import EmbeddingCache
+        from observability.tracing import get_tracer
+
+        keys = [EmbeddingCache.make_key(self.model_name, self.normalize_embeddings, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+        tracer = get_tracer()
+        tracer.increment("embed.cache_hit", len(texts) - len(missing))
+        tracer.increment("embed.cache_miss", len(missing))
+
+        if missing:
+            missing_keys = list(missing.keys())
+            new_vectors = self._dispatch(list(missing.values()), show_progress_bar)
+            self.cache.put_many(missing_keys, new_vectors)
+            by_key = dict(zip(missing_keys, new_vectors))
+            vectors = [v if v is not None else by_key[k] for k, v in zip(keys, vectors)]
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    def _dispatch(self, texts: List[str], show_progress_bar: bool) -> np.ndarray:
+        """把文本切分为任务分发给编码进程，返回 float32 向量矩阵（原顺序）"""
+        from observability.tracing import get_tracer
+
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        size = max(1, min(self.task_size, -(-len(texts) // self.num_workers)))
+        tasks = [order[start:start + size] for start in range(0, len(texts), size)]
+        if show_progress_bar:
+            from tqdm import tqdm
+            progress = tqdm(total=len(texts), desc="Encoding")
+
+        with get_tracer().span("embed", num_texts=len(texts), workers=self.num_workers):
+            next_task = 0
+            idle = list(self._workers)
+            busy: Dict[Any, _Worker] = {}
+            try:
+                while next_task < len(tasks) or busy:
+                    while idle and next_task < len(tasks):
+                        worker = idle.pop()
+                        self._submit(worker, next_task, texts, tasks[next_task])
+                        busy[worker.conn] = worker
+                        next_task += 1
+                    for conn in wait_connections(list(busy)):
+                        worker = busy.pop(conn)
+                        message = self._receive(worker)
+                        task_id, indices = worker.task
+                        worker.task = None
+                        if message[0] != "done":
+                            raise RuntimeError(f"编码进程出错（任务 {task_id}）: {message[2]}")
+                        embeddings[indices] = np.ndarray(
+                            (len(indices), self.dimension), dtype=np.float32, buffer=worker.output.buf
+                        )
+                        idle.append(worker)
+                        if show_progress_bar:
+                            progress.update(len(indices))
+            finally:
+                # 出错时等待其余在途任务结束，保证共享内存不再被写入
+                for worker in busy.values():
+                    try:
+                        self._receive(worker)
+                    except RuntimeError:
+                        pass
+                    worker.task = None
+                if show_progress_bar:
+                    progress.close()
+        return embeddings
+
+    def close(self):
+        """通知编码进程退出，并释放共享内存"""
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+            worker.release()
+        print("Encode pool closed")
+
+    def __enter__(self) -> "EncodePool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+    # 示例：对比单进程 EmbeddingModel 与 EncodePool 的编码吞吐
+    import argparse
+
+    parser = argparse.ArgumentParser(description="EncodePool 示例")
+    parser.add_argument("--model", default="BAAI/bge-large-zh")
+    parser.add_argument("--num-texts", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    sample = [
+        "人工智能是计算机科学的一个分支，致力于创建能够执行通常需要人类智能的任务的系统。",
+        "机器学习是人工智能的一个子领域，通过算法让计算机从数据中学习。",
+        "向量数据库使用近似最近邻索引在海量向量中快速找到相似向量。",
+    ]
+    texts = [f"{sample[i % len(sample)]}（第 {i} 条）" for i in range(args.num_texts)]
+
+    with EncodePool(args.model, num_workers=args.workers, threads_per_worker=args.threads) as pool:
+        start = time.perf_counter()
+        vectors = pool.encode(texts)
+        elapsed = time.perf_counter() - start
+        print(f"\n{len(texts)} 个文本，{elapsed:.2f}s，{len(texts) / elapsed:.1f} texts/s，形状 {vectors.shape}")
@@ -0,0 +1,254 @@
+"""
+Process-wide model registry.
+在同一进程内共享已加载的模型（SentenceTransformer、CrossEncoder 等），
+避免 BasicRAG、RAGFusion、Ragas 评测各自重复加载 bge-large-zh。
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+
+
+# 注册表键：(模型类型, 模型名称, 设备, 精度)
+RegistryKey = Tuple[str, str, str, str]
+
+# 推理后端："torch"（sentence-transformers）或 "onnx"（onnxruntime CPU 推理）
+INFERENCE_BACKENDS = ("torch", "onnx")
+
+
+def resolve_device(device: Optional[str] = None) -> str:
+    """解析设备，None 表示自动选择"""
+    return device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def registry_kind(kind: str, backend: str = "torch") -> str:
+    """模型类型 + 推理后端 -> 注册表中的类型名（onnx 后端为 "onnx_<kind>"）"""
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}，可选: {', '.join(INFERENCE_BACKENDS)}")
+    return kind if backend == "torch" else f"{backend}_{kind}"
+
+
+def load_model_config(section: str) -> Dict[str, Any]:
+    """读取 config.yaml 中的模型配置段（embedding / reranker），读取失败时返回空字典"""
+    try:
+        from retrieval.config import load_config
+        return load_config().get(section, {}) or {}
+    except Exception:
+        return {}
+
+
+def _load_sentence_transformer(model_name: str, device: str, dtype: str) -> Any:
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device=device)
+    if dtype == "float16":
+        model = model.half()
+    return model
+
+
+def _load_cross_encoder(model_name: str, device: str, dtype: str) -> Any:
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name, device=device)
+    if dtype == "float16":
+        model.model.half()
+    return model
+
+
+def _load_onnx_embedding(model_name: str, device: str, dtype: str) -> Any:
+    from embeddings.onnx_backend import load_onnx_model
+
+    return load_onnx_model("embedding", model_name, dtype)
+
+
+def _load_onnx_reranker(model_name: str, device: str, dtype: str) -> Any:
+    from embeddings.onnx_backend import load_onnx_model
+
+    return load_onnx_model("reranker", model_name, dtype)
+
+
+class _Entry:
+    """注册表中的单个模型条目"""
+
+    def __init__(self, model: Any, load_seconds: float):
+        self.model = model
+        self.refcount = 0
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+
+class ModelRegistry:
+    """
+    模型注册表：按 (类型, 模型名, 设备, 精度) 缓存模型实例
+
+    生命周期：
+        warmup  -> 预加载模型（不增加引用计数）
+        acquire -> 获取模型并增加引用计数（未加载时自动加载）
+        release -> 减少引用计数
+        unload  -> 卸载引用计数为 0 的模型（force=True 时强制卸载）
+    """
+
+    def __init__(self):
+        self._entries: Dict[RegistryKey, _Entry] = {}
+        self._loaders: Dict[str, Callable[[str, str, str], Any]] = {
+            "embedding": _load_sentence_transformer,
+            "reranker": _load_cross_encoder,
+            "onnx_embedding": _load_onnx_embedding,
+            "onnx_reranker": _load_onnx_reranker,
+        }
+        self._lock = threading.RLock()
+
+    def register_loader(self, kind: str, loader: Callable[[str, str, str], Any]):
+        """
+        注册模型加载函数
+
+        Args:
+            kind: 模型类型，例如 "embedding"、"reranker"
+            loader: 加载函数，签名为 loader(model_name, device, dtype)
+        """
+        with self._lock:
+            self._loaders[kind] = loader
+
+    def _make_key(
+        self,
+        kind: str,
+        model_name: str,
+        device: Optional[str],
+        dtype: Optional[str]
+    ) -> RegistryKey:
+        return (kind, model_name, resolve_device(device), dtype or "float32")
+
+    def _get_or_load(self, key: RegistryKey) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+
+        kind, model_name, device, dtype = key
+        if kind not in self._loaders:
+            raise ValueError(
+                f"未注册的模型类型: {kind}。"
+                f"已注册: {', '.join(self._loaders.keys())}"
+            )
+
+        print(f"Loading {kind} model: {model_name} ({device}, {dtype})")
+        start = time.perf_counter()
+        model = self._loaders[kind](model_name, device, dtype)
+        entry = _Entry(model, time.perf_counter() - start)
+        self._entries[key] = entry
+        return entry
+
+    def warmup(
+        self,
+        kind: str,
+        model_name: str,
+        device: Optional[str] = None,
+        dtype: Optional[str] = None
+    ) -> Any:
+        """预加载模型，不增加引用计数"""
+        key = self._make_key(kind, model_name, device, dtype)
+        with self._lock:
+            return self._get_or_load(key).model
+
+    def acquire(
+        self,
+        kind: str,
+        model_name: str,
+        device: Optional[str] = None,
+        dtype: Optional[str] = None
+    ) -> Any:
+        """
+        获取共享模型实例，引用计数 +1
+
+        Returns:
+            模型实例
+        """
+        key = self._make_key(kind, model_name, device, dtype)
+        with self._lock:
+            entry = self._get_or_load(key)
+            entry.refcount += 1
+            if entry.refcount > 1:
+                print(f"Reusing {kind} model: {model_name} (refs={entry.refcount})")
+            return entry.model
+
+    def release(
+        self,
+        kind: str,
+        model_name: str,
+        device: Optional[str] = None,
+        dtype: Optional[str] = None,
+        unload: bool = False
+    ):
+        """
+        释放模型引用，引用计数 -1
+
+        Args:
+            unload: 引用计数降为 0 时是否立即卸载
+        """
+        key = self._make_key(kind, model_name, device, dtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refcount = max(0, entry.refcount - 1)
+            if unload and entry.refcount == 0:
+                self._drop(key)
+
+    def unload(
+        self,
+        kind: Optional[str] = None,
+        model_name: Optional[str] = None,
+        force: bool = False
+    ) -> int:
+        """
+        卸载模型
+
+        Args:
+            kind: 只卸载该类型的模型，None 表示全部类型
+            model_name: 只卸载该名称的模型，None 表示全部模型
+            force: 是否卸载仍被引用的模型
+
+        Returns:
+            卸载的模型数量
+        """
+        with self._lock:
+            keys = [
+                key for key, entry in self._entries.items()
+                if (kind is None or key[0] == kind)
+                and (model_name is None or key[1] == model_name)
+                and (force or entry.refcount == 0)
+            ]
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def _drop(self, key: RegistryKey):
+        entry = self._entries.pop(key)
+        del entry.model
+        if key[2].startswith("cuda") and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"Unloaded {key[0]} model: {key[1]} ({key[2]}, {key[3]})")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """返回已加载模型的统计信息"""
+        with self._lock:
+            return [
+                {
+                    "kind": key[0],
+                    "model_name": key[1],
+                    "device": key[2],
+                    "dtype": key[3],
+                    "refcount": entry.refcount,
+                    "load_seconds": entry.load_seconds,
+                }
+                for key, entry in self._entries.items()
+            ]
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    """获取进程级共享的模型注册表"""
+    return _registry
@@ -0,0 +1,419 @@
+"""
+ONNX Runtime inference backend.
+把 SentenceTransformer / CrossEncoder 导出为 ONNX 图（可选动态 int8 量化），
+用 onnxruntime 在 CPU 上推理，接口与原模型一致（encode / predict），
+EmbeddingModel 和 Reranker 通过 backend="onnx" 使用。
+
+导出结果缓存在 onnx.cache_dir（默认 data/onnx_models）下，首次加载时自动导出：
+
+    <cache_dir>/<模型名>/<embedding|reranker>/
+        model.onnx         float32 图
+        model.int8.onnx    动态 int8 量化后的图
+        backend.json       池化方式、最大长度、输入名等
+        tokenizer 文件
+
+导出先写到同级的临时目录，完成后整体 os.replace 到位，并用文件锁保证多个进程
+（例如 EncodePool 的编码进程）不会同时导出同一个模型；
+backend.json 最后写入，缺少它的目录视为未完成的导出。
+
+用法（预先导出）:
+    python embeddings/onnx_backend.py --kind embedding --model BAAI/bge-large-zh
+    python embeddings/onnx_backend.py --kind reranker --model BAAI/bge-reranker-base
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内的线程锁
+    fcntl = None
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+ONNX_KINDS = ("embedding", "reranker")
+ONNX_DTYPES = ("int8", "float32")
+DEFAULT_CACHE_DIR = "./data/onnx_models"
+METADATA_FILE = "backend.json"
+
+_export_lock = threading.Lock()
+
+
+def load_onnx_settings() -> Dict[str, Any]:
+    """读取 config.yaml 的 onnx 配置（环境变量 ONNX_INTRA_OP_THREADS 覆盖线程数）"""
+    settings = {}
+    try:
+        from retrieval.config import load_config
+        settings = load_config().get("onnx", {}) or {}
+    except Exception:
+        pass
+    threads = os.getenv("ONNX_INTRA_OP_THREADS")
+    if threads:
+        settings["intra_op_threads"] = int(threads)
+    return settings
+
+
+def default_intra_op_threads() -> int:
+    """默认的算子内线程数：当前进程可用的 CPU 核数"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def model_dir(kind: str, model_name: str, cache_dir: Optional[str] = None) -> str:
+    """导出目录：<cache_dir>/<模型名>/<kind>"""
+    cache_dir = cache_dir or load_onnx_settings().get("cache_dir", DEFAULT_CACHE_DIR)
+    if not os.path.isabs(cache_dir):
+        cache_dir = os.path.join(project_root, cache_dir)
+    return os.path.join(cache_dir, model_name.replace("/", "__"), kind)
+
+
+def model_file(dtype: str) -> str:
+    return "model.int8.onnx" if dtype == "int8" else "model.onnx"
+
+
+def is_exported(output_dir: str, dtype: str) -> bool:
+    """导出目录是否完整（模型文件和最后写入的 backend.json 都存在）"""
+    return (
+        os.path.exists(os.path.join(output_dir, model_file(dtype)))
+        and os.path.exists(os.path.join(output_dir, METADATA_FILE))
+    )
+
+
+@contextmanager
+def _export_file_lock(output_dir: str):
+    """跨进程的导出锁（<output_dir>.lock 上的 flock），同一进程内的线程由 _export_lock 互斥"""
+    with _export_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(output_dir), exist_ok=True)
+        with open(output_dir + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _pooling_mode(sentence_transformer) -> str:
+    """读取 SentenceTransformer 的池化方式（cls / mean）"""
+    for module in sentence_transformer:
+        if hasattr(module, "get_pooling_mode_str"):
+            mode = module.get_pooling_mode_str()
+            if mode not in ("cls", "mean"):
+                raise ValueError(f"ONNX 后端不支持的池化方式: {mode}")
+            return mode
+    return "cls"
+
+
+def export_onnx(
+    kind: str,
+    model_name: str,
+    output_dir: Optional[str] = None,
+    quantize: bool = True,
+    opset: int = 17
+) -> str:
+    """
+    导出 ONNX 模型（以及动态 int8 量化版本）
+
+    Args:
+        kind: "embedding"（SentenceTransformer）或 "reranker"（CrossEncoder）
+        model_name: HuggingFace 模型名称
+        output_dir: 输出目录，None 表示 model_dir(kind, model_name)
+        quantize: 是否同时生成 int8 动态量化模型
+        opset: ONNX opset 版本
+
+    Returns:
+        输出目录
+    """
+    if kind not in ONNX_KINDS:
+        raise ValueError(f"不支持的模型类型: {kind}，可选: {', '.join(ONNX_KINDS)}")
+    output_dir = os.path.abspath(output_dir or model_dir(kind, model_name))
+    with _export_file_lock(output_dir):
+        _export_atomic(kind, model_name, output_dir, quantize, opset)
+    return output_dir
+
+
+def _export_atomic(kind: str, model_name: str, output_dir: str, quantize: bool = True, opset: int = 17):
+    """在临时目录中导出，完成后整体替换 output_dir（调用方需持有导出锁）"""
+    print(f"Exporting {kind} model to ONNX: {model_name} -> {output_dir}")
+    # 清理之前中断的导出留下的临时目录
+    for stale_dir in glob.glob(glob.escape(output_dir) + ".tmp-*") + glob.glob(glob.escape(output_dir) + ".old-*"):
+        shutil.rmtree(stale_dir, ignore_errors=True)
+    tmp_dir = f"{output_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir)
+    try:
+        _export_to(kind, model_name, tmp_dir, quantize, opset)
+        if os.path.exists(output_dir):
+            old_dir = f"{output_dir}.old-{os.getpid()}"
+            os.replace(output_dir, old_dir)
+            os.replace(tmp_dir, output_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, output_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"Exported {kind} model: {output_dir}")
+
+
+def _export_to(kind: str, model_name: str, output_dir: str, quantize: bool, opset: int):
+    """export_onnx 的实现：把图、tokenizer 和 backend.json 写入 output_dir（backend.json 最后写入）"""
+    import torch
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    metadata = {"kind": kind, "model_name": model_name}
+    if kind == "embedding":
+        from sentence_transformers import SentenceTransformer
+        sentence_transformer = SentenceTransformer(model_name, device="cpu")
+        transformer = sentence_transformer[0].auto_model
+        metadata["pooling"] = _pooling_mode(sentence_transformer)
+        metadata["max_seq_length"] = sentence_transformer.max_seq_length
+        metadata["dimension"] = sentence_transformer.get_sentence_embedding_dimension()
+        sample = tokenizer(["导出示例文本"], return_tensors="pt")
+        output_name = "last_hidden_state"
+    else:
+        from transformers import AutoModelForSequenceClassification
+        transformer = AutoModelForSequenceClassification.from_pretrained(model_name)
+        metadata["max_seq_length"] = min(tokenizer.model_max_length, 512)
+        metadata["num_labels"] = transformer.config.num_labels
+        # CrossEncoder 对单输出模型默认使用 sigmoid
+        metadata["activation"] = "sigmoid" if transformer.config.num_labels == 1 else "identity"
+        sample = tokenizer(["导出示例问题"], ["导出示例文档"], return_tensors="pt")
+        output_name = "logits"
+    transformer.eval()
+
+    input_names = list(sample.keys())
+    metadata["input_names"] = input_names
+
+    class _Wrapper(torch.nn.Module):
+        """只输出第一个张量（last_hidden_state 或 logits）"""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch", 1: "sequence"} if kind == "embedding" else {0: "batch"}
+    fp32_path = os.path.join(output_dir, model_file("float32"))
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(transformer),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(output_dir, model_file("int8")), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, METADATA_FILE), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+
+def ensure_exported(kind: str, model_name: str, dtype: str = "int8") -> str:
+    """返回导出目录，所需的 ONNX 文件不存在时先导出"""
+    if dtype not in ONNX_DTYPES:
+        raise ValueError(f"ONNX 后端不支持的精度: {dtype}，可选: {', '.join(ONNX_DTYPES)}")
+    output_dir = model_dir(kind, model_name)
+    if is_exported(output_dir, dtype):
+        return output_dir
+    with _export_file_lock(output_dir):
+        # 拿到锁后再检查一次：其他进程可能已经导出完成
+        if not is_exported(output_dir, dtype):
+            _export_atomic(kind, model_name, output_dir, quantize=dtype == "int8")
+    return output_dir
+
+
+def create_session(
+    model_path: str,
+    intra_op_threads: Optional[int] = None,
+    inter_op_threads: int = 1
+):
+    """
+    创建 CPU 推理会话
+
+    Args:
+        model_path: .onnx 文件路径
+        intra_op_threads: 单个算子内的并行线程数，None 表示可用核数
+        inter_op_threads: 算子间并行线程数（顺序执行模式下只用 1）
+
+    Returns:
+        onnxruntime.InferenceSession
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = intra_op_threads or default_intra_op_threads()
+    options.inter_op_num_threads = inter_op_threads
+    return ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class _OnnxModel:
+    """ONNX 模型的公共部分：读取元数据、tokenizer 和推理会话"""
+
+    def __init__(
+        self,
+        directory: str,
+        dtype: str = "int8",
+        intra_op_threads: Optional[int] = None,
+        inter_op_threads: int = 1,
+        max_seq_length: Optional[int] = None
+    ):
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(directory, METADATA_FILE), "r", encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        self.input_names = self.metadata["input_names"]
+        self.max_seq_length = max_seq_length or self.metadata["max_seq_length"]
+        self.session = create_session(
+            os.path.join(directory, model_file(dtype)),
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads
+        )
+
+    def _run(self, encoded) -> np.ndarray:
+        feed = {name: np.asarray(encoded[name], dtype=np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+class OnnxSentenceEncoder(_OnnxModel):
+    """SentenceTransformer 的 ONNX 替代（encode / get_sentence_embedding_dimension）"""
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.metadata["dimension"]
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.metadata["pooling"] == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        编码文本（与 SentenceTransformer 一样先按长度排序再分批，减少 padding）
+
+        Returns:
+            输入为单个文本时返回一维向量，否则返回 (len(texts), dimension) 数组
+        """
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(texts), batch_size):
+            indices = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in indices],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            hidden = self._run(encoded)
+            embeddings[indices] = self._pool(hidden, encoded["attention_mask"])
+        if normalize_embeddings:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+class OnnxCrossEncoder(_OnnxModel):
+    """CrossEncoder 的 ONNX 替代（predict）"""
+
+    def predict(
+        self,
+        pairs: List[List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        对 (query, document) 对打分
+
+        Returns:
+            单输出模型返回 (len(pairs),) 分数（与 CrossEncoder 一样经过 sigmoid），
+            多输出模型返回 (len(pairs), num_labels) logits
+        """
+        num_labels = self.metadata.get("num_labels", 1)
+        scores = np.empty((len(pairs), num_labels), dtype=np.float32)
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            encoded = self.tokenizer(
+                [pair[0] for pair in batch],
+                [pair[1] for pair in batch],
+                padding=True,
+                truncation="longest_first",
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            scores[start:start + len(batch)] = self._run(encoded)
+        if self.metadata.get("activation") == "sigmoid":
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores[:, 0] if num_labels == 1 else scores
+
+
+def load_onnx_model(kind: str, model_name: str, dtype: str = "int8"):
+    """
+    加载（必要时先导出）ONNX 模型，线程数等运行参数读取 config.yaml 的 onnx 配置
+
+    Args:
+        kind: "embedding" 或 "reranker"
+        model_name: HuggingFace 模型名称
+        dtype: "int8"（动态量化）或 "float32"
+
+    Returns:
+        OnnxSentenceEncoder 或 OnnxCrossEncoder
+    """
+    settings = load_onnx_settings()
+    directory = ensure_exported(kind, model_name, dtype)
+    model_class = OnnxSentenceEncoder if kind == "embedding" else OnnxCrossEncoder
+    return model_class(
+        directory,
+        dtype=dtype,
+        intra_op_threads=settings.get("intra_op_threads"),
+        inter_op_threads=settings.get("inter_op_threads", 1),
+        max_seq_length=settings.get("max_seq_length")
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出 ONNX 模型（float32 + 动态 int8 量化）")
+    parser.add_argument("--kind", default="embedding", choices=ONNX_KINDS)
+    parser.add_argument("--model", default="BAAI/bge-large-zh")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--no-quantize", action="store_true", help="只导出 float32 模型")
+    args = parser.parse_args()
+
+    export_onnx(args.kind, args.model, args.output_dir, quantize=not args.no_quantize)
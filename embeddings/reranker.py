@@ -3,9 +3,17 @@ Reranker model wrapper for bge-reranker-base.
 Day 5-7: 重排模型集成
 """
 
-from typing import List, Tuple
-from sentence_transformers import CrossEncoder
-import torch
+import os
+import sys
+from typing import List, Optional, Tuple
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from embeddings.model_registry import get_model_registry, load_model_config, registry_kind, resolve_device
+from observability.tracing import get_tracer
 
 
 class Reranker:
@@ -14,25 +22,43 @@ class Reranker:
     def __init__(
         self,
         model_name: str = "BAAI/bge-reranker-base",
-        device: str = None
+        device: str = None,
+        dtype: Optional[str] = None,
+        backend: Optional[str] = None
     ):
         """
         初始化重排模型
         
         Args:
             model_name: 模型名称
-            device: 设备，"cuda" 或 "cpu"
+            device: 设备，"cuda" 或 "cpu"，None 表示读取 config.yaml 的
+                    reranker.model_kwargs.device，仍为空则自动选择（onnx 后端固定为 cpu）
+            dtype: 模型精度，torch 后端为 "float32" 或 "float16"（默认 float32），
+                   onnx 后端为 "int8"（动态量化）或 "float32"，默认读取 config.yaml 的 onnx.dtype
+            backend: 推理后端，"torch" 或 "onnx"，None 表示读取 config.yaml 的 reranker.backend
         """
+        config = load_model_config("reranker")
+        model_kwargs = config.get("model_kwargs", {}) or {}
         self.model_name = model_name
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.backend = backend or config.get("backend") or "torch"
+        self._kind = registry_kind("reranker", self.backend)
+        if self.backend == "onnx":
+            self.device = "cpu"
+            self.dtype = dtype or load_model_config("onnx").get("dtype") or "int8"
+        else:
+            self.device = resolve_device(device or model_kwargs.get("device"))
+            self.dtype = dtype or model_kwargs.get("dtype") or "float32"
         
-        print(f"Loading reranker model: {model_name}")
-        print(f"Device: {self.device}")
+        print(f"Reranker model: {model_name}")
+        print(f"Device: {self.device} ({self.backend}, {self.dtype})")
         
-        self.model = CrossEncoder(
+        self.model = get_model_registry().acquire(
+            self._kind,
             model_name,
-            device=self.device
+            device=self.device,
+            dtype=self.dtype
         )
+        self._released = False
     
     def rerank(
         self,
@@ -58,9 +84,88 @@ class Reranker:
         pairs = [[query, doc] for doc in documents]
         
         # 计算相关性分数
-        scores = self.model.predict(pairs)
+        scores = self.predict_pairs(pairs)
+        
+        return self.rank_scores(scores, top_k)
+    
+    def predict_pairs(
+        self,
+        pairs: List[List[str]],
+        batch_size: int = 32
+    ) -> List[float]:
+        """
+        对 (query, document) 对计算相关性分数
         
-        # 排序并返回索引和分数
+        Args:
+            pairs: [[query, document], ...]
+            batch_size: 模型前向的批大小
+            
+        Returns:
+            与 pairs 顺序一致的分数列表
+        """
+        if not pairs:
+            return []
+        with get_tracer().span("rerank", pairs=len(pairs)):
+            scores = self.model.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        return [float(score) for score in scores]
+    
+    def predict_packed(
+        self,
+        pairs: List[List[str]],
+        batch_size: int = 64
+    ) -> List[float]:
+        """
+        按文本长度排序后打分（同一前向批次内的 padding 尽量少），再恢复原顺序
+        
+        Args:
+            pairs: [[query, document], ...]
+            batch_size: 模型前向的批大小
+            
+        Returns:
+            与 pairs 顺序一致的分数列表
+        """
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        sorted_scores = self.predict_pairs([pairs[i] for i in order], batch_size=batch_size)
+        scores = [0.0] * len(pairs)
+        for position, pair_idx in enumerate(order):
+            scores[pair_idx] = sorted_scores[position]
+        return scores
+    
+    def rerank_many(
+        self,
+        queries: List[str],
+        documents_list: List[List[str]],
+        top_k: int = None,
+        batch_size: int = 64
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        批量重排：所有查询的 (query, document) 对合并后一次打分
+        
+        Args:
+            queries: 查询列表
+            documents_list: 每个查询对应的文档列表
+            top_k: 每个查询返回前 k 个结果，None 表示返回全部
+            batch_size: 模型前向的批大小
+            
+        Returns:
+            与 queries 顺序一致的 [(index, score), ...] 列表
+        """
+        pairs = []
+        bounds = []
+        for query, documents in zip(queries, documents_list):
+            start = len(pairs)
+            pairs.extend([query, doc] for doc in documents)
+            bounds.append((start, len(pairs)))
+        
+        scores = self.predict_packed(pairs, batch_size=batch_size) if pairs else []
+        return [self.rank_scores(scores[start:end], top_k) for start, end in bounds]
+    
+    @staticmethod
+    def rank_scores(
+        scores: List[float],
+        top_k: int = None
+    ) -> List[Tuple[int, float]]:
+        """将分数转换为按分数降序排列的 (index, score) 列表"""
         results = [(i, float(score)) for i, score in enumerate(scores)]
         results.sort(key=lambda x: x[1], reverse=True)
         
@@ -68,6 +173,24 @@ class Reranker:
             results = results[:top_k]
         
         return results
+    
+    def close(self, unload: bool = False):
+        """
+        释放对共享模型的引用
+        
+        Args:
+            unload: 没有其他引用时是否立即卸载模型
+        """
+        if self._released:
+            return
+        self._released = True
+        get_model_registry().release(
+            self._kind,
+            self.model_name,
+            device=self.device,
+            dtype=self.dtype,
+            unload=unload
+        )
 
 
 if __name__ == "__main__":
@@ -23,12 +23,43 @@ except ImportError:
 # 导入统一的 LLM 客户端
 try:
     from llm.llm_client import get_llm_client
+    from llm.scheduler import create_langchain_rate_limiter, create_ragas_run_config
     LLM_CLIENT_AVAILABLE = True
 except ImportError as e:
     LLM_CLIENT_AVAILABLE = False
     print(f"警告: 无法导入 llm_client ({e})，将使用默认配置")
 
 
+def create_shared_embeddings(model_name: str = "BAAI/bge-large-zh", device: Optional[str] = None):
+    """
+    创建 LangChain Embeddings 适配器，底层复用共享的 EmbeddingModel
+    
+    与 HuggingFaceEmbeddings 不同，这里不会再单独加载一份模型，
+    而是通过模型注册表与 BasicRAG / RAGFusion 共享同一个实例。
+    
+    Args:
+        model_name: 嵌入模型名称
+        device: 设备，None 表示自动选择
+        
+    Returns:
+        langchain_core.embeddings.Embeddings 实例
+    """
+    from langchain_core.embeddings import Embeddings
+    from embeddings.embed_model import EmbeddingModel
+    
+    class _SharedEmbeddings(Embeddings):
+        def __init__(self):
+            self.embedder = EmbeddingModel(model_name=model_name, device=device)
+        
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return self.embedder.encode(texts, show_progress_bar=False)
+        
+        def embed_query(self, text: str) -> List[float]:
+            return self.embedder.encode(text, show_progress_bar=False)
+    
+    return _SharedEmbeddings()
+
+
 class RagasEvaluation:
     """使用 Ragas 进行 RAG 系统评测"""
     
@@ -61,6 +92,7 @@ class RagasEvaluation:
             # 初始化 LLM 客户端
             self.llm = None
             self.embeddings = None
+            self.run_config = None
             
             if LLM_CLIENT_AVAILABLE:
                 try:
@@ -71,13 +103,27 @@ class RagasEvaluation:
                     # 这样可以兼容所有使用 OpenAI 兼容 API 的提供商（豆包、OpenAI、通义千问等）
                     from langchain_openai import ChatOpenAI
                     
+                    # 与 LLMClient 共用同一个提供商调度器：共享 RPM 配额、并发上限、超时和重试设置
+                    scheduler = llm_client.scheduler
+                    llm_kwargs = {}
+                    try:
+                        llm_kwargs["rate_limiter"] = create_langchain_rate_limiter(scheduler)
+                    except ImportError:
+                        pass  # 旧版 langchain-core 没有 rate_limiters
                     langchain_llm = ChatOpenAI(
                         model=llm_client.model_name,
                         openai_api_key=llm_client.api_key,
                         openai_api_base=llm_client.base_url,
                         temperature=llm_client.temperature,
-                        max_tokens=llm_client.max_tokens
+                        max_tokens=llm_client.max_tokens,
+                        timeout=scheduler.timeout,
+                        max_retries=scheduler.max_retries,
+                        **llm_kwargs
                     )
+                    try:
+                        self.run_config = create_ragas_run_config(scheduler)
+                    except ImportError:
+                        self.run_config = None
                     
                     # Ragas 会自动将 Langchain LLM 包装为 BaseRagasLLM
                     self.llm = langchain_llm
@@ -87,19 +133,12 @@ class RagasEvaluation:
                     print("将使用 Ragas 默认配置（需要 OPENAI_API_KEY）")
                     self.llm = None
             
-            # 配置本地 embeddings（使用项目中的 bge-large-zh 模型）
+            # 配置本地 embeddings（复用进程内已加载的 bge-large-zh 模型）
             try:
-                from langchain_huggingface import HuggingFaceEmbeddings
-                
-                # 使用本地 embedding 模型，不需要 API key
-                self.embeddings = HuggingFaceEmbeddings(
-                    model_name="BAAI/bge-large-zh",
-                    model_kwargs={"device": "cpu"},  # 可以根据需要改为 "cuda"
-                    encode_kwargs={"normalize_embeddings": True}
-                )
-                print("✓ 已配置本地 Embeddings: BAAI/bge-large-zh")
+                self.embeddings = create_shared_embeddings(model_name="BAAI/bge-large-zh")
+                print("✓ 已配置本地 Embeddings: BAAI/bge-large-zh（共享模型）")
             except ImportError:
-                print("⚠️  langchain-huggingface 未安装，将使用 Ragas 默认 embeddings（需要 API key）")
+                print("⚠️  langchain-core 未安装，将使用 Ragas 默认 embeddings（需要 API key）")
                 self.embeddings = None
             except Exception as e:
                 print(f"⚠️  Embeddings 初始化失败: {e}")
@@ -165,6 +204,8 @@ class RagasEvaluation:
                 evaluate_kwargs["llm"] = self.llm
             if self.embeddings is not None:
                 evaluate_kwargs["embeddings"] = self.embeddings
+            if self.run_config is not None:
+                evaluate_kwargs["run_config"] = self.run_config
             
             result = self.evaluate(**evaluate_kwargs)
             return result
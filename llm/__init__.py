@@ -4,6 +4,14 @@ LLM module for structured output and generation.
 
 from .structured_output_demo import StructuredOutputDemo
 from .llm_client import LLMClient, get_llm_client
+from .scheduler import LLMScheduler, get_scheduler, DeadlineExceeded
 
-__all__ = ["StructuredOutputDemo", "LLMClient", "get_llm_client"]
+__all__ = [
+    "StructuredOutputDemo",
+    "LLMClient",
+    "get_llm_client",
+    "LLMScheduler",
+    "get_scheduler",
+    "DeadlineExceeded",
+]
 
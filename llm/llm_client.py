@@ -3,8 +3,10 @@
 支持多种模型提供商：OpenAI、豆包、通义千问、文心一言等
 """
 
+import asyncio
 import os
-from typing import List, Dict, Optional, Any
+import sys
+from typing import List, Dict, Optional, Any, AsyncIterator, Iterator
 from dotenv import load_dotenv
 
 # 确保从项目根目录加载 .env 文件
@@ -15,6 +17,14 @@ if os.path.exists(env_path):
 else:
     load_dotenv()  # 回退到默认行为
 
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from llm.scheduler import LLMScheduler, estimate_tokens, get_openai_client, get_scheduler
+
+# 文心一言不接受 temperature=0
+ERNIE_MIN_TEMPERATURE = 0.01
+
 
 class LLMClient:
     """统一的 LLM 客户端，支持多种模型提供商"""
@@ -26,11 +36,16 @@ class LLMClient:
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 1000
+        max_tokens: int = 1000,
+        scheduler: Optional[LLMScheduler] = None,
+        deadline: Optional[float] = None
     ):
         """
         初始化 LLM 客户端
         
+        所有请求经过提供商共享的调度器（见 llm.scheduler）：RPM / TPM 限流、
+        有界并发、超时以及 429 / 5xx 重试。
+        
         Args:
             provider: 提供商名称 (openai, doubao, qwen, ernie, zhipu)
             model_name: 模型名称
@@ -38,16 +53,23 @@ class LLMClient:
             base_url: API 基础 URL（用于自定义端点）
             temperature: 温度参数
             max_tokens: 最大 token 数
+            scheduler: 请求调度器，None 表示使用该提供商的共享调度器
+            deadline: 默认的请求截止时间（秒，包括排队和重试），None 表示不限制
         """
         self.provider = provider.lower()
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.deadline = deadline
         
         # 设置默认模型和配置
         self._setup_provider_config(model_name, api_key, base_url)
         
         # 初始化客户端
+        self.scheduler = scheduler or get_scheduler(self.provider)
         self._init_client()
+        
+        # 异步客户端在首次调用 achat 时创建
+        self._async_client = None
     
     def _setup_provider_config(
         self,
@@ -102,37 +124,13 @@ class LLMClient:
     
     def _init_client(self):
         """初始化客户端"""
-        if self.provider == "openai":
-            from openai import OpenAI
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
-        elif self.provider == "doubao":
-            # 豆包使用 OpenAI 兼容的 API
-            from openai import OpenAI
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
-        elif self.provider == "qwen":
-            # 通义千问使用 OpenAI 兼容的 API
-            from openai import OpenAI
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
-        elif self.provider == "zhipu":
-            # 智谱 GLM 使用 OpenAI 兼容的 API
-            from openai import OpenAI
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
+        if self.provider in ("openai", "doubao", "qwen", "zhipu"):
+            # 豆包、通义千问、智谱 GLM 使用 OpenAI 兼容的 API；
+            # 相同 base_url + api_key 的客户端在进程内共享连接池
+            self.client = get_openai_client(self.api_key, self.base_url)
         elif self.provider == "ernie":
-            # 文心一言需要特殊处理
-            import requests
-            self.client = None  # 文心一言使用 requests
+            # 文心一言需要特殊处理：使用调度器共享的 requests.Session
+            self.client = None
             self._ernie_api_key = self.api_key
         else:
             raise ValueError(f"不支持的提供商: {self.provider}")
@@ -141,7 +139,8 @@ class LLMClient:
         self,
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
     ) -> str:
         """
         发送聊天请求
@@ -150,37 +149,103 @@ class LLMClient:
             messages: 消息列表，格式为 [{"role": "user", "content": "..."}]
             temperature: 温度参数
             max_tokens: 最大 token 数
+            deadline: 请求截止时间（秒），None 使用初始化时的设置
             
         Returns:
             模型返回的文本
         """
-        temperature = temperature or self.temperature
-        max_tokens = max_tokens or self.max_tokens
+        temperature = temperature if temperature is not None else self.temperature
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
         
         if self.provider == "ernie":
-            return self._chat_ernie(messages, temperature, max_tokens)
+            send = lambda timeout: self._chat_ernie(messages, temperature, max_tokens, timeout)
+        else:
+            def send(timeout: float):
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=timeout
+                )
+                return response.choices[0].message.content, self._usage_tokens(response)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
+            return self.scheduler.call(
+                send,
+                estimated_tokens=estimate_tokens(messages, max_tokens),
+                deadline=deadline or self.deadline
             )
-            return response.choices[0].message.content
         except Exception as e:
-            raise Exception(f"LLM API 调用失败: {e}")
+            raise Exception(f"LLM API 调用失败: {e}") from e
     
-    def _chat_ernie(
+    @staticmethod
+    def _usage_tokens(response) -> Optional[int]:
+        """OpenAI 兼容响应中的实际 token 用量"""
+        usage = getattr(response, "usage", None)
+        return getattr(usage, "total_tokens", None)
+    
+    def _get_async_client(self):
+        """获取（懒加载）OpenAI 兼容的异步客户端"""
+        if self._async_client is None:
+            self._async_client = get_openai_client(self.api_key, self.base_url, use_async=True)
+        return self._async_client
+    
+    async def achat(
         self,
         messages: List[Dict[str, str]],
-        temperature: float,
-        max_tokens: int
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
     ) -> str:
-        """文心一言的特殊处理"""
-        import requests
-        import json
+        """
+        发送聊天请求（异步版本）
+        
+        OpenAI 兼容的提供商使用 AsyncOpenAI；文心一言在线程池中执行同步请求。
+        
+        Args:
+            messages: 消息列表，格式为 [{"role": "user", "content": "..."}]
+            temperature: 温度参数
+            max_tokens: 最大 token 数
+            deadline: 请求截止时间（秒），None 使用初始化时的设置
+            
+        Returns:
+            模型返回的文本
+        """
+        temperature = temperature if temperature is not None else self.temperature
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
         
+        if self.provider == "ernie":
+            async def send(timeout: float):
+                return await asyncio.to_thread(self._chat_ernie, messages, temperature, max_tokens, timeout)
+        else:
+            async def send(timeout: float):
+                response = await self._get_async_client().chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=timeout
+                )
+                return response.choices[0].message.content, self._usage_tokens(response)
+        
+        try:
+            return await self.scheduler.acall(
+                send,
+                estimated_tokens=estimate_tokens(messages, max_tokens),
+                deadline=deadline or self.deadline
+            )
+        except Exception as e:
+            raise Exception(f"LLM API 调用失败: {e}") from e
+    
+    def _ernie_request(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        stream: bool = False
+    ) -> Dict[str, Any]:
+        """构建文心一言请求参数（url、headers、params、json）"""
         # 文心一言需要将消息转换为特定格式
         conversation = []
         for msg in messages:
@@ -206,27 +271,150 @@ class LLMClient:
                 "access_token": self._ernie_api_key
             }
         
+        # 文心一言的 temperature 取值范围为 (0, 1]，0（确定性改写）用最小的正值代替
         payload = {
             "messages": conversation,
-            "temperature": temperature,
+            "temperature": min(max(temperature, ERNIE_MIN_TEMPERATURE), 1.0),
             "max_output_tokens": max_tokens
         }
+        if stream:
+            payload["stream"] = True
+        
+        return {"url": url, "headers": headers, "params": params, "json": payload}
+    
+    def _chat_ernie(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        timeout: float
+    ):
+        """
+        文心一言的特殊处理
         
-        response = requests.post(url, headers=headers, params=params, json=payload)
+        Returns:
+            (文本, 实际 token 用量或 None)
+        """
+        response = self.scheduler.session.post(
+            timeout=timeout,
+            **self._ernie_request(messages, temperature, max_tokens)
+        )
         response.raise_for_status()
         result = response.json()
         
         if "result" in result:
-            return result["result"]
+            return result["result"], (result.get("usage") or {}).get("total_tokens")
         else:
             raise Exception(f"文心一言 API 返回错误: {result}")
     
+    def _chat_ernie_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        timeout: float
+    ) -> Iterator[str]:
+        """文心一言流式输出（SSE 模式，每个 data 行包含一段 result）"""
+        import json
+        
+        request = self._ernie_request(messages, temperature, max_tokens, stream=True)
+        with self.scheduler.session.post(stream=True, timeout=timeout, **request) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):].strip())
+                if "error_code" in event:
+                    raise Exception(f"文心一言 API 返回错误: {event}")
+                if event.get("result"):
+                    yield event["result"]
+                if event.get("is_end"):
+                    break
+    
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Iterator[str]:
+        """
+        发送聊天请求，以流式方式逐段返回生成的文本
+        
+        Args:
+            messages: 消息列表，格式为 [{"role": "user", "content": "..."}]
+            temperature: 温度参数
+            max_tokens: 最大 token 数
+            
+        Yields:
+            模型生成的文本片段
+        """
+        temperature = temperature if temperature is not None else self.temperature
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
+        
+        # 流式请求在读取期间一直占用并发槽位；已输出内容后无法重试
+        with self.scheduler.slot(estimate_tokens(messages, max_tokens), self.deadline) as timeout:
+            if self.provider == "ernie":
+                yield from self._chat_ernie_stream(messages, temperature, max_tokens, timeout)
+                return
+            
+            try:
+                stream = self.scheduler.retry(lambda: self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    timeout=timeout
+                ))
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                raise Exception(f"LLM API 调用失败: {e}")
+    
+    async def achat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """流式聊天请求（异步版本，参数同 chat_stream）"""
+        temperature = temperature if temperature is not None else self.temperature
+        max_tokens = max_tokens if max_tokens is not None else self.max_tokens
+        
+        if self.provider == "ernie":
+            # 在线程中逐段读取同步的 SSE 流（同步生成器内部占用调度器槽位）
+            chunks = self.chat_stream(messages, temperature, max_tokens)
+            done = object()
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, done)
+                if chunk is done:
+                    return
+                yield chunk
+        
+        async with self.scheduler.aslot(estimate_tokens(messages, max_tokens), self.deadline) as timeout:
+            try:
+                stream = await self.scheduler.aretry(lambda: self._get_async_client().chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    timeout=timeout
+                ))
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                raise Exception(f"LLM API 调用失败: {e}")
+    
     def generate(
         self,
         prompt: str,
         system_prompt: Optional[str] = None,
         temperature: Optional[float] = None,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
     ) -> str:
         """
         生成文本（简化接口）
@@ -236,6 +424,7 @@ class LLMClient:
             system_prompt: 系统提示（可选）
             temperature: 温度参数
             max_tokens: 最大 token 数
+            deadline: 请求截止时间（秒），None 使用初始化时的设置
             
         Returns:
             生成的文本
@@ -245,7 +434,56 @@ class LLMClient:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
         
-        return self.chat(messages, temperature, max_tokens)
+        return self.chat(messages, temperature, max_tokens, deadline=deadline)
+
+
+    async def agenerate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        """生成文本（异步版本，参数同 generate）"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        
+        return await self.achat(messages, temperature, max_tokens, deadline=deadline)
+
+
+    def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Iterator[str]:
+        """流式生成文本（参数同 generate），逐段返回"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        
+        yield from self.chat_stream(messages, temperature, max_tokens)
+    
+    async def agenerate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """流式生成文本（异步版本，参数同 generate）"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        
+        async for chunk in self.achat_stream(messages, temperature, max_tokens):
+            yield chunk
 
 
 # 便捷函数
@@ -0,0 +1,589 @@
+"""
+LLM request scheduler.
+按提供商共享的请求调度层：令牌桶限制 RPM / TPM、有界并发、HTTP 连接复用、
+429 / 5xx 指数退避重试以及请求截止时间。
+LLMClient、RAGFusion（通过 LLMClient）和 RagasEvaluation 在同一进程内共用同一个调度器，
+使总吞吐接近配额上限而不被限流。
+"""
+
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from observability.tracing import get_tracer
+
+# 未在 config.yaml 中配置时使用的限制（保守值，按账号配额调整）
+DEFAULT_RATE_LIMITS = {"rpm": 60, "tpm": 100000, "max_concurrency": 8}
+
+_CJK_PATTERN = re.compile(r"[　-〿㐀-鿿＀-￯]")
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求在截止时间前未能完成（包括排队等待配额的时间）"""
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int = 0) -> int:
+    """
+    粗略估计一次请求消耗的 token 数（用于 TPM 预扣）
+
+    中日韩字符按 1 个 token 计，其余字符按 4 个字符 1 个 token 计，
+    再加上每条消息的格式开销和生成上限 max_tokens。
+    """
+    total = 0
+    for message in messages:
+        content = message.get("content") or ""
+        cjk = len(_CJK_PATTERN.findall(content))
+        total += cjk + (len(content) - cjk + 3) // 4 + 4
+    return total + max_tokens
+
+
+class TokenBucket:
+    """
+    令牌桶：按 rate_per_minute 匀速补充，容量为一分钟的配额
+
+    允许把令牌预扣成负数（请求实际消耗超过估计时），之后的请求会等待补齐。
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: 每分钟补充的令牌数
+            capacity: 桶容量，None 表示等于 rate_per_minute
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float) -> float:
+        """
+        尝试取出 amount 个令牌
+
+        Returns:
+            0 表示成功；否则为还需等待的秒数（未取出）
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def adjust(self, delta: float):
+        """归还（delta > 0）或追加扣除（delta < 0）令牌"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """从 openai / requests / httpx 的异常中取出 HTTP 状态码"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """429、5xx、超时和连接错误可以重试；其他 4xx 和参数错误不重试"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status == 408 or status >= 500
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """读取响应头中的 Retry-After（秒）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """
+    单个提供商的请求调度器
+
+    每次请求先占用一个并发槽位，再从 RPM 和 TPM 令牌桶中取出配额（TPM 按估计值预扣，
+    返回后按实际用量校正）；失败时对可重试的错误按指数退避（带随机抖动，优先使用
+    Retry-After）重试。所有等待都受请求截止时间约束。
+    """
+
+    def __init__(
+        self,
+        provider: str = "default",
+        rpm: Optional[float] = 60,
+        tpm: Optional[float] = 100000,
+        max_concurrency: int = 8,
+        timeout: float = 30.0,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0
+    ):
+        """
+        Args:
+            provider: 提供商名称（日志用）
+            rpm: 每分钟请求数上限，None 表示不限制
+            tpm: 每分钟 token 数上限，None 表示不限制
+            max_concurrency: 同时在途的请求数量上限
+            timeout: 单次 HTTP 请求的超时（秒）
+            max_retries: 最大重试次数（不含首次请求）
+            base_delay: 首次重试前的基础等待时间（秒）
+            max_delay: 单次等待的上限（秒）
+        """
+        self.provider = provider
+        self.rpm = TokenBucket(rpm) if rpm else None
+        self.tpm = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._session = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "throttled": 0, "tokens": 0, "wait_time": 0.0}
+
+    # ---- 配额 ----
+
+    def _quota_wait(self, estimated_tokens: int) -> float:
+        """尝试取出一次请求的 RPM / TPM 配额，返回需要等待的秒数（0 表示已取出）"""
+        if self.rpm is not None:
+            wait = self.rpm.try_acquire(1)
+            if wait > 0:
+                return wait
+        if self.tpm is not None and estimated_tokens:
+            wait = self.tpm.try_acquire(estimated_tokens)
+            if wait > 0:
+                if self.rpm is not None:
+                    self.rpm.adjust(1)  # 归还已取出的请求配额
+                return wait
+        return 0.0
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _check_deadline(self, deadline: Optional[float], wait: float = 0.0):
+        remaining = self._remaining(deadline)
+        if remaining is not None and remaining < wait:
+            raise DeadlineExceeded(f"[{self.provider}] 请求未能在截止时间内完成")
+
+    def _acquire(self, estimated_tokens: int, deadline: Optional[float]):
+        """阻塞等待并发槽位和配额"""
+        start = time.monotonic()
+        remaining = self._remaining(deadline)
+        if not self._slots.acquire(timeout=max(0.0, remaining) if remaining is not None else None):
+            raise DeadlineExceeded(f"[{self.provider}] 等待并发槽位超时")
+        try:
+            while True:
+                wait = self._quota_wait(estimated_tokens)
+                if wait <= 0:
+                    break
+                self._check_deadline(deadline, wait)
+                self._stats["throttled"] += 1
+                time.sleep(wait)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._stats["wait_time"] += time.monotonic() - start
+
+    async def _aacquire(self, estimated_tokens: int, deadline: Optional[float]):
+        """_acquire 的 asyncio 版本（不阻塞事件循环）"""
+        start = time.monotonic()
+        while not self._slots.acquire(blocking=False):
+            self._check_deadline(deadline, 0.01)
+            await asyncio.sleep(0.01)
+        try:
+            while True:
+                wait = self._quota_wait(estimated_tokens)
+                if wait <= 0:
+                    break
+                self._check_deadline(deadline, wait)
+                self._stats["throttled"] += 1
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._stats["wait_time"] += time.monotonic() - start
+
+    def _release(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """释放并发槽位，并按实际用量校正 TPM"""
+        self._slots.release()
+        if used_tokens is not None:
+            self._stats["tokens"] += used_tokens
+            get_tracer().increment("llm.tokens", used_tokens)
+            get_tracer().set_attribute("tokens", used_tokens)
+            if self.tpm is not None and estimated_tokens:
+                self.tpm.adjust(estimated_tokens - used_tokens)
+
+    def _request_timeout(self, deadline: Optional[float]) -> float:
+        remaining = self._remaining(deadline)
+        return self.timeout if remaining is None else max(0.1, min(self.timeout, remaining))
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    # ---- 请求 ----
+
+    def call(
+        self,
+        fn: Callable[[float], Tuple[Any, Optional[int]]],
+        estimated_tokens: int = 0,
+        deadline: Optional[float] = None
+    ) -> Any:
+        """
+        在配额和并发限制下执行请求，失败时重试
+
+        Args:
+            fn: 接收单次请求超时（秒），返回 (结果, 实际消耗的 token 数或 None)
+            estimated_tokens: 预估 token 数（用于 TPM 预扣）
+            deadline: 截止时间（秒），相对于现在；None 表示不限制
+
+        Returns:
+            fn 返回的结果
+        """
+        deadline = time.monotonic() + deadline if deadline is not None else None
+        attempt = 0
+        while True:
+            self._acquire(estimated_tokens, deadline)
+            used_tokens = None
+            try:
+                self._stats["requests"] += 1
+                result, used_tokens = fn(self._request_timeout(deadline))
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                self._check_deadline(deadline, delay)
+                attempt += 1
+                self._stats["retries"] += 1
+                get_tracer().increment("llm.retries")
+                print(f"[{self.provider}] 请求失败 ({e})，{delay:.2f}s 后重试 {attempt}/{self.max_retries}")
+            finally:
+                self._release(estimated_tokens, used_tokens)
+            time.sleep(delay)
+
+    async def acall(
+        self,
+        fn: Callable[[float], Awaitable[Tuple[Any, Optional[int]]]],
+        estimated_tokens: int = 0,
+        deadline: Optional[float] = None
+    ) -> Any:
+        """call 的 asyncio 版本，fn 返回 awaitable"""
+        deadline = time.monotonic() + deadline if deadline is not None else None
+        attempt = 0
+        while True:
+            await self._aacquire(estimated_tokens, deadline)
+            used_tokens = None
+            try:
+                self._stats["requests"] += 1
+                result, used_tokens = await fn(self._request_timeout(deadline))
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                self._check_deadline(deadline, delay)
+                attempt += 1
+                self._stats["retries"] += 1
+                get_tracer().increment("llm.retries")
+                print(f"[{self.provider}] 请求失败 ({e})，{delay:.2f}s 后重试 {attempt}/{self.max_retries}")
+            finally:
+                self._release(estimated_tokens, used_tokens)
+            await asyncio.sleep(delay)
+
+    def retry(self, fn: Callable[[], Any]) -> Any:
+        """
+        在已占用的槽位内重试 fn（不重新排队取配额），用于打开流式请求
+        """
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                attempt += 1
+                self._stats["retries"] += 1
+                print(f"[{self.provider}] 请求失败 ({e})，{delay:.2f}s 后重试 {attempt}/{self.max_retries}")
+                time.sleep(delay)
+
+    async def aretry(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """retry 的 asyncio 版本"""
+        attempt = 0
+        while True:
+            try:
+                return await fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                attempt += 1
+                self._stats["retries"] += 1
+                print(f"[{self.provider}] 请求失败 ({e})，{delay:.2f}s 后重试 {attempt}/{self.max_retries}")
+                await asyncio.sleep(delay)
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 0, deadline: Optional[float] = None) -> Iterator[float]:
+        """
+        占用一个并发槽位和配额（用于流式请求，整个流读取期间保持占用；
+        打开请求时可以用 retry 重试，开始输出后不再重试）
+
+        Yields:
+            单次请求超时（秒）
+        """
+        deadline = time.monotonic() + deadline if deadline is not None else None
+        self._acquire(estimated_tokens, deadline)
+        self._stats["requests"] += 1
+        try:
+            yield self._request_timeout(deadline)
+        finally:
+            self._release(estimated_tokens, None)
+
+    @asynccontextmanager
+    async def aslot(self, estimated_tokens: int = 0, deadline: Optional[float] = None):
+        """slot 的 asyncio 版本"""
+        deadline = time.monotonic() + deadline if deadline is not None else None
+        await self._aacquire(estimated_tokens, deadline)
+        self._stats["requests"] += 1
+        try:
+            yield self._request_timeout(deadline)
+        finally:
+            self._release(estimated_tokens, None)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        提交到调度器的线程池（大小为 max_concurrency）
+
+        fn 内部通过 LLMClient 发出的请求仍受配额限制。
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix=f"llm-{self.provider}"
+                )
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn: Callable, items: List[Any]) -> List[Any]:
+        """并发执行 fn(item)，按输入顺序返回结果（单项失败时该位置为异常对象）"""
+        futures = [self.submit(fn, item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    # ---- 连接 ----
+
+    @property
+    def session(self):
+        """共享的 requests.Session（连接池大小与并发上限一致，重试由调度器负责）"""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_concurrency, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def stats(self) -> Dict[str, Any]:
+        """调度统计：请求数、重试数、因配额等待的次数、累计 token 和排队时间"""
+        return {
+            **self._stats,
+            "rpm_available": self.rpm.available if self.rpm is not None else None,
+            "tpm_available": self.tpm.available if self.tpm is not None else None,
+        }
+
+    def close(self):
+        """关闭线程池和 HTTP 会话"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+# ---- 进程内共享 ----
+
+_schedulers: Dict[str, LLMScheduler] = {}
+_openai_clients: Dict[Tuple, Any] = {}
+_registry_lock = threading.Lock()
+
+
+def _llm_config() -> Dict[str, Any]:
+    try:
+        # 延迟导入：retrieval 包在导入时会加载 llm_client
+        from retrieval.config import load_config
+        return load_config().get("llm", {}) or {}
+    except Exception:
+        return {}
+
+
+def get_scheduler(provider: str) -> LLMScheduler:
+    """
+    获取提供商对应的共享调度器（首次调用时按 config.yaml 的 llm.rate_limits 创建）
+
+    Args:
+        provider: 提供商名称（doubao, openai, qwen, ernie, zhipu）
+    """
+    provider = provider.lower()
+    with _registry_lock:
+        scheduler = _schedulers.get(provider)
+        if scheduler is None:
+            llm_config = _llm_config()
+            rate_limits = llm_config.get("rate_limits", {}) or {}
+            limits = {**DEFAULT_RATE_LIMITS, **(rate_limits.get("default") or {}), **(rate_limits.get(provider) or {})}
+            scheduler = LLMScheduler(
+                provider=provider,
+                rpm=limits.get("rpm"),
+                tpm=limits.get("tpm"),
+                max_concurrency=limits.get("max_concurrency", 8),
+                timeout=llm_config.get("timeout", 30),
+                max_retries=llm_config.get("max_retries", 5)
+            )
+            _schedulers[provider] = scheduler
+        return scheduler
+
+
+def get_openai_client(api_key: str, base_url: str, use_async: bool = False):
+    """
+    获取共享的 OpenAI 兼容客户端（同一 base_url + api_key 复用 HTTP 连接池）
+
+    SDK 自带的重试被关闭（max_retries=0），由调度器统一重试。
+    """
+    key = (api_key, base_url, use_async)
+    with _registry_lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            if use_async:
+                from openai import AsyncOpenAI as OpenAIClient
+            else:
+                from openai import OpenAI as OpenAIClient
+            client = OpenAIClient(api_key=api_key, base_url=base_url, max_retries=0)
+            _openai_clients[key] = client
+        return client
+
+
+def create_ragas_run_config(scheduler: LLMScheduler):
+    """
+    Ragas 适配：根据调度器的并发、超时和重试设置创建 ragas.RunConfig
+    """
+    from ragas.run_config import RunConfig
+    return RunConfig(
+        timeout=int(scheduler.timeout),
+        max_retries=scheduler.max_retries,
+        max_wait=int(scheduler.max_delay),
+        max_workers=scheduler.max_concurrency
+    )
+
+
+def create_langchain_rate_limiter(scheduler: LLMScheduler):
+    """
+    LangChain 适配：与 LLMClient 共用同一个 RPM 令牌桶的 rate limiter
+    （用于 Ragas 使用的 ChatOpenAI(rate_limiter=...)）
+    """
+    from langchain_core.rate_limiters import BaseRateLimiter
+
+    class SchedulerRateLimiter(BaseRateLimiter):
+        def acquire(self, *, blocking: bool = True) -> bool:
+            while True:
+                wait = scheduler.rpm.try_acquire(1) if scheduler.rpm is not None else 0.0
+                if wait <= 0:
+                    return True
+                if not blocking:
+                    return False
+                time.sleep(wait)
+
+        async def aacquire(self, *, blocking: bool = True) -> bool:
+            while True:
+                wait = scheduler.rpm.try_acquire(1) if scheduler.rpm is not None else 0.0
+                if wait <= 0:
+                    return True
+                if not blocking:
+                    return False
+                await asyncio.sleep(wait)
+
+    return SchedulerRateLimiter()
+
+
+if __name__ == "__main__":
+    # 示例：模拟一个 RPM=120、偶尔返回 429 的提供商，观察限流和重试
+    class FakeRateLimitError(Exception):
+        status_code = 429
+
+    scheduler = LLMScheduler(provider="demo", rpm=120, tpm=20000, max_concurrency=4, base_delay=0.1)
+    calls = {"count": 0}
+
+    def fake_request(prompt: str):
+        def send(timeout: float):
+            calls["count"] += 1
+            if calls["count"] % 7 == 0:
+                raise FakeRateLimitError("429 Too Many Requests")
+            time.sleep(0.05)
+            return f"answer to {prompt}", 50 + len(prompt)
+        messages = [{"role": "user", "content": prompt}]
+        return scheduler.call(send, estimated_tokens=estimate_tokens(messages, max_tokens=100), deadline=30)
+
+    prompts = [f"问题 {i}" for i in range(20)]
+    start = time.perf_counter()
+    results = scheduler.map(fake_request, prompts)
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(prompts)} 个请求耗时 {elapsed:.2f}s（RPM=120，桶容量允许突发）")
+    print(f"成功: {sum(1 for r in results if not isinstance(r, Exception))}")
+    print(f"统计: {scheduler.stats()}")
+
+    # 截止时间：配额耗尽时，等待超过截止时间的请求直接失败
+    tight = LLMScheduler(provider="tight", rpm=1, max_concurrency=1)
+    tight.call(lambda timeout: ("ok", None))
+    try:
+        tight.call(lambda timeout: ("ok", None), deadline=0.5)
+    except DeadlineExceeded as e:
+        print(f"\n截止时间: {e}")
+    scheduler.close()
@@ -0,0 +1,27 @@
+"""
+Observability module for RAG system.
+"""
+
+from .tracing import (
+    Histogram,
+    Span,
+    SpanHook,
+    OpenTelemetryHook,
+    RecordingHook,
+    Tracer,
+    budget_violations,
+    get_tracer,
+    set_tracer,
+)
+
+__all__ = [
+    "Histogram",
+    "Span",
+    "SpanHook",
+    "OpenTelemetryHook",
+    "RecordingHook",
+    "Tracer",
+    "budget_violations",
+    "get_tracer",
+    "set_tracer",
+]
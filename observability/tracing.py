@@ -0,0 +1,403 @@
+"""
+Per-stage latency tracing for the RAG pipeline.
+记录各阶段（rewrite、embed、search、rerank、context、generate）的 span，
+按阶段维护延迟直方图（p50 / p95 / p99），并统计 token 数、缓存命中等计数器。
+span 通过钩子（SpanHook）导出，默认不导出；可选接入 OpenTelemetry。
+"""
+
+import contextvars
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# 流水线的标准阶段名称（其他名称同样可以使用）
+STAGES = ("query", "rewrite", "embed", "search", "rerank", "context", "generate")
+
+
+class Histogram:
+    """
+    对数分桶的延迟直方图（毫秒）
+
+    桶边界按 growth 倍数递增，分位数的相对误差不超过 growth - 1，
+    内存固定，记录和查询都是 O(桶数)。
+    """
+
+    def __init__(self, min_value: float = 0.01, max_value: float = 3_600_000.0, growth: float = 1.05):
+        """
+        Args:
+            min_value: 最小可区分的值（毫秒），更小的值记入第一个桶
+            max_value: 最大值（毫秒），更大的值记入最后一个桶
+            growth: 相邻桶边界的比例
+        """
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.num_buckets = int(math.ceil(math.log(max_value / min_value) / self._log_growth)) + 1
+        self.counts = [0] * self.num_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return min(self.num_buckets - 1, int(math.log(value / self.min_value) / self._log_growth) + 1)
+
+    def record(self, value: float):
+        """记录一个值（毫秒）"""
+        bucket = self._bucket(value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, p: float) -> float:
+        """第 p 百分位数（0-100），返回所在桶的上边界"""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = max(1, int(math.ceil(self.count * p / 100.0)))
+            seen = 0
+            for bucket, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= rank:
+                    return min(self.max, self.min_value * self.growth ** bucket)
+            return self.max
+
+    def merge(self, other: "Histogram"):
+        """合并另一个相同分桶的直方图"""
+        with self._lock:
+            for bucket, bucket_count in enumerate(other.counts):
+                self.counts[bucket] += bucket_count
+            self.count += other.count
+            self.total += other.total
+            self.max = max(self.max, other.max)
+
+    def summary(self) -> Dict[str, float]:
+        """计数、平均值和常用分位数（毫秒）"""
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max,
+        }
+
+
+class Span:
+    """一次阶段调用：名称、起止时间、属性以及父子关系"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attributes", "start", "end", "error", "context")
+
+    def __init__(self, name: str, trace_id: int, span_id: int, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        self.context: Any = None  # 钩子保存的关联对象（例如 OpenTelemetry span）
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "duration_ms": self.duration_ms,
+            "attributes": dict(self.attributes),
+            "error": self.error,
+        }
+
+
+class SpanHook:
+    """span 导出钩子，默认实现什么都不做"""
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+
+class OpenTelemetryHook(SpanHook):
+    """
+    把 span 转发给 OpenTelemetry（需要安装 opentelemetry-api，并由应用配置 exporter）
+
+    父子关系沿用本模块的 span 结构，属性和异常原样转发。
+    """
+
+    def __init__(self, tracer_name: str = "learnrag"):
+        from opentelemetry import trace
+        self._trace = trace
+        self._tracer = trace.get_tracer(tracer_name)
+
+    def on_start(self, span: Span):
+        parent_context = None
+        if span.parent is not None and span.parent.context is not None:
+            parent_context = self._trace.set_span_in_context(span.parent.context)
+        span.context = self._tracer.start_span(span.name, context=parent_context)
+
+    def on_end(self, span: Span):
+        otel_span = span.context
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end()
+
+
+class RecordingHook(SpanHook):
+    """在内存中保留最近结束的 span（调试和测试用）"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+            if len(self.spans) > self.max_spans:
+                del self.spans[:len(self.spans) - self.max_spans]
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("rag_current_span", default=None)
+
+
+class Tracer:
+    """
+    记录 span、按阶段聚合延迟直方图，并维护计数器
+
+    用法:
+        with tracer.span("search", top_k=5) as span:
+            ...
+            span.set_attribute("hits", len(results))
+        tracer.increment("answer_cache.hit")
+    """
+
+    def __init__(self, enabled: bool = True, hooks: Optional[List[SpanHook]] = None):
+        """
+        Args:
+            enabled: False 时 span 和计数器都不记录（只保留一次函数调用的开销）
+            hooks: span 导出钩子列表
+        """
+        self.enabled = enabled
+        self.hooks: List[SpanHook] = list(hooks or [])
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: SpanHook):
+        self.hooks.append(hook)
+
+    def histogram(self, name: str) -> Histogram:
+        """获取（不存在时创建）阶段的直方图"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """
+        记录一个阶段的耗时；嵌套调用自动建立父子关系
+
+        Yields:
+            Span（tracer 关闭时为 None）
+        """
+        if not self.enabled:
+            yield None
+            return
+        parent = _current_span.get()
+        span_id = next(self._ids)
+        trace_id = parent.trace_id if parent is not None else span_id
+        span = Span(name, trace_id, span_id, parent, attributes)
+        for hook in self.hooks:
+            hook.on_start(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+            self.histogram(name).record(span.duration_ms)
+            for hook in self.hooks:
+                hook.on_end(span)
+
+    def current_span(self) -> Optional[Span]:
+        """当前线程 / 协程中正在进行的 span"""
+        return _current_span.get()
+
+    def set_attribute(self, key: str, value: Any):
+        """给当前 span 设置属性（没有 span 时忽略）"""
+        span = _current_span.get()
+        if span is not None:
+            span.set_attribute(key, value)
+
+    def increment(self, name: str, value: float = 1):
+        """计数器累加（token 数、缓存命中等）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name: str, duration_ms: float):
+        """直接记录一个阶段的耗时（不创建 span）"""
+        if self.enabled:
+            self.histogram(name).record(duration_ms)
+
+    def summary(self) -> Dict[str, Any]:
+        """各阶段的延迟统计和计数器"""
+        return {
+            "stages": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def report(self) -> str:
+        """格式化的阶段延迟表"""
+        lines = [f"{'stage':<12} {'count':>7} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)"]
+        for name, stats in self.summary()["stages"].items():
+            lines.append(
+                f"{name:<12} {stats['count']:>7} {stats['mean_ms']:>9.2f} {stats['p50_ms']:>9.2f} "
+                f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}"
+            )
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value:g}")
+        return "\n".join(lines)
+
+    def check_budgets(self, budgets: Dict[str, float], percentile: float = 99) -> List[str]:
+        """
+        检查各阶段的延迟预算（用于回归门禁）
+
+        Args:
+            budgets: {阶段名: 预算毫秒数}
+            percentile: 比较的百分位数
+
+        Returns:
+            超出预算的描述列表，空列表表示全部通过
+        """
+        latencies = {
+            name: histogram.percentile(percentile)
+            for name, histogram in self.histograms.items() if histogram.count
+        }
+        return budget_violations(latencies, budgets, percentile)
+
+    def export_json(self, path: str):
+        """把统计结果写入 JSON 文件"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    def reset(self):
+        """清空直方图和计数器"""
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+def budget_violations(latencies: Dict[str, float], budgets: Dict[str, float], percentile: float = 99) -> List[str]:
+    """
+    对照预算检查各阶段延迟（Tracer.check_budgets 和 scripts/check_latency_budget.py 共用）
+
+    Args:
+        latencies: {阶段名: 该百分位的延迟毫秒数}，没有数据的阶段不出现
+        budgets: {阶段名: 预算毫秒数}
+        percentile: 百分位数（只用于描述）
+
+    Returns:
+        超出预算的描述列表，空列表表示全部通过
+    """
+    violations = []
+    for name, budget_ms in budgets.items():
+        value = latencies.get(name)
+        if value is not None and value > budget_ms:
+            violations.append(f"{name}: p{percentile:g} {value:.2f}ms > budget {budget_ms:.2f}ms")
+    return violations
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """
+    获取进程级共享的 Tracer
+
+    首次调用时读取 config.yaml 的 observability 配置（enabled、otel），
+    环境变量 RAG_TRACING=off 关闭记录，RAG_TRACING=otel 启用 OpenTelemetry 钩子。
+    """
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                config = {}
+                try:
+                    from retrieval.config import load_config
+                    config = load_config().get("observability", {}) or {}
+                except Exception:
+                    pass
+                mode = os.getenv("RAG_TRACING", "").lower()
+                tracer = Tracer(enabled=mode != "off" and config.get("enabled", True))
+                if mode == "otel" or config.get("otel", False):
+                    try:
+                        tracer.add_hook(OpenTelemetryHook())
+                    except ImportError:
+                        print("警告: 未安装 opentelemetry-api，跳过 OpenTelemetry 导出")
+                _tracer = tracer
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    """替换进程级 Tracer（例如在基准测试中使用独立的统计）"""
+    global _tracer
+    _tracer = tracer
+
+
+if __name__ == "__main__":
+    # 示例：模拟一次查询的各阶段耗时
+    import random
+
+    tracer = Tracer()
+    recorder = RecordingHook()
+    tracer.add_hook(recorder)
+
+    for _ in range(200):
+        with tracer.span("query"):
+            with tracer.span("embed", num_texts=1):
+                time.sleep(random.uniform(0.001, 0.003))
+            with tracer.span("search", top_k=8):
+                time.sleep(random.uniform(0.001, 0.002) if random.random() > 0.02 else 0.02)
+            with tracer.span("rerank", pairs=8):
+                time.sleep(random.uniform(0.002, 0.004))
+            tracer.increment("llm.tokens", random.randint(200, 400))
+
+    print(tracer.report())
+    print(f"\n最后一个 span: {recorder.spans[-1].to_dict()}")
+    print(f"预算检查: {tracer.check_budgets({'search': 5.0, 'embed': 10.0}) or '通过'}")
@@ -4,6 +4,17 @@ Retrieval module for RAG system.
 
 from .basic_rag_demo import BasicRAG
 from .rag_fusion_demo import RAGFusion
+from .text_splitter import RecursiveTextSplitter
+from .ingestion import IngestionPipeline
+from .answer_cache import SemanticAnswerCache
+from .bm25_index import BM25Index
 
-__all__ = ["BasicRAG", "RAGFusion"]
+__all__ = [
+    "BasicRAG",
+    "RAGFusion",
+    "RecursiveTextSplitter",
+    "IngestionPipeline",
+    "SemanticAnswerCache",
+    "BM25Index",
+]
 
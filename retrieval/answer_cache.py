@@ -0,0 +1,258 @@
+"""
+Two-tier answer cache for the RAG query path.
+精确层：按规范化后的查询文本 + 语料版本命中；
+语义层：按查询向量的余弦相似度命中（超过阈值即视为同一问题）。
+两层都带 TTL 和 LRU 淘汰，语料变化（add_documents）时整体失效。
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+class LRUTTLCache:
+    """带过期时间的线程安全 LRU 缓存"""
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl: Optional[float] = 3600.0,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        """
+        Args:
+            max_size: 最大条目数，超出后淘汰最久未使用的条目
+            ttl: 条目存活秒数，None 表示永不过期
+            on_evict: 条目被淘汰/过期/删除时的回调 on_evict(key, value)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        # key -> (value, expires_at)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, expires_at: float) -> bool:
+        return expires_at < time.monotonic()
+
+    def _remove(self, key: Hashable):
+        value, _ = self._data.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """查询缓存，命中时刷新 LRU 顺序"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if self._expired(expires_at):
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """写入缓存"""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at)
+            while len(self._data) > self.max_size:
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """删除并返回条目"""
+        with self._lock:
+            if key not in self._data:
+                return default
+            value, _ = self._data[key]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            for key in list(self._data.keys()):
+                self._remove(key)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_PUNCTUATION_TAIL = re.compile(r"[\s?？!！。.，,;；:：]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：全角转半角、小写、合并空白、去掉结尾标点"""
+    text = unicodedata.normalize("NFKC", query).lower().strip()
+    text = _WHITESPACE.sub(" ", text)
+    return _PUNCTUATION_TAIL.sub("", text)
+
+
+class SemanticAnswerCache:
+    """两级答案缓存：精确匹配 + 语义相似匹配"""
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: Optional[float] = 3600.0,
+        similarity_threshold: float = 0.95,
+        dimension: Optional[int] = None
+    ):
+        """
+        Args:
+            max_entries: 每一层的最大条目数
+            ttl: 条目存活秒数，None 表示永不过期
+            similarity_threshold: 语义层命中所需的最小余弦相似度
+            dimension: 查询向量维度，None 表示在第一次写入时确定
+        """
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self._exact = LRUTTLCache(max_size=max_entries, ttl=ttl)
+        # 语义层：LRU 中保存 key -> 矩阵行号，向量存放在预分配的矩阵中
+        self._semantic = LRUTTLCache(max_size=max_entries, ttl=ttl, on_evict=self._free_row)
+        self._matrix: Optional[np.ndarray] = None
+        self._row_keys: List[Optional[Tuple[str, int]]] = []
+        self._free_rows: List[int] = []
+        self._lock = threading.RLock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        if dimension is not None:
+            self._allocate(dimension)
+
+    def _allocate(self, dimension: int):
+        self._matrix = np.zeros((self.max_entries, dimension), dtype=np.float32)
+        self._row_keys = [None] * self.max_entries
+        self._free_rows = list(range(self.max_entries - 1, -1, -1))
+
+    def _free_row(self, key: Hashable, value: Tuple[int, Dict]):
+        row, _ = value
+        self._row_keys[row] = None
+        self._matrix[row] = 0.0
+        self._free_rows.append(row)
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup_exact(self, query: str, corpus_version: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        只查精确层，未命中时不计入 misses（随后通常会带查询向量再调用 lookup）
+
+        Returns:
+            命中时返回 {"result": ..., "hit_type": "exact", "similarity": 1.0}，否则 None
+        """
+        key = (normalize_query(query), corpus_version)
+        with self._lock:
+            result = self._exact.get(key)
+            if result is None:
+                return None
+            self.exact_hits += 1
+            return {"result": result, "hit_type": "exact", "similarity": 1.0}
+
+    def lookup(
+        self,
+        query: str,
+        corpus_version: int = 0,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存
+
+        Args:
+            query: 查询文本
+            corpus_version: 语料版本号
+            query_embedding: 查询向量（None 时只查精确层）
+
+        Returns:
+            命中时返回 {"result": ..., "hit_type": "exact"|"semantic", "similarity": float}，否则 None
+        """
+        key = (normalize_query(query), corpus_version)
+        with self._lock:
+            result = self._exact.get(key)
+            if result is not None:
+                self.exact_hits += 1
+                return {"result": result, "hit_type": "exact", "similarity": 1.0}
+
+            if query_embedding is not None and self._matrix is not None and len(self._semantic):
+                similarities = self._matrix @ self._unit(query_embedding)
+                for row in np.argsort(-similarities):
+                    if similarities[row] < self.similarity_threshold:
+                        break
+                    row_key = self._row_keys[row]
+                    if row_key is None or row_key[1] != corpus_version:
+                        continue
+                    # get 会检查 TTL 并刷新 LRU 顺序
+                    entry = self._semantic.get(row_key)
+                    if entry is None:
+                        continue
+                    self.semantic_hits += 1
+                    return {
+                        "result": entry[1],
+                        "hit_type": "semantic",
+                        "similarity": float(similarities[row])
+                    }
+
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        query: str,
+        result: Dict[str, Any],
+        corpus_version: int = 0,
+        query_embedding: Optional[np.ndarray] = None
+    ):
+        """写入缓存（有查询向量时同时写入语义层）"""
+        key = (normalize_query(query), corpus_version)
+        with self._lock:
+            self._exact.set(key, result)
+            if query_embedding is None:
+                return
+            vector = self._unit(query_embedding)
+            if self._matrix is None:
+                self._allocate(vector.shape[0])
+            self._semantic.pop(key)
+            if not self._free_rows:
+                # 所有行都被占用时淘汰最久未使用的条目
+                self._semantic.pop(next(iter(self._semantic._data)))
+            row = self._free_rows.pop()
+            self._matrix[row] = vector
+            self._row_keys[row] = key
+            self._semantic.set(key, (row, result))
+
+    def invalidate(self):
+        """清空两级缓存（语料变化时调用）"""
+        with self._lock:
+            self._exact.clear()
+            self._semantic.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中统计"""
+        with self._lock:
+            total = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / total if total else 0.0,
+                "exact_entries": len(self._exact),
+                "semantic_entries": len(self._semantic),
+            }
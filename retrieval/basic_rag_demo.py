@@ -5,7 +5,9 @@ Day 5-7: 构建最小 RAG Demo
 
 import sys
 import os
-from typing import List, Dict
+import time
+from typing import List, Dict, Iterator, Optional
+import numpy as np
 from dotenv import load_dotenv
 
 # 添加项目根目录到 Python 路径
@@ -14,13 +16,46 @@ sys.path.insert(0, project_root)
 
 from embeddings.embed_model import EmbeddingModel
 from embeddings.reranker import Reranker
-from storage.qdrant_wrapper import QdrantClient
+from embeddings.batching_reranker import BatchingReranker
+from embeddings.encode_pool import EncodePool
+from storage.qdrant_wrapper import make_point_id
+from storage.factory import create_vector_store
 from llm.llm_client import get_llm_client
+from retrieval.config import load_config
+from retrieval.ingestion import IngestionPipeline
+from retrieval.bm25_index import BM25Index
+from retrieval.fusion import fuse
+from observability.tracing import get_tracer
 
 # 加载环境变量
 load_dotenv()
 
 
+def build_answer_prompt(query: str, context: str) -> str:
+    """构建基于上下文回答问题的 prompt"""
+    # 优化版 prompt，更明确地要求使用上下文
+    return f"""你是一个专业的AI助手。请基于以下提供的上下文信息回答问题。
+
+【上下文信息】
+{context}
+
+【问题】
+{query}
+
+【要求】
+1. 仔细阅读上下文信息，提取所有相关信息
+2. 基于上下文中的内容，全面、详细地回答问题
+3. 如果上下文中包含多个相关文档，请整合所有信息，给出完整的答案
+4. 回答要有条理，可以分点说明
+5. 如果上下文中确实没有相关信息，才说"根据提供的信息，我无法回答这个问题"
+6. 尽量使用上下文中的具体内容，不要遗漏重要信息
+
+【答案】"""
+
+
+SEARCH_TYPES = ("similarity", "bm25", "hybrid")
+
+
 class BasicRAG:
     """基础 RAG 系统：检索 + 重排 + 生成"""
     
@@ -30,14 +65,28 @@ class BasicRAG:
         reranker_model_name: str = "BAAI/bge-reranker-base",
         qdrant_url: str = "http://localhost:6333",
         collection_name: str = "rag_documents",
-        llm_provider: str = None  # None 表示从环境变量读取
+        llm_provider: str = None,  # None 表示从环境变量读取
+        embedding_cache_dir: str = None,  # None 表示读取 EMBEDDING_CACHE_DIR，未设置则不缓存
+        batch_reranker: bool = False,  # 多线程并发查询时合并重排请求
+        vector_store_type: str = None,  # qdrant / local，None 表示读取 config.yaml 的 vector_store.type
+        search_type: str = None  # similarity / bm25 / hybrid，None 表示读取 config.yaml 的 retrieval.search_type
     ):
         """初始化 RAG 系统"""
-        self.embedder = EmbeddingModel(model_name=embedding_model_name)
+        config = load_config()
+        self.embedding_cache_dir = embedding_cache_dir
+        self.embedder = EmbeddingModel(
+            model_name=embedding_model_name,
+            cache_dir=embedding_cache_dir
+        )
         self.reranker = Reranker(model_name=reranker_model_name)
-        self.vector_db = QdrantClient(
+        if batch_reranker:
+            self.reranker = BatchingReranker(self.reranker)
+        store_config = config.get("vector_store", {})
+        self.vector_db = create_vector_store(
+            store_type=vector_store_type or store_config.get("type", "qdrant"),
             url=qdrant_url,
-            collection_name=collection_name
+            collection_name=collection_name,
+            store_config=store_config
         )
         # 初始化 LLM 客户端
         try:
@@ -46,21 +95,164 @@ class BasicRAG:
             print(f"警告: LLM 客户端初始化失败: {e}")
             self.llm_client = None
         
+        # 稀疏索引（BM25）：search_type 为 bm25 或 hybrid 时在 add_documents 时构建，
+        # 启动时从向量库已有的文档重建（BM25 索引只在内存中，向量库是持久化的）
+        retrieval_config = config.get("retrieval", {})
+        self.search_type = search_type or retrieval_config.get("search_type", "similarity")
+        if self.search_type not in SEARCH_TYPES:
+            raise ValueError(f"不支持的检索方式: {self.search_type}，可选: {', '.join(SEARCH_TYPES)}")
+        self.rrf_k = config.get("rag_fusion", {}).get("rrf_k", 60)
+        self.sparse_index = None
+        if self.search_type != "similarity":
+            bm25_config = retrieval_config.get("bm25", {})
+            self.sparse_index = BM25Index(
+                tokenizer=bm25_config.get("tokenizer", "bigram"),
+                k1=bm25_config.get("k1", 1.5),
+                b=bm25_config.get("b", 0.75)
+            )
+        
+        # 批量入库时可选的多进程编码池（open_encode_pool 启动）
+        self.encode_pool = None
+        
         # 创建集合
         vector_size = self.embedder.get_dimension()
         self.vector_db.create_collection(vector_size=vector_size)
+        if self.sparse_index is not None:
+            self.rebuild_sparse_index()
     
-    def add_documents(self, documents: List[str], metadatas: List[Dict] = None):
-        """添加文档到知识库"""
-        embeddings = self.embedder.encode(documents)
-        self.vector_db.add_documents(documents, embeddings, metadatas)
+    def rebuild_sparse_index(self, batch_size: int = 1000) -> int:
+        """
+        从向量库中已有的文档重建 BM25 索引（点 ID 相同，已在索引中的文档跳过）
+        
+        向量库不支持遍历文档时：bm25 模式直接报错，hybrid 模式给出警告并退化为向量检索，
+        直到文档重新经过 add_documents / ingest_directory 写入。
+        
+        Args:
+            batch_size: 每次从向量库读取的文档数量
+            
+        Returns:
+            新加入 BM25 索引的文档数量
+        """
+        scroll = getattr(self.vector_db, "scroll_documents", None)
+        if scroll is None:
+            message = f"{type(self.vector_db).__name__} 不支持遍历文档，无法从向量库重建 BM25 索引"
+            if self.search_type == "bm25":
+                raise ValueError(f"{message}，search_type=bm25 不可用")
+            print(f"警告: {message}，重新写入文档前 hybrid 检索只使用向量检索结果")
+            return 0
+        
+        start = time.perf_counter()
+        added = 0
+        for ids, texts, metadatas in scroll(batch_size=batch_size):
+            added += self.sparse_index.add_documents(ids, texts, metadatas)
+        if added:
+            print(f"Rebuilt BM25 index from vector store: {added} documents ({time.perf_counter() - start:.1f}s)")
+        return added
+    
+    def open_encode_pool(
+        self,
+        num_workers: Optional[int] = None,
+        threads_per_worker: Optional[int] = None
+    ) -> EncodePool:
+        """
+        启动多进程编码池，之后 add_documents / ingest_directory 的向量化由编码池完成
+        （进程参数与 self.embedder 一致，并与其共用同一份嵌入缓存）
+        
+        Args:
+            num_workers: 编码进程数量，None 表示读取 config.yaml 的 embedding.pool
+            threads_per_worker: 每个进程的线程数，None 表示读取 config.yaml 的 embedding.pool
+            
+        Returns:
+            EncodePool 实例
+        """
+        if self.encode_pool is None:
+            self.encode_pool = EncodePool(
+                model_name=self.embedder.model_name,
+                num_workers=num_workers,
+                threads_per_worker=threads_per_worker,
+                normalize_embeddings=self.embedder.normalize_embeddings,
+                backend=self.embedder.backend,
+                dtype=self.embedder.dtype if self.embedder.backend == "onnx" else None,
+                batching=self.embedder.batching,
+                max_tokens_per_batch=self.embedder.max_tokens_per_batch,
+                cache_dir=self.embedding_cache_dir
+            )
+        return self.encode_pool
+    
+    def close_encode_pool(self):
+        """关闭多进程编码池"""
+        if self.encode_pool is not None:
+            self.encode_pool.close()
+            self.encode_pool = None
+    
+    def add_documents(
+        self,
+        documents: List[str],
+        metadatas: List[Dict] = None,
+        batch_size: int = 256,
+        skip_existing: bool = True
+    ) -> Dict:
+        """
+        添加文档到知识库
+        
+        文档按 batch_size 分批向量化并写入，避免一次性在内存中保存全部向量。
+        点 ID 由内容确定性生成，skip_existing=True 时已入库的文档不会重新向量化。
+        已通过 open_encode_pool 启动编码池时，向量化由多个进程并行完成。
+        
+        Returns:
+            统计信息：documents, embedded, skipped
+        """
+        metadatas = metadatas or [{}] * len(documents)
+        encoder = self.encode_pool or self.embedder
+        if self.encode_pool is not None:
+            batch_size = max(batch_size, self.encode_pool.preferred_batch_size)
+        stats = {"documents": len(documents), "embedded": 0, "skipped": 0}
+        for batch in IngestionPipeline.iter_batches(zip(documents, metadatas), batch_size):
+            ids = [make_point_id(text, str(metadata.get("source", ""))) for text, metadata in batch]
+            if self.sparse_index is not None:
+                # 稀疏索引按 ID 去重，已入库的文档也写入（进程重启后稀疏索引需要重建）
+                self.sparse_index.add_documents(
+                    ids, [text for text, _ in batch], [metadata for _, metadata in batch]
+                )
+            if skip_existing:
+                existing = self.vector_db.existing_ids(ids)
+                batch = [record for record, point_id in zip(batch, ids) if point_id not in existing]
+                stats["skipped"] += len(ids) - len(batch)
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            embeddings = encoder.encode(texts, show_progress_bar=False, output="numpy")
+            self.vector_db.add_documents(texts, embeddings, [metadata for _, metadata in batch])
+            stats["embedded"] += len(batch)
+        
+        if stats["skipped"]:
+            print(f"跳过 {stats['skipped']} 个未变化的文档")
+        return stats
+    
+    def ingest_directory(self, directory: Optional[str] = None, incremental: bool = True) -> Dict:
+        """
+        读取目录中的文件，按 config.yaml 的 document 配置分块后流式入库
+        
+        Args:
+            directory: 文档目录，None 表示 data/documents
+            incremental: 增量同步（只处理新增/修改的块，并删除已消失的块）
+            
+        Returns:
+            入库统计信息（文档数、块数、docs/sec 等）
+        """
+        pipeline = IngestionPipeline.from_config(
+            self.encode_pool or self.embedder, self.vector_db, sparse_index=self.sparse_index
+        )
+        return pipeline.run(directory, incremental=incremental)
     
     def retrieve(
         self,
         query: str,
         top_k: int = 5,
         use_reranker: bool = True,
-        rerank_top_k: int = 3
+        rerank_top_k: int = 3,
+        search_type: str = None,
+        query_vector: Optional[np.ndarray] = None
     ) -> List[Dict]:
         """
         检索相关文档
@@ -70,30 +262,108 @@ class BasicRAG:
             top_k: 初始检索数量
             use_reranker: 是否使用重排
             rerank_top_k: 重排后返回数量
+            search_type: 检索方式（None 使用初始化时的设置）
+                - "similarity": 向量检索
+                - "bm25": BM25 关键词检索
+                - "hybrid": 向量检索与 BM25 各取 top_k，再用 RRF 融合
+            query_vector: 已经计算好的查询向量（可选，避免重复编码）
             
         Returns:
             检索结果列表
         """
-        # 1. 向量检索
-        query_vector = self.embedder.encode(query)
-        results = self.vector_db.search(query_vector, top_k=top_k)
+        search_type = search_type or self.search_type
+        if search_type != "similarity" and self.sparse_index is None:
+            raise ValueError(f"search_type={search_type} 需要 BM25 索引，请在初始化时设置 search_type")
+        
+        # 1. 检索
+        tracer = get_tracer()
+        if search_type == "bm25":
+            with tracer.span("search", search_type=search_type, top_k=top_k):
+                results = self.sparse_index.search(query, top_k=top_k)
+        else:
+            if query_vector is None:
+                query_vector = self.embedder.encode(query, show_progress_bar=False, output="numpy")
+            with tracer.span("search", search_type=search_type, top_k=top_k):
+                results = self.vector_db.search(query_vector, top_k=top_k)
+                if search_type == "hybrid":
+                    sparse_results = self.sparse_index.search(query, top_k=top_k)
+                    results = fuse([results, sparse_results], method="rrf", k=self.rrf_k, top_k=top_k)
         
         # 2. 重排序（可选）
         if use_reranker and results:
             documents = [r["text"] for r in results]
             rerank_results = self.reranker.rerank(query, documents, top_k=rerank_top_k)
-            
-            # 重新组织结果
-            reranked_results = []
-            for idx, score in rerank_results:
-                result = results[idx].copy()
-                result["rerank_score"] = score
-                reranked_results.append(result)
-            
-            return reranked_results
+            return self._apply_rerank(results, rerank_results)
         
         return results
     
+    @staticmethod
+    def _apply_rerank(results: List[Dict], rerank_results: List) -> List[Dict]:
+        """按重排结果 [(index, score), ...] 重新组织检索结果"""
+        reranked_results = []
+        for idx, score in rerank_results:
+            result = results[idx].copy()
+            result["rerank_score"] = score
+            reranked_results.append(result)
+        return reranked_results
+    
+    def retrieve_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        use_reranker: bool = True,
+        rerank_top_k: int = 3,
+        search_type: str = None,
+        query_vectors: Optional[np.ndarray] = None
+    ) -> List[List[Dict]]:
+        """
+        批量检索：一次编码所有查询、一次批量向量检索、所有重排对合并打分
+        
+        Args:
+            queries: 查询列表
+            top_k / use_reranker / rerank_top_k / search_type: 同 retrieve
+            query_vectors: 已经计算好的查询向量（可选，形状为 (len(queries), dim)）
+            
+        Returns:
+            与 queries 顺序一致的检索结果列表
+        """
+        if not queries:
+            return []
+        search_type = search_type or self.search_type
+        if search_type != "similarity" and self.sparse_index is None:
+            raise ValueError(f"search_type={search_type} 需要 BM25 索引，请在初始化时设置 search_type")
+        
+        # 1. 检索
+        tracer = get_tracer()
+        if search_type == "bm25":
+            with tracer.span("search", search_type=search_type, top_k=top_k, num_queries=len(queries)):
+                all_results = [self.sparse_index.search(query, top_k=top_k) for query in queries]
+        else:
+            if query_vectors is None:
+                query_vectors = self.embedder.encode(queries, show_progress_bar=False, output="numpy")
+            with tracer.span("search", search_type=search_type, top_k=top_k, num_queries=len(queries)):
+                all_results = self.vector_db.search_batch(query_vectors, top_k=top_k)
+                if search_type == "hybrid":
+                    all_results = [
+                        fuse([results, self.sparse_index.search(query, top_k=top_k)],
+                             method="rrf", k=self.rrf_k, top_k=top_k)
+                        for query, results in zip(queries, all_results)
+                    ]
+        
+        # 2. 重排序（可选）：所有查询的 (query, document) 对按长度排序后一起打分
+        if use_reranker:
+            rerank_results = self.reranker.rerank_many(
+                queries,
+                [[r["text"] for r in results] for results in all_results],
+                top_k=rerank_top_k
+            )
+            all_results = [
+                self._apply_rerank(results, ranked)
+                for results, ranked in zip(all_results, rerank_results)
+            ]
+        
+        return all_results
+    
     def generate_answer(
         self,
         query: str,
@@ -111,24 +381,7 @@ class BasicRAG:
         Returns:
             生成的答案
         """
-        # 构建 prompt（优化版，更明确地要求使用上下文）
-        prompt = f"""你是一个专业的AI助手。请基于以下提供的上下文信息回答问题。
-
-【上下文信息】
-{context}
-
-【问题】
-{query}
-
-【要求】
-1. 仔细阅读上下文信息，提取所有相关信息
-2. 基于上下文中的内容，全面、详细地回答问题
-3. 如果上下文中包含多个相关文档，请整合所有信息，给出完整的答案
-4. 回答要有条理，可以分点说明
-5. 如果上下文中确实没有相关信息，才说"根据提供的信息，我无法回答这个问题"
-6. 尽量使用上下文中的具体内容，不要遗漏重要信息
-
-【答案】"""
+        prompt = build_answer_prompt(query, context)
         
         # 如果没有 LLM 客户端，尝试创建
         llm_client = self.llm_client
@@ -138,15 +391,59 @@ class BasicRAG:
             except Exception as e:
                 return f"[LLM Error: {e}] 请配置 LLM API Key（支持: OPENAI_API_KEY, DOUBAO_API_KEY, DASHSCOPE_API_KEY 等）"
         
+        with get_tracer().span("generate", provider=llm_client.provider, prompt_chars=len(prompt)) as span:
+            try:
+                answer = llm_client.generate(
+                    prompt=prompt,
+                    temperature=0.7,
+                    max_tokens=1000  # 增加 token 数量，允许更详细的回答
+                )
+                return answer
+            except Exception as e:
+                if span is not None:
+                    span.error = str(e)
+                return f"[LLM Error: {e}] 请检查 API Key 配置"
+    
+    def generate_answer_stream(
+        self,
+        query: str,
+        context: str,
+        llm_provider: str = None
+    ) -> Iterator[str]:
+        """
+        基于检索到的上下文流式生成答案（参数同 generate_answer）
+        
+        Yields:
+            答案文本片段；出错时输出一条错误信息
+        """
+        prompt = build_answer_prompt(query, context)
+        
+        llm_client = self.llm_client
+        if llm_client is None:
+            try:
+                llm_client = get_llm_client(provider=llm_provider)
+            except Exception as e:
+                yield f"[LLM Error: {e}] 请配置 LLM API Key（支持: OPENAI_API_KEY, DOUBAO_API_KEY, DASHSCOPE_API_KEY 等）"
+                return
+        
+        # 生成器跨 yield 不适合持有 span，这里只记录总耗时和首 token 延迟
+        tracer = get_tracer()
+        start = time.perf_counter()
+        first_token = True
         try:
-            answer = llm_client.generate(
+            for chunk in llm_client.generate_stream(
                 prompt=prompt,
                 temperature=0.7,
-                max_tokens=1000  # 增加 token 数量，允许更详细的回答
-            )
-            return answer
+                max_tokens=1000
+            ):
+                if first_token:
+                    tracer.record("generate.first_token", (time.perf_counter() - start) * 1000)
+                    first_token = False
+                yield chunk
         except Exception as e:
-            return f"[LLM Error: {e}] 请检查 API Key 配置"
+            yield f"[LLM Error: {e}] 请检查 API Key 配置"
+        finally:
+            tracer.record("generate", (time.perf_counter() - start) * 1000)
     
     def query(
         self,
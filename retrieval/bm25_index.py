@@ -0,0 +1,333 @@
+"""
+BM25 sparse index with Chinese-aware tokenization.
+中文按字符二元组（或 jieba 分词）切分，英文/数字按完整词切分，
+倒排列表使用数组存储：文档号做差分后以 varbyte 编码，词频单独存放。
+写入按段（segment）追加，段数过多时合并，检索时对所有段的倒排列表做向量化 BM25 打分。
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import jieba
+    JIEBA_AVAILABLE = True
+except ImportError:
+    JIEBA_AVAILABLE = False
+
+TOKENIZERS = ("bigram", "jieba")
+
+# CJK 统一表意文字（含扩展 A）和兼容表意文字
+_CJK_RUN = r"[㐀-䶿一-鿿豈-﫿]+"
+# 英文单词、数字以及 "ABC-123"、"v1.2" 这类编号
+_WORD = r"[a-z0-9]+(?:[-_.][a-z0-9]+)*"
+_TOKEN_PATTERN = re.compile(f"({_CJK_RUN})|({_WORD})")
+_WORD_PARTS = re.compile(r"[-_.]")
+
+
+def tokenize(text: str, tokenizer: str = "bigram") -> List[str]:
+    """
+    分词
+
+    Args:
+        text: 文本
+        tokenizer: "bigram" 中文按字符二元组切分（单字片段保留单字）；
+                   "jieba" 中文使用 jieba 搜索引擎模式分词（需要安装 jieba）
+
+    Returns:
+        词项列表；编号类词项同时保留完整形式和各组成部分
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        cjk, word = match.groups()
+        if cjk:
+            if tokenizer == "jieba":
+                tokens.extend(token for token in jieba.lcut_for_search(cjk) if token.strip())
+            elif len(cjk) == 1:
+                tokens.append(cjk)
+            else:
+                tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            tokens.append(word)
+            parts = _WORD_PARTS.split(word)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+def varbyte_encode(values: np.ndarray) -> np.ndarray:
+    """把非负整数数组编码为 varbyte 字节数组（每字节 7 位，最高位表示后面还有字节）"""
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size == 0:
+        return np.empty(0, dtype=np.uint8)
+    num_bytes = np.ones(values.shape[0], dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        num_bytes += values >= (np.uint64(1) << np.uint64(shift))
+    starts = np.cumsum(num_bytes) - num_bytes
+    out = np.empty(int(num_bytes.sum()), dtype=np.uint8)
+    for k in range(int(num_bytes.max())):
+        present = num_bytes > k
+        chunk = (values[present] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (num_bytes[present] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[present] + k] = (chunk | more).astype(np.uint8)
+    return out
+
+
+def varbyte_decode(data: np.ndarray) -> np.ndarray:
+    """解码 varbyte 字节数组"""
+    if data.size == 0:
+        return np.empty(0, dtype=np.int64)
+    data = np.asarray(data, dtype=np.uint8)
+    last = (data & 0x80) == 0
+    group = np.concatenate([[0], np.cumsum(last)[:-1]])
+    group_starts = np.concatenate([[0], np.flatnonzero(last)[:-1] + 1])
+    position = np.arange(data.shape[0]) - group_starts[group]
+    parts = (data & 0x7F).astype(np.int64) << (7 * position)
+    return np.bincount(group, weights=parts, minlength=int(last.sum())).astype(np.int64)
+
+
+class _Segment:
+    """不可变的倒排段：词项 -> (差分编码的文档号, 词频)"""
+
+    __slots__ = ("terms", "byte_offsets", "posting_offsets", "doc_bytes", "tfs")
+
+    def __init__(self, postings: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        self.terms: Dict[str, int] = {}
+        byte_chunks = []
+        tf_chunks = []
+        byte_offsets = [0]
+        posting_offsets = [0]
+        for term_id, (term, (docs, tfs)) in enumerate(postings.items()):
+            self.terms[term] = term_id
+            encoded = varbyte_encode(np.diff(docs, prepend=0))
+            byte_chunks.append(encoded)
+            tf_chunks.append(tfs)
+            byte_offsets.append(byte_offsets[-1] + encoded.shape[0])
+            posting_offsets.append(posting_offsets[-1] + docs.shape[0])
+        self.byte_offsets = np.asarray(byte_offsets, dtype=np.int64)
+        self.posting_offsets = np.asarray(posting_offsets, dtype=np.int64)
+        self.doc_bytes = np.concatenate(byte_chunks) if byte_chunks else np.empty(0, dtype=np.uint8)
+        self.tfs = (
+            np.concatenate(tf_chunks).astype(np.uint16) if tf_chunks else np.empty(0, dtype=np.uint16)
+        )
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return None
+        data = self.doc_bytes[self.byte_offsets[term_id]:self.byte_offsets[term_id + 1]]
+        docs = np.cumsum(varbyte_decode(data))
+        tfs = self.tfs[self.posting_offsets[term_id]:self.posting_offsets[term_id + 1]]
+        return docs, tfs
+
+    def nbytes(self) -> int:
+        return self.doc_bytes.nbytes + self.tfs.nbytes + self.byte_offsets.nbytes + self.posting_offsets.nbytes
+
+
+class BM25Index:
+    """BM25 稀疏检索索引"""
+
+    def __init__(
+        self,
+        tokenizer: str = "bigram",
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_segments: int = 8
+    ):
+        """
+        初始化索引
+
+        Args:
+            tokenizer: 分词方式，"bigram" 或 "jieba"（jieba 未安装时回退到 bigram）
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+            max_segments: 段数量超过该值时合并为一个段
+        """
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f"不支持的分词方式: {tokenizer}，可选: {', '.join(TOKENIZERS)}")
+        if tokenizer == "jieba" and not JIEBA_AVAILABLE:
+            print("警告: jieba 未安装，BM25 使用字符二元组分词 (pip install jieba)")
+            tokenizer = "bigram"
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+
+        self._segments: List[_Segment] = []
+        self._doc_ids: List[Optional[str]] = []
+        self._texts: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._doc_lengths = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._id_to_doc: Dict[str, int] = {}
+        self._doc_freq: Counter = Counter()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._id_to_doc)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._id_to_doc
+
+    def add_documents(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None
+    ) -> int:
+        """
+        添加文档（ID 与向量库的点 ID 一致，已存在的 ID 直接跳过）
+
+        Returns:
+            新增的文档数量
+        """
+        metadatas = metadatas or [{}] * len(texts)
+        with self._lock:
+            postings: Dict[str, Tuple[List[int], List[int]]] = {}
+            lengths = []
+            added = 0
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                if doc_id in self._id_to_doc:
+                    continue
+                doc = len(self._doc_ids)
+                self._id_to_doc[doc_id] = doc
+                self._doc_ids.append(doc_id)
+                self._texts.append(text)
+                self._metadatas.append(metadata)
+                counts = Counter(tokenize(text, self.tokenizer))
+                lengths.append(sum(counts.values()))
+                for term, tf in counts.items():
+                    entry = postings.setdefault(term, ([], []))
+                    entry[0].append(doc)
+                    entry[1].append(tf)
+                self._doc_freq.update(counts.keys())
+                added += 1
+            if not added:
+                return 0
+
+            self._doc_lengths = np.concatenate([self._doc_lengths, np.asarray(lengths, dtype=np.float32)])
+            self._alive = np.concatenate([self._alive, np.ones(added, dtype=bool)])
+            self._segments.append(_Segment({
+                term: (np.asarray(docs, dtype=np.int64), np.minimum(tfs, 65535))
+                for term, (docs, tfs) in postings.items()
+            }))
+            if len(self._segments) > self.max_segments:
+                self._merge_segments()
+            return added
+
+    def _merge_segments(self):
+        """合并所有段（各段文档号递增，按段顺序拼接即可保持有序）"""
+        merged: Dict[str, Tuple[List[np.ndarray], List[np.ndarray]]] = {}
+        for segment in self._segments:
+            for term in segment.terms:
+                docs, tfs = segment.postings(term)
+                keep = self._alive[docs]
+                entry = merged.setdefault(term, ([], []))
+                entry[0].append(docs[keep])
+                entry[1].append(tfs[keep])
+        self._segments = [_Segment({
+            term: (np.concatenate(docs), np.concatenate(tfs))
+            for term, (docs, tfs) in merged.items()
+            if sum(part.shape[0] for part in docs)
+        })]
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """删除文档（倒排条目在段合并时清理）"""
+        with self._lock:
+            deleted = 0
+            for doc_id in ids:
+                doc = self._id_to_doc.pop(doc_id, None)
+                if doc is None:
+                    continue
+                self._alive[doc] = False
+                self._doc_freq.subtract(set(tokenize(self._texts[doc], self.tokenizer)))
+                self._doc_ids[doc] = None
+                self._texts[doc] = None
+                self._metadatas[doc] = None
+                deleted += 1
+            return deleted
+
+    def score(self, query: str) -> np.ndarray:
+        """计算查询对所有文档的 BM25 分数（已删除文档为 0）"""
+        with self._lock:
+            num_docs = len(self._id_to_doc)
+            scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+            if num_docs == 0:
+                return scores
+            avg_length = float(self._doc_lengths[self._alive].mean())
+            length_norm = self.k1 * (1 - self.b + self.b * self._doc_lengths / avg_length)
+
+            for term, query_tf in Counter(tokenize(query, self.tokenizer)).items():
+                df = self._doc_freq.get(term, 0)
+                if df <= 0:
+                    continue
+                idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+                for segment in self._segments:
+                    hit = segment.postings(term)
+                    if hit is None:
+                        continue
+                    docs, tfs = hit
+                    tfs = tfs.astype(np.float32)
+                    scores[docs] += query_tf * idf * tfs * (self.k1 + 1) / (tfs + length_norm[docs])
+            scores[~self._alive] = 0.0
+            return scores
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+        """
+        BM25 检索
+
+        Returns:
+            搜索结果列表，格式同 QdrantClient.search（id, score, text, metadata）
+        """
+        scores = self.score(query)
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size == 0 or top_k <= 0:
+            return []
+        if top_k < candidates.size:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        with self._lock:
+            return [
+                {
+                    "id": self._doc_ids[doc],
+                    "score": float(scores[doc]),
+                    "text": self._texts[doc],
+                    "metadata": dict(self._metadatas[doc] or {})
+                }
+                for doc in candidates
+                if self._doc_ids[doc] is not None
+            ]
+
+    def stats(self) -> Dict[str, float]:
+        """返回索引统计"""
+        with self._lock:
+            return {
+                "documents": len(self._id_to_doc),
+                "terms": sum(1 for count in self._doc_freq.values() if count > 0),
+                "segments": len(self._segments),
+                "postings_bytes": sum(segment.nbytes() for segment in self._segments),
+            }
+
+
+if __name__ == "__main__":
+    # 示例：编号、名称类查询在 BM25 下可以精确命中
+    index = BM25Index()
+    documents = [
+        "型号 RX-7800 的额定功率为 263W，显存容量 16GB。",
+        "型号 RX-7900 的额定功率为 355W，显存容量 24GB。",
+        "人工智能是计算机科学的一个分支，致力于创建能够执行通常需要人类智能的任务的系统。",
+        "机器学习是人工智能的一个子领域，通过算法让计算机从数据中学习。",
+    ]
+    index.add_documents([f"doc-{i}" for i in range(len(documents))], documents)
+    print(f"分词示例: {tokenize('RX-7800 的显存是多少？')}")
+    for query in ["RX-7800 的显存是多少？", "什么是机器学习"]:
+        print(f"\n查询: {query}")
+        for hit in index.search(query, top_k=2):
+            print(f"  {hit['score']:.3f}  {hit['text']}")
+    print(f"\n索引统计: {index.stats()}")
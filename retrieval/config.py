@@ -0,0 +1,35 @@
+"""
+Configuration loader for config.yaml.
+"""
+
+import copy
+import os
+from typing import Any, Dict, Optional
+
+import yaml
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIG_PATH = os.path.join(project_root, "config.yaml")
+
+_config_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def load_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    加载 YAML 配置文件
+    
+    Args:
+        path: 配置文件路径，None 表示读取环境变量 RAG_CONFIG，仍为空则使用项目根目录的 config.yaml
+        
+    Returns:
+        配置字典（副本，可以安全修改）；文件不存在时返回空字典
+    """
+    path = os.path.abspath(path or os.getenv("RAG_CONFIG") or DEFAULT_CONFIG_PATH)
+    if path not in _config_cache:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                _config_cache[path] = yaml.safe_load(f) or {}
+        else:
+            print(f"警告: 配置文件不存在: {path}，使用默认配置")
+            _config_cache[path] = {}
+    return copy.deepcopy(_config_cache[path])
@@ -0,0 +1,198 @@
+"""
+Array-based result fusion for multi-query retrieval.
+先把多个排序列表展平为 (文档编号, 列表编号, 排名, 分数) 数组，
+再用 bincount / ufunc.at 一次性算出融合分数，并用 partition 只对 top-k 候选排序。
+已经持有 ID/分数数组的调用方可以直接使用 fuse_arrays + top_k_indices。
+"""
+
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FUSION_METHODS = ("rrf", "weighted_average", "union", "combsum", "combmnz")
+
+
+def flatten_ranked_lists(
+    ranked_lists: Sequence[Sequence[Dict]]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, List[Dict]]:
+    """
+    把多个排序列表展平为数组
+
+    Args:
+        ranked_lists: 多个排序列表（每个元素为 search 返回的结果字典）
+
+    Returns:
+        (doc_ids, list_ids, ranks, scores, docs)：
+        doc_ids 为按首次出现顺序编号的文档编号（优先按 ID 去重，没有 ID 时使用文本的 MD5），
+        ranks 从 1 开始，docs 为每条命中对应的原始结果字典
+    """
+    key_to_idx: Dict[str, int] = {}
+    md5 = hashlib.md5
+    doc_ids: List[int] = []
+    list_ids = []
+    ranks = []
+    scores: List[float] = []
+    docs: List[Dict] = []
+    for list_idx, ranked_list in enumerate(ranked_lists):
+        keys = [
+            doc.get("id") or md5(doc.get("text", "").strip().encode()).hexdigest()
+            for doc in ranked_list
+        ]
+        doc_ids.extend([key_to_idx.setdefault(key, len(key_to_idx)) for key in keys])
+        scores.extend([doc.get("score", 0.0) or 0.0 for doc in ranked_list])
+        docs.extend(ranked_list)
+        list_ids.append(np.full(len(ranked_list), list_idx, dtype=np.int64))
+        ranks.append(np.arange(1, len(ranked_list) + 1, dtype=np.float64))
+    if not docs:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0), np.empty(0), docs
+    return (
+        np.asarray(doc_ids, dtype=np.int64),
+        np.concatenate(list_ids),
+        np.concatenate(ranks),
+        np.asarray(scores, dtype=np.float64),
+        docs,
+    )
+
+
+def _normalize_scores(list_ids: np.ndarray, scores: np.ndarray, num_lists: int) -> np.ndarray:
+    """每个列表内部做 min-max 归一化（列表内分数相同时记为 1）"""
+    minima = np.full(num_lists, np.inf)
+    maxima = np.full(num_lists, -np.inf)
+    np.minimum.at(minima, list_ids, scores)
+    np.maximum.at(maxima, list_ids, scores)
+    spread = (maxima - minima)[list_ids]
+    normalized = np.ones_like(scores)
+    nonzero = spread > 0
+    normalized[nonzero] = (scores[nonzero] - minima[list_ids][nonzero]) / spread[nonzero]
+    return normalized
+
+
+def fuse_arrays(
+    doc_ids: np.ndarray,
+    list_ids: np.ndarray,
+    ranks: np.ndarray,
+    scores: np.ndarray,
+    num_docs: int,
+    num_lists: int,
+    method: str = "rrf",
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None
+) -> np.ndarray:
+    """
+    在展平后的数组上计算每个文档的融合分数
+
+    Args:
+        doc_ids / list_ids / ranks / scores: flatten_ranked_lists 的输出
+        num_docs: 文档数量
+        num_lists: 排序列表数量
+        method: 融合方法
+            - "rrf": sum(w / (k + rank))
+            - "weighted_average": 归一化分数的加权平均（未命中的列表记为 0）
+            - "union": 所有列表的并集，按最高原始分数排序
+            - "combsum": 归一化分数之和
+            - "combmnz": combsum × 命中的列表数
+        k: RRF 参数
+        weights: 每个列表的权重，None 表示等权
+
+    Returns:
+        长度为 num_docs 的融合分数数组
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"不支持的融合方法: {method}，可选: {', '.join(FUSION_METHODS)}")
+
+    list_weights = np.ones(num_lists) if weights is None else np.asarray(weights, dtype=np.float64)
+    if list_weights.shape[0] != num_lists:
+        raise ValueError(f"weights 长度 ({list_weights.shape[0]}) 与列表数量 ({num_lists}) 不一致")
+    hit_weights = list_weights[list_ids]
+
+    if method == "rrf":
+        return np.bincount(doc_ids, weights=hit_weights / (k + ranks), minlength=num_docs)
+
+    if method == "union":
+        fused = np.full(num_docs, -np.inf)
+        np.maximum.at(fused, doc_ids, scores)
+        return fused
+
+    normalized = _normalize_scores(list_ids, scores, num_lists)
+    if method == "weighted_average":
+        total = list_weights.sum()
+        weighted = np.bincount(doc_ids, weights=hit_weights * normalized, minlength=num_docs)
+        return weighted / total if total > 0 else weighted
+
+    combsum = np.bincount(doc_ids, weights=hit_weights * normalized, minlength=num_docs)
+    if method == "combsum":
+        return combsum
+    return combsum * np.bincount(doc_ids, minlength=num_docs)
+
+
+def top_k_indices(values: np.ndarray, top_k: Optional[int] = None) -> np.ndarray:
+    """
+    返回分数最高的 top_k 个下标（降序；分数相同时下标小的在前）
+
+    只对 partition 选出的候选排序，top_k 远小于文档数时避免全量排序。
+    """
+    n = values.shape[0]
+    if top_k is None or top_k >= n:
+        candidates = np.arange(n)
+    elif top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    else:
+        threshold = np.partition(values, n - top_k)[n - top_k]
+        # 包含所有与第 top_k 名同分的候选，保证并列时的顺序稳定
+        candidates = np.flatnonzero(values >= threshold)
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order][:top_k]
+
+
+def fuse(
+    ranked_lists: Sequence[Sequence[Dict]],
+    method: str = "rrf",
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None,
+    top_k: Optional[int] = None
+) -> List[Dict]:
+    """
+    融合多个排序列表
+
+    Args:
+        ranked_lists: 多个排序列表
+        method: 融合方法（见 fuse_arrays）
+        k: RRF 参数，通常为 60
+        weights: 每个列表的权重，None 表示等权
+        top_k: 只返回前 top_k 个结果，None 表示全部返回
+
+    Returns:
+        融合后的排序列表；同一文档保留原始分数最高的那条结果，
+        并写入 fusion_score 字段
+    """
+    doc_ids, list_ids, ranks, scores, docs = flatten_ranked_lists(ranked_lists)
+    if doc_ids.size == 0:
+        return []
+    num_docs = int(doc_ids.max()) + 1
+
+    fused = fuse_arrays(
+        doc_ids, list_ids, ranks, scores,
+        num_docs=num_docs,
+        num_lists=len(ranked_lists),
+        method=method,
+        k=k,
+        weights=weights
+    )
+
+    # 每个文档的代表结果：原始分数最高的命中，分数相同时取最先出现的
+    best_score = np.full(num_docs, -np.inf)
+    np.maximum.at(best_score, doc_ids, scores)
+    candidates = np.flatnonzero(scores == best_score[doc_ids])
+    best_hit = np.full(num_docs, doc_ids.size, dtype=np.int64)
+    np.minimum.at(best_hit, doc_ids[candidates], candidates)
+
+    fused_results = []
+    for doc_idx in top_k_indices(fused, top_k):
+        doc = dict(docs[best_hit[doc_idx]])
+        doc["fusion_score"] = float(fused[doc_idx])
+        if "score" not in doc:
+            doc["score"] = 0.0
+        fused_results.append(doc)
+    return fused_results
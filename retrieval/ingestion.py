@@ -0,0 +1,251 @@
+"""
+Streaming document ingestion pipeline.
+读取 data/documents 下的文件 → 递归分隔符切分 → 批量向量化 → 分批写入向量库。
+整个流程基于生成器，任意时刻只在内存中保留一个批次，内存占用与语料规模无关。
+
+点 ID 由 (来源, 块内容) 确定性生成，增量模式下：
+未变化的块直接跳过（不重新向量化），新增/修改的块写入，已消失的块被删除。
+"""
+
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from retrieval.config import load_config
+from retrieval.text_splitter import RecursiveTextSplitter
+from storage.qdrant_wrapper import make_point_id
+
+DEFAULT_DOCUMENTS_DIR = os.path.join(project_root, "data", "documents")
+
+# (文本, 元数据)
+Record = Tuple[str, Dict[str, Any]]
+
+
+class IngestionPipeline:
+    """流式入库流程：文件 → 分块 → 向量化 → 写入"""
+
+    def __init__(
+        self,
+        embedder,
+        vector_db,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+        separators: Optional[List[str]] = None,
+        batch_size: int = 64,
+        file_extensions: Sequence[str] = (".txt", ".md"),
+        sparse_index=None
+    ):
+        """
+        初始化入库流程
+
+        Args:
+            embedder: EmbeddingModel 或 EncodePool 实例
+            vector_db: 向量库客户端（QdrantClient 或兼容接口）
+            chunk_size: 块大小（字符数）
+            chunk_overlap: 块重叠（字符数）
+            separators: 分隔符列表，None 使用默认值
+            batch_size: 每批向量化并写入的块数量
+            file_extensions: 需要读取的文件扩展名
+            sparse_index: BM25Index（可选），与向量库同步写入和删除
+        """
+        self.embedder = embedder
+        self.vector_db = vector_db
+        self.sparse_index = sparse_index
+        self.splitter = RecursiveTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=separators
+        )
+        self.batch_size = batch_size
+        self.file_extensions = tuple(ext.lower() for ext in file_extensions)
+
+    @classmethod
+    def from_config(
+        cls,
+        embedder,
+        vector_db,
+        config: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> "IngestionPipeline":
+        """使用 config.yaml 中的 document 配置创建入库流程"""
+        config = config if config is not None else load_config()
+        document_config = config.get("document", {})
+        params = {
+            "chunk_size": document_config.get("chunk_size", 500),
+            "chunk_overlap": document_config.get("chunk_overlap", 50),
+            "separators": document_config.get("separators"),
+        }
+        params.update(kwargs)
+        return cls(embedder, vector_db, **params)
+
+    def iter_files(self, directory: str) -> Iterator[str]:
+        """按文件名顺序遍历目录下所有匹配扩展名的文件"""
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(self.file_extensions):
+                    yield os.path.join(root, name)
+
+    def iter_documents(self, directory: str) -> Iterator[Record]:
+        """逐个读取文件内容"""
+        for path in self.iter_files(directory):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            yield text, {
+                "source": os.path.relpath(path, directory),
+                "ingest_root": os.path.abspath(directory),
+            }
+
+    def iter_chunks(self, documents: Iterable[Record]) -> Iterator[Record]:
+        """将文档切分为块，元数据中记录来源和块序号"""
+        for text, metadata in documents:
+            for chunk_index, chunk in enumerate(self.splitter.iter_chunks(text)):
+                yield chunk, {**metadata, "chunk_index": chunk_index}
+
+    @staticmethod
+    def iter_batches(records: Iterable[Record], batch_size: int) -> Iterator[List[Record]]:
+        """将记录流分组为固定大小的批次"""
+        batch: List[Record] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def ingest(
+        self,
+        documents: Iterable[Record],
+        incremental: bool = True,
+        prune: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, float]:
+        """
+        对任意 (文本, 元数据) 流执行分块、向量化和写入
+
+        Args:
+            documents: (文本, 元数据) 流
+            incremental: 是否跳过集合中已存在的块（按确定性 ID 判断）
+            prune: 删除范围，例如 {"ingest_root": "/path"}：该范围内本次未出现的块会被删除；
+                   None 表示不删除
+
+        Returns:
+            统计信息：documents, chunks, embedded, skipped, deleted, seconds,
+            docs_per_sec, chunks_per_sec
+        """
+        stats = {"documents": 0, "chunks": 0, "embedded": 0, "skipped": 0, "deleted": 0}
+        seen_ids = set()
+
+        def counted(records: Iterable[Record]) -> Iterator[Record]:
+            for record in records:
+                stats["documents"] += 1
+                yield record
+
+        start = time.perf_counter()
+        chunks = self.iter_chunks(counted(documents))
+        # 多进程编码池（EncodePool）需要足够大的批次才能让所有进程同时工作
+        batch_size = max(self.batch_size, getattr(self.embedder, "preferred_batch_size", 0))
+        for batch in self.iter_batches(chunks, batch_size):
+            stats["chunks"] += len(batch)
+            ids = [make_point_id(text, str(metadata.get("source", ""))) for text, metadata in batch]
+            seen_ids.update(ids)
+            if self.sparse_index is not None:
+                # 稀疏索引按 ID 去重，已入库的块也写入（进程重启后稀疏索引需要重建）
+                self.sparse_index.add_documents(
+                    ids, [text for text, _ in batch], [metadata for _, metadata in batch]
+                )
+
+            if incremental:
+                existing = self.vector_db.existing_ids(ids)
+                batch = [record for record, point_id in zip(batch, ids) if point_id not in existing]
+                stats["skipped"] += len(ids) - len(batch)
+
+            if batch:
+                texts = [text for text, _ in batch]
+                metadatas = [metadata for _, metadata in batch]
+                embeddings = self.embedder.encode(texts, show_progress_bar=False, output="numpy")
+                self.vector_db.add_documents(texts, embeddings, metadatas)
+                stats["embedded"] += len(batch)
+
+            elapsed = time.perf_counter() - start
+            print(
+                f"  已处理 {stats['documents']} 个文档 / {stats['chunks']} 个块"
+                f"（跳过 {stats['skipped']}），{stats['documents'] / elapsed:.2f} docs/s"
+            )
+
+        if prune is not None:
+            stale_ids = self.vector_db.scroll_ids(prune) - seen_ids
+            stats["deleted"] = self.vector_db.delete_points(stale_ids)
+            if self.sparse_index is not None:
+                self.sparse_index.delete(stale_ids)
+
+        elapsed = time.perf_counter() - start
+        stats["seconds"] = elapsed
+        stats["docs_per_sec"] = stats["documents"] / elapsed if elapsed > 0 else 0.0
+        stats["chunks_per_sec"] = stats["chunks"] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+    def run(self, directory: Optional[str] = None, incremental: bool = True) -> Dict[str, float]:
+        """
+        对目录中的文件执行完整入库流程
+
+        Args:
+            directory: 文档目录，None 表示 data/documents
+            incremental: 增量同步：跳过未变化的块，并删除该目录下已消失的块
+
+        Returns:
+            统计信息
+        """
+        directory = directory or DEFAULT_DOCUMENTS_DIR
+        print(f"开始入库: {directory}")
+        prune = {"ingest_root": os.path.abspath(directory)} if incremental else None
+        stats = self.ingest(self.iter_documents(directory), incremental=incremental, prune=prune)
+        print(
+            f"入库完成: {stats['documents']} 个文档，{stats['chunks']} 个块"
+            f"（新写入 {stats['embedded']}，跳过 {stats['skipped']}，删除 {stats['deleted']}），"
+            f"耗时 {stats['seconds']:.2f}s，{stats['docs_per_sec']:.2f} docs/s，"
+            f"{stats['chunks_per_sec']:.2f} chunks/s"
+        )
+        return stats
+
+
+if __name__ == "__main__":
+    # 示例：将 data/documents 下的文件入库
+    # python retrieval/ingestion.py [目录] [--workers N] [--threads-per-worker T]
+    import argparse
+
+    from embeddings.embed_model import EmbeddingModel
+    from embeddings.encode_pool import EncodePool
+    from storage.factory import create_vector_store
+
+    parser = argparse.ArgumentParser(description="将目录中的文件分块入库")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_DOCUMENTS_DIR)
+    parser.add_argument("--workers", type=int, default=0, help="多进程编码池的进程数，0 表示单进程编码")
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    args = parser.parse_args()
+
+    # 与 BasicRAG 使用同一个向量库（config.yaml 的 vector_store）
+    store_config = load_config().get("vector_store", {})
+    vector_db = create_vector_store(
+        store_type=store_config.get("type", "qdrant"),
+        url=store_config.get("url", "http://localhost:6333"),
+        collection_name=store_config.get("collection_name", "rag_documents"),
+        store_config=store_config
+    )
+    if args.workers:
+        embedder = EncodePool(num_workers=args.workers, threads_per_worker=args.threads_per_worker)
+    else:
+        embedder = EmbeddingModel()
+    vector_db.create_collection(vector_size=embedder.get_dimension())
+
+    try:
+        pipeline = IngestionPipeline.from_config(embedder, vector_db)
+        pipeline.run(args.directory)
+    finally:
+        embedder.close()
@@ -5,21 +5,77 @@ Day 8-10: RAG-Fusion 与查询增强
 
 import sys
 import os
-from typing import List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+import numpy as np
 from dotenv import load_dotenv
-from collections import defaultdict
 
 # 添加项目根目录到 Python 路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from embeddings.embed_model import EmbeddingModel
-from storage.qdrant_wrapper import QdrantClient
+from storage.factory import create_vector_store
 from llm.llm_client import get_llm_client
+from retrieval.answer_cache import LRUTTLCache
+from retrieval.config import load_config
+from retrieval.fusion import fuse
+from observability.tracing import get_tracer
 
 load_dotenv()
 
 
+def build_rewrite_prompt(original_query: str, num_queries: int) -> str:
+    """构建查询改写 prompt"""
+    return f"""基于以下问题，生成 {num_queries} 个不同角度的问题，这些问题应该：
+1. 从不同角度询问相同或相关的信息
+2. 使用不同的表达方式
+3. 涵盖问题的不同方面
+
+原始问题：{original_query}
+
+请只返回问题列表，每行一个问题，不要编号："""
+
+
+def parse_rewrites(response: str, original_query: str, num_queries: int) -> List[str]:
+    """解析 LLM 返回的改写查询（每行一个），并确保包含原始查询"""
+    queries = response.strip().split("\n")
+    queries = [q.strip() for q in queries if q.strip()]
+    # 确保包含原始查询
+    if original_query not in queries:
+        queries.insert(0, original_query)
+    return queries[:num_queries]
+
+
+def fallback_rewrites(original_query: str, num_queries: int) -> List[str]:
+    """简单的启发式改写（没有 LLM 时使用）"""
+    return [
+        original_query,
+        f"请详细解释{original_query}",
+        f"关于{original_query}，你能告诉我什么？"
+    ][:num_queries]
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: List[List[Dict]],
+    k: int = 60,
+    top_k: Optional[int] = None
+) -> List[Dict]:
+    """
+    Reciprocal Rank Fusion (RRF) 算法
+    
+    Args:
+        ranked_lists: 多个排序列表
+        k: RRF 参数，通常为 60
+        top_k: 只返回前 top_k 个结果，None 表示全部返回
+        
+    Returns:
+        融合后的排序列表
+    """
+    return fuse(ranked_lists, method="rrf", k=k, top_k=top_k)
+
+
 class RAGFusion:
     """RAG-Fusion: 多查询融合检索"""
     
@@ -28,13 +84,56 @@ class RAGFusion:
         embedding_model_name: str = "BAAI/bge-large-zh",
         qdrant_url: str = "http://localhost:6333",
         collection_name: str = "rag_documents",
-        llm_provider: str = None  # None 表示从环境变量读取
+        llm_provider: str = None,  # None 表示从环境变量读取
+        embedding_cache_dir: str = None,  # None 表示读取 EMBEDDING_CACHE_DIR，未设置则不缓存
+        rewrite_mode: str = "llm",
+        rewrite_cache_size: int = 1024,
+        rewrite_cache_ttl: Optional[float] = 3600.0,
+        max_concurrent_rewrites: Optional[int] = None,
+        fusion_method: Optional[str] = None,
+        rrf_k: Optional[int] = None,
+        vector_store_type: Optional[str] = None
     ):
-        """初始化 RAG-Fusion 系统"""
-        self.embedder = EmbeddingModel(model_name=embedding_model_name)
-        self.vector_db = QdrantClient(
+        """
+        初始化 RAG-Fusion 系统
+        
+        Args:
+            rewrite_mode: 查询改写模式
+                - "llm": 使用 LLM 改写（temperature=0.7）
+                - "deterministic": 使用 LLM 改写（temperature=0，结果稳定，适合缓存）
+                - "local": 不调用 LLM，使用本地启发式改写
+            rewrite_cache_size: 改写缓存的最大条目数，0 表示不缓存
+            rewrite_cache_ttl: 改写缓存的存活秒数，None 表示永不过期
+            max_concurrent_rewrites: 同时进行的 LLM 改写请求上限，超出时降级为本地改写；
+                                     None 表示不限制
+            fusion_method: 融合方法（rrf, weighted_average, union, combsum, combmnz），
+                           None 表示读取 config.yaml 中的 rag_fusion.fusion_method
+            rrf_k: RRF 参数，None 表示读取 config.yaml 中的 rag_fusion.rrf_k
+            vector_store_type: 向量库后端（qdrant, local），None 表示读取 config.yaml 中的 vector_store.type
+        """
+        config = load_config()
+        fusion_config = config.get("rag_fusion", {})
+        self.fusion_method = fusion_method or fusion_config.get("fusion_method", "rrf")
+        self.rrf_k = rrf_k if rrf_k is not None else fusion_config.get("rrf_k", 60)
+        if rewrite_mode not in ("llm", "deterministic", "local"):
+            raise ValueError(f"不支持的改写模式: {rewrite_mode}，可选: llm, deterministic, local")
+        self.rewrite_mode = rewrite_mode
+        self.rewrite_cache = LRUTTLCache(max_size=rewrite_cache_size, ttl=rewrite_cache_ttl) if rewrite_cache_size else None
+        self._rewrite_slots = (
+            threading.BoundedSemaphore(max_concurrent_rewrites)
+            if max_concurrent_rewrites else None
+        )
+
+        self.embedder = EmbeddingModel(
+            model_name=embedding_model_name,
+            cache_dir=embedding_cache_dir
+        )
+        store_config = config.get("vector_store", {})
+        self.vector_db = create_vector_store(
+            store_type=vector_store_type or store_config.get("type", "qdrant"),
             url=qdrant_url,
-            collection_name=collection_name
+            collection_name=collection_name,
+            store_config=store_config
         )
         # 初始化 LLM 客户端
         try:
@@ -60,14 +159,18 @@ class RAGFusion:
         Returns:
             改写后的查询列表
         """
-        prompt = f"""基于以下问题，生成 {num_queries} 个不同角度的问题，这些问题应该：
-1. 从不同角度询问相同或相关的信息
-2. 使用不同的表达方式
-3. 涵盖问题的不同方面
-
-原始问题：{original_query}
-
-请只返回问题列表，每行一个问题，不要编号："""
+        with get_tracer().span("rewrite", mode=self.rewrite_mode, num_queries=num_queries):
+            return self._generate_queries(original_query, num_queries, llm_provider)
+    
+    def _generate_queries(
+        self,
+        original_query: str,
+        num_queries: int,
+        llm_provider: Optional[str]
+    ) -> List[str]:
+        """generate_queries 的实现（在 rewrite span 内执行）"""
+        if self.rewrite_mode == "local":
+            return fallback_rewrites(original_query, num_queries)
         
         # 如果没有 LLM 客户端，尝试创建
         llm_client = self.llm_client
@@ -78,25 +181,42 @@ class RAGFusion:
                 print(f"[LLM Error: {e}] 使用原始查询")
                 return [original_query]
         
+        cache_key = (
+            original_query,
+            num_queries,
+            llm_client.provider,
+            llm_client.model_name,
+            self.rewrite_mode
+        )
+        tracer = get_tracer()
+        if self.rewrite_cache is not None:
+            cached = self.rewrite_cache.get(cache_key)
+            tracer.set_attribute("cache_hit", cached is not None)
+            tracer.increment("rewrite_cache.hit" if cached is not None else "rewrite_cache.miss")
+            if cached is not None:
+                return list(cached)
+        
+        # 并发改写请求过多时降级为本地改写，避免排队等待 LLM
+        if self._rewrite_slots is not None and not self._rewrite_slots.acquire(blocking=False):
+            print("[Rewrite] LLM 改写并发已满，使用本地改写")
+            return fallback_rewrites(original_query, num_queries)
+        
         try:
             response = llm_client.generate(
-                prompt=prompt,
-                temperature=0.7
+                prompt=build_rewrite_prompt(original_query, num_queries),
+                temperature=0.0 if self.rewrite_mode == "deterministic" else 0.7
             )
-            queries = response.strip().split("\n")
-            queries = [q.strip() for q in queries if q.strip()]
-            # 确保包含原始查询
-            if original_query not in queries:
-                queries.insert(0, original_query)
-            return queries[:num_queries]
+            queries = parse_rewrites(response, original_query, num_queries)
         except Exception as e:
             print(f"[LLM Error: {e}] 使用原始查询")
-            # 简单的启发式改写（如果没有 LLM）
-            return [
-                original_query,
-                f"请详细解释{original_query}",
-                f"关于{original_query}，你能告诉我什么？"
-            ][:num_queries]
+            return fallback_rewrites(original_query, num_queries)
+        finally:
+            if self._rewrite_slots is not None:
+                self._rewrite_slots.release()
+        
+        if self.rewrite_cache is not None:
+            self.rewrite_cache.set(cache_key, tuple(queries))
+        return queries
     
     def reciprocal_rank_fusion(
         self,
@@ -113,59 +233,15 @@ class RAGFusion:
         Returns:
             融合后的排序列表
         """
-        # 计算每个文档的 RRF 分数
-        doc_scores = defaultdict(float)
-        doc_map = {}  # 存储文档内容，使用文本内容作为唯一标识
-        
-        for list_idx, ranked_list in enumerate(ranked_lists):
-            for rank, doc in enumerate(ranked_list, 1):
-                # 使用文档 ID 作为唯一标识（优先），如果没有 ID 则使用文本内容
-                doc_id = doc.get("id")
-                doc_text = doc.get("text", "").strip()
-                
-                # 如果没有 ID，使用文本内容的 hash 作为 ID
-                if not doc_id:
-                    import hashlib
-                    doc_id = hashlib.md5(doc_text.encode()).hexdigest()
-                
-                # 如果文档已存在，保留分数更高的那个
-                if doc_id in doc_map:
-                    # 保留原始相似度分数更高的文档
-                    existing_score = doc_map[doc_id].get("score", 0)
-                    current_score = doc.get("score", 0)
-                    if current_score > existing_score:
-                        doc_map[doc_id] = doc.copy()
-                else:
-                    doc_map[doc_id] = doc.copy()
-                
-                # 累加 RRF 分数
-                doc_scores[doc_id] += 1 / (k + rank)
-        
-        # 按 RRF 分数排序
-        sorted_docs = sorted(
-            doc_scores.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
-        
-        # 返回融合后的文档列表
-        fused_results = []
-        for doc_id, fusion_score in sorted_docs:
-            doc = doc_map[doc_id].copy()
-            doc["fusion_score"] = fusion_score
-            # 保留原始相似度分数
-            if "score" not in doc:
-                doc["score"] = 0.0
-            fused_results.append(doc)
-        
-        return fused_results
+        return reciprocal_rank_fusion(ranked_lists, k=k)
     
     def retrieve_fusion(
         self,
         query: str,
         num_queries: int = 3,
         top_k_per_query: int = 5,
-        final_top_k: int = 5
+        final_top_k: int = 5,
+        query_vector: Optional[np.ndarray] = None
     ) -> List[Dict]:
         """
         RAG-Fusion 检索流程
@@ -175,6 +251,7 @@ class RAGFusion:
             num_queries: 生成查询数量
             top_k_per_query: 每个查询检索的数量
             final_top_k: 最终返回数量
+            query_vector: 原始查询已经计算好的向量（可选，改写结果中的原始查询不再重复编码）
             
         Returns:
             融合后的检索结果
@@ -185,26 +262,89 @@ class RAGFusion:
         for i, q in enumerate(queries, 1):
             print(f"  {i}. {q}")
         
-        # 2. 对每个查询进行检索
-        all_results = []
-        for i, q in enumerate(queries, 1):
-            query_vector = self.embedder.encode(q)
-            results = self.vector_db.search(query_vector, top_k=top_k_per_query)
-            all_results.append(results)
+        # 2. 批量编码所有查询，并在一次批量请求中完成检索
+        to_encode = [q for q in queries if query_vector is None or q != query]
+        encoded = iter(self.embedder.encode(to_encode, show_progress_bar=False, output="numpy") if to_encode else [])
+        query_vectors = np.stack([
+            np.asarray(query_vector, dtype=np.float32).reshape(-1)
+            if query_vector is not None and q == query else next(encoded)
+            for q in queries
+        ])
+        with get_tracer().span("search", num_queries=len(queries), top_k=top_k_per_query):
+            all_results = self.vector_db.search_batch(query_vectors, top_k=top_k_per_query)
+        
+        for i, results in enumerate(all_results, 1):
             # 调试信息
             print(f"  查询 {i} 检索到 {len(results)} 个结果")
             if results:
                 unique_texts = set(r.get("text", "") for r in results)
                 print(f"    唯一文档: {len(unique_texts)}")
         
-        # 3. 融合结果（使用 RRF）
-        fused_results = self.reciprocal_rank_fusion(all_results)
+        # 3. 融合结果（默认使用 RRF，只对前 final_top_k 个结果排序）
+        with get_tracer().span("fusion", method=self.fusion_method):
+            fused_results = fuse(
+                all_results,
+                method=self.fusion_method,
+                k=self.rrf_k,
+                top_k=final_top_k
+            )
         
         # 调试信息：检查融合后的结果
         unique_after_fusion = set(doc.get("text", "") for doc in fused_results)
-        print(f"\n融合后: {len(fused_results)} 个结果，{len(unique_after_fusion)} 个唯一文档")
+        print(f"\n融合后 ({self.fusion_method}): {len(fused_results)} 个结果，{len(unique_after_fusion)} 个唯一文档")
+        
+        return fused_results
+    
+    def retrieve_fusion_many(
+        self,
+        queries: List[str],
+        num_queries: int = 3,
+        top_k_per_query: int = 5,
+        final_top_k: int = 5,
+        concurrency: int = 8
+    ) -> List[List[Dict]]:
+        """
+        批量 RAG-Fusion 检索：改写并发进行，所有改写查询一次编码、一次批量检索
+        
+        Args:
+            queries: 原始查询列表
+            num_queries / top_k_per_query / final_top_k: 同 retrieve_fusion
+            concurrency: 同时进行的改写请求数量
+            
+        Returns:
+            与 queries 顺序一致的融合结果列表
+        """
+        if not queries:
+            return []
+        
+        # 1. 并发生成改写查询（LLM 调用是 I/O 等待，线程池即可；配额由 LLM 调度器控制）
+        if self.llm_client is not None:
+            concurrency = min(concurrency, self.llm_client.scheduler.max_concurrency)
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(queries)))) as executor:
+            rewrites = list(executor.map(
+                lambda q: self.generate_queries(q, num_queries=num_queries),
+                queries
+            ))
+        
+        # 2. 所有改写查询合并为一个批次编码和检索
+        flat_queries = [q for group in rewrites for q in group]
+        query_vectors = self.embedder.encode(flat_queries, show_progress_bar=False, output="numpy")
+        with get_tracer().span("search", num_queries=len(flat_queries), top_k=top_k_per_query):
+            flat_results = self.vector_db.search_batch(query_vectors, top_k=top_k_per_query)
         
-        return fused_results[:final_top_k]
+        # 3. 按原始查询分组融合
+        fused = []
+        offset = 0
+        for group in rewrites:
+            fused.append(fuse(
+                flat_results[offset:offset + len(group)],
+                method=self.fusion_method,
+                k=self.rrf_k,
+                top_k=final_top_k
+            ))
+            offset += len(group)
+        print(f"批量融合检索: {len(queries)} 个查询，{len(flat_queries)} 个改写查询")
+        return fused
 
 
 if __name__ == "__main__":
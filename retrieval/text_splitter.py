@@ -0,0 +1,105 @@
+"""
+Recursive separator-based text splitter.
+按 config.yaml 中 document.separators 的顺序递归切分文本，
+再将小片段合并为不超过 chunk_size 的块，相邻块之间保留 chunk_overlap 的重叠。
+"""
+
+from typing import Iterator, List, Optional
+
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", "。", "！", "？", " ", ""]
+
+
+class RecursiveTextSplitter:
+    """递归分隔符切分器"""
+    
+    def __init__(
+        self,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+        separators: Optional[List[str]] = None
+    ):
+        """
+        初始化切分器
+        
+        Args:
+            chunk_size: 每个块的最大字符数
+            chunk_overlap: 相邻块之间的重叠字符数
+            separators: 分隔符列表，按优先级从高到低排列，"" 表示按字符切分
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError(
+                f"chunk_overlap ({chunk_overlap}) 必须小于 chunk_size ({chunk_size})"
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators if separators is not None else DEFAULT_SEPARATORS
+    
+    def split_text(self, text: str) -> List[str]:
+        """切分文本，返回块列表"""
+        return list(self.iter_chunks(text))
+    
+    def iter_chunks(self, text: str) -> Iterator[str]:
+        """逐块生成切分结果"""
+        for chunk in self._split(text, self.separators):
+            chunk = chunk.strip()
+            if chunk:
+                yield chunk
+    
+    def _split(self, text: str, separators: List[str]) -> Iterator[str]:
+        # 选择文本中出现的第一个分隔符
+        separator = ""
+        remaining: List[str] = []
+        for i, sep in enumerate(separators):
+            if sep == "" or sep in text:
+                separator = sep
+                remaining = separators[i + 1:]
+                break
+        
+        small_pieces: List[str] = []
+        for piece in self._split_keep_separator(text, separator):
+            if len(piece) <= self.chunk_size:
+                small_pieces.append(piece)
+                continue
+            
+            # 过长的片段：先输出已积累的小片段，再用下一级分隔符递归切分
+            if small_pieces:
+                yield from self._merge(small_pieces)
+                small_pieces = []
+            if remaining:
+                yield from self._split(piece, remaining)
+            else:
+                yield piece
+        
+        if small_pieces:
+            yield from self._merge(small_pieces)
+    
+    @staticmethod
+    def _split_keep_separator(text: str, separator: str) -> List[str]:
+        """按分隔符切分，分隔符保留在前一个片段末尾（例如句号留在句尾）"""
+        if separator == "":
+            return list(text)
+        parts = text.split(separator)
+        pieces = [part + separator for part in parts[:-1]]
+        if parts[-1]:
+            pieces.append(parts[-1])
+        return [piece for piece in pieces if piece]
+    
+    def _merge(self, pieces: List[str]) -> Iterator[str]:
+        """将小片段合并为不超过 chunk_size 的块，并保留重叠"""
+        current: List[str] = []
+        total = 0
+        for piece in pieces:
+            length = len(piece)
+            if current and total + length > self.chunk_size:
+                yield "".join(current)
+                # 从头部丢弃片段，直到剩余部分不超过重叠长度且能容纳新片段
+                while current and (
+                    total > self.chunk_overlap
+                    or total + length > self.chunk_size
+                ):
+                    total -= len(current.pop(0))
+            current.append(piece)
+            total += length
+        if current:
+            yield "".join(current)
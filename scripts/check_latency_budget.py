@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+检查各阶段 p99 延迟是否超出预算（回归门禁）
+使用方法: python scripts/check_latency_budget.py <summary.json> [--config config.yaml] [--percentile 99]
+
+summary.json 由 Tracer.export_json() 生成，预算读取 config.yaml 的 observability.p99_budget_ms。
+有阶段超出预算时以非零状态码退出。
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from observability.tracing import budget_violations
+from retrieval.config import load_config
+
+
+def check_summary(summary: dict, budgets: dict, percentile: int = 99) -> list:
+    """
+    对照预算检查 Tracer.summary() 的结果（比较逻辑同 Tracer.check_budgets）
+
+    Args:
+        summary: Tracer.summary() 的结果
+        budgets: {阶段名: 预算毫秒数}
+        percentile: 比较的百分位数（summary 中需有对应的 p<percentile>_ms 字段）
+
+    Returns:
+        超出预算的描述列表
+    """
+    latencies = {
+        name: stats[f"p{percentile}_ms"]
+        for name, stats in summary.get("stages", {}).items() if stats.get("count")
+    }
+    return budget_violations(latencies, budgets, percentile)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查各阶段延迟预算")
+    parser.add_argument("summary", help="Tracer.export_json() 生成的 JSON 文件")
+    parser.add_argument("--config", default=None, help="配置文件路径，默认使用项目根目录的 config.yaml")
+    parser.add_argument("--percentile", type=int, default=99, choices=[50, 95, 99])
+    args = parser.parse_args()
+
+    with open(args.summary, "r", encoding="utf-8") as f:
+        summary = json.load(f)
+    budgets = (load_config(args.config).get("observability", {}) or {}).get("p99_budget_ms", {}) or {}
+    if not budgets:
+        print("⚠️  未配置 observability.p99_budget_ms，跳过检查")
+        return 0
+
+    print("=" * 60)
+    print(f"延迟预算检查 (p{args.percentile})")
+    print("=" * 60)
+    for name, stats in sorted(summary.get("stages", {}).items()):
+        budget = budgets.get(name)
+        budget_text = f"{budget:.0f}ms" if budget is not None else "-"
+        print(f"  {name:<12} p{args.percentile}={stats[f'p{args.percentile}_ms']:.2f}ms  budget={budget_text}")
+
+    violations = check_summary(summary, budgets, args.percentile)
+    if violations:
+        print("\n❌ 超出预算:")
+        for violation in violations:
+            print(f"  - {violation}")
+        return 1
+    print("\n✅ 所有阶段均在预算内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+检查 ONNX 后端与 PyTorch 后端的输出是否一致
+使用方法: python scripts/check_onnx_parity.py [--dtype int8] [--min-cosine 0.99]
+
+对同一批中文文本分别用 torch 和 onnx 后端编码 / 重排，比较：
+  - 嵌入：同一文本两种后端向量的余弦相似度、相似度矩阵的最大偏差、检索 top-k 的一致率
+  - 重排：分数的最大偏差、排序的一致性（top-1 是否相同）
+并输出两种后端的吞吐量。任何一项超出阈值时以非零状态码退出。
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from embeddings.embed_model import EmbeddingModel
+from embeddings.reranker import Reranker
+
+QUERIES = [
+    "什么是人工智能？",
+    "机器学习和深度学习有什么区别？",
+    "向量数据库如何加速检索？",
+    "RAG 系统中重排模型的作用是什么？",
+]
+
+DOCUMENTS = [
+    "人工智能是计算机科学的一个分支，致力于创建能够执行通常需要人类智能的任务的系统。",
+    "机器学习是人工智能的一个子领域，通过算法让计算机从数据中学习，而无需明确编程。",
+    "深度学习是机器学习的一个分支，使用多层神经网络来学习数据的表示。",
+    "向量数据库使用近似最近邻索引（如 HNSW、IVF）在海量向量中快速找到相似向量。",
+    "重排模型（cross-encoder）对检索到的候选文档逐一打分，提升最终结果的相关性。",
+    "Transformer 架构是自然语言处理中的一种重要模型架构，被用于 BERT、GPT 等模型。",
+    "今天天气很好，适合出去散步。",
+    "我喜欢吃苹果和香蕉。",
+]
+
+
+def throughput(fn, count: int, repeat: int = 3) -> float:
+    """多次运行取最快一次，返回每秒处理数量"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def check_embedding(model_name: str, dtype: str, min_cosine: float, max_sim_diff: float, top_k: int) -> bool:
+    print("=" * 60)
+    print(f"嵌入模型: {model_name} (onnx {dtype})")
+    print("=" * 60)
+    torch_model = EmbeddingModel(model_name=model_name, device="cpu", backend="torch")
+    onnx_model = EmbeddingModel(model_name=model_name, backend="onnx", dtype=dtype)
+
+    texts = QUERIES + DOCUMENTS
+    torch_vectors = torch_model.encode(texts, show_progress_bar=False, output="numpy")
+    onnx_vectors = onnx_model.encode(texts, show_progress_bar=False, output="numpy")
+
+    cosines = np.sum(torch_vectors * onnx_vectors, axis=1) / (
+        np.linalg.norm(torch_vectors, axis=1) * np.linalg.norm(onnx_vectors, axis=1)
+    )
+    q = len(QUERIES)
+    torch_sims = torch_vectors[:q] @ torch_vectors[q:].T
+    onnx_sims = onnx_vectors[:q] @ onnx_vectors[q:].T
+    sim_diff = float(np.abs(torch_sims - onnx_sims).max())
+    torch_top = np.argsort(-torch_sims, axis=1)[:, :top_k]
+    onnx_top = np.argsort(-onnx_sims, axis=1)[:, :top_k]
+    overlap = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(torch_top, onnx_top)])
+
+    print(f"  向量余弦相似度: min={cosines.min():.4f} mean={cosines.mean():.4f}（阈值 ≥ {min_cosine}）")
+    print(f"  相似度矩阵最大偏差: {sim_diff:.4f}（阈值 ≤ {max_sim_diff}）")
+    print(f"  检索 top-{top_k} 一致率: {overlap:.2%}")
+
+    batch = DOCUMENTS * 16
+    torch_speed = throughput(lambda: torch_model.encode(batch, show_progress_bar=False, output="numpy"), len(batch))
+    onnx_speed = throughput(lambda: onnx_model.encode(batch, show_progress_bar=False, output="numpy"), len(batch))
+    print(f"  吞吐量: torch {torch_speed:.1f} texts/s, onnx {onnx_speed:.1f} texts/s ({onnx_speed / torch_speed:.2f}x)")
+
+    torch_model.close(unload=True)
+    onnx_model.close(unload=True)
+    return cosines.min() >= min_cosine and sim_diff <= max_sim_diff
+
+
+def check_reranker(model_name: str, dtype: str, max_score_diff: float) -> bool:
+    print("=" * 60)
+    print(f"重排模型: {model_name} (onnx {dtype})")
+    print("=" * 60)
+    torch_model = Reranker(model_name=model_name, device="cpu", backend="torch")
+    onnx_model = Reranker(model_name=model_name, backend="onnx", dtype=dtype)
+
+    pairs = [[query, doc] for query in QUERIES for doc in DOCUMENTS]
+    torch_scores = np.asarray(torch_model.predict_pairs(pairs))
+    onnx_scores = np.asarray(onnx_model.predict_pairs(pairs))
+    score_diff = float(np.abs(torch_scores - onnx_scores).max())
+    shape = (len(QUERIES), len(DOCUMENTS))
+    same_top1 = np.mean(
+        np.argmax(torch_scores.reshape(shape), axis=1) == np.argmax(onnx_scores.reshape(shape), axis=1)
+    )
+
+    print(f"  分数最大偏差: {score_diff:.4f}（阈值 ≤ {max_score_diff}）")
+    print(f"  top-1 一致率: {same_top1:.2%}")
+
+    batch = pairs * 4
+    torch_speed = throughput(lambda: torch_model.predict_pairs(batch), len(batch))
+    onnx_speed = throughput(lambda: onnx_model.predict_pairs(batch), len(batch))
+    print(f"  吞吐量: torch {torch_speed:.1f} pairs/s, onnx {onnx_speed:.1f} pairs/s ({onnx_speed / torch_speed:.2f}x)")
+
+    torch_model.close(unload=True)
+    onnx_model.close(unload=True)
+    return score_diff <= max_score_diff and same_top1 == 1.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ONNX 与 PyTorch 后端一致性检查")
+    parser.add_argument("--embedding-model", default="BAAI/bge-large-zh")
+    parser.add_argument("--reranker-model", default="BAAI/bge-reranker-base")
+    parser.add_argument("--dtype", default="int8", choices=["int8", "float32"])
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--max-sim-diff", type=float, default=0.03)
+    parser.add_argument("--max-score-diff", type=float, default=0.05)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--skip-reranker", action="store_true")
+    args = parser.parse_args()
+
+    passed = check_embedding(args.embedding_model, args.dtype, args.min_cosine, args.max_sim_diff, args.top_k)
+    if not args.skip_reranker:
+        passed = check_reranker(args.reranker_model, args.dtype, args.max_score_diff) and passed
+
+    print("\n" + ("✅ ONNX 后端与 PyTorch 后端输出一致" if passed else "❌ ONNX 后端输出偏差超出阈值"))
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,22 @@ Vector storage module for RAG system.
 """
 
 from .qdrant_wrapper import QdrantClient
+from .async_qdrant_wrapper import AsyncQdrantClient
+from .local_index import LocalVectorIndex
+from .async_adapter import AsyncVectorStoreAdapter
+from .factory import create_vector_store, create_async_vector_store, register_vector_store
+from .transport import TransportConfig, CircuitBreaker, CircuitOpenError
 
-__all__ = ["QdrantClient"]
+__all__ = [
+    "QdrantClient",
+    "AsyncQdrantClient",
+    "LocalVectorIndex",
+    "AsyncVectorStoreAdapter",
+    "create_vector_store",
+    "create_async_vector_store",
+    "register_vector_store",
+    "TransportConfig",
+    "CircuitBreaker",
+    "CircuitOpenError",
+]
 
@@ -0,0 +1,332 @@
+"""
+IVF-flat approximate nearest-neighbour index for LocalVectorIndex.
+用 k-means 把向量划分到 nlist 个簇，每个簇维护一个倒排列表（行号数组）；
+检索时只扫描与查询最接近的 nprobe 个簇，代价从 O(N) 降到约 O(N * nprobe / nlist)。
+向量本身仍存放在 LocalVectorIndex 的 memmap 矩阵中，倒排列表只保存行号。
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# k-means 分配时每块的最大元素数（行数 × 簇数），控制临时矩阵的内存占用
+_ASSIGN_BLOCK_ELEMENTS = 1 << 25
+
+
+def _assign_scores(vectors: np.ndarray, centroids: np.ndarray, spherical: bool) -> np.ndarray:
+    """向量与簇中心的打分：球面 k-means 用内积，否则用 -0.5 * 欧氏距离平方（去掉常数项）"""
+    scores = vectors @ centroids.T
+    if not spherical:
+        scores -= 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    return scores
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray, spherical: bool = True) -> np.ndarray:
+    """把每个向量分配到最近的簇（分块计算）"""
+    block = max(1, _ASSIGN_BLOCK_ELEMENTS // max(1, centroids.shape[0]))
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], block):
+        chunk = np.asarray(vectors[start:start + block], dtype=np.float32)
+        assignments[start:start + block] = _assign_scores(chunk, centroids, spherical).argmax(axis=1)
+    return assignments
+
+
+def kmeans(
+    data: np.ndarray,
+    k: int,
+    n_iter: int = 20,
+    spherical: bool = True,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    k-means 聚类
+
+    Args:
+        data: 训练向量 (n, d)
+        k: 簇数量
+        n_iter: 迭代次数
+        spherical: 是否使用球面 k-means（簇中心归一化，适合余弦相似度）
+        seed: 随机种子
+
+    Returns:
+        簇中心 (k, d)，float32
+    """
+    data = np.asarray(data, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = min(k, data.shape[0])
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = assign_clusters(data, centroids, spherical)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=k)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        nonempty = counts > 0
+        sums = np.add.reduceat(data[order], starts[nonempty], axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+        # 空簇重新随机初始化
+        empty = np.flatnonzero(~nonempty)
+        if empty.size:
+            centroids[empty] = data[rng.choice(data.shape[0], empty.size, replace=False)]
+        if spherical:
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms > 0, norms, 1.0)
+    return centroids
+
+
+class IVFFlatIndex:
+    """
+    IVF-flat 倒排索引
+
+    倒排列表在内存中是可增长的 numpy 数组；保存时合并为 CSR 格式
+    （rows + offsets），加载时通过 np.load(mmap_mode="r") 直接映射，
+    只有被追加写入的列表才会复制到内存中。
+    """
+
+    CENTROIDS_FILE = "ivf_centroids.npy"
+    ROWS_FILE = "ivf_rows.npy"
+    OFFSETS_FILE = "ivf_offsets.npy"
+
+    def __init__(
+        self,
+        nlist: Optional[int] = None,
+        nprobe: int = 16,
+        spherical: bool = True,
+        min_train_size: int = 10000,
+        train_sample_per_list: int = 64
+    ):
+        """
+        初始化 IVF 索引
+
+        Args:
+            nlist: 簇数量，None 表示训练时按 4 * sqrt(N) 自动选择
+            nprobe: 默认检索的簇数量（越大召回率越高、速度越慢）
+            spherical: 是否使用球面 k-means（余弦距离时为 True）
+            min_train_size: 向量数量达到该值后才训练索引，之前使用精确检索
+            train_sample_per_list: 训练时每个簇平均采样的向量数
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.spherical = spherical
+        self.min_train_size = min_train_size
+        self.train_sample_per_list = train_sample_per_list
+
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._sizes = np.zeros(0, dtype=np.int64)
+        self._owned = np.zeros(0, dtype=bool)
+        # 行号 -> 簇编号（-1 表示未索引），用于过滤行被删除或复用后留下的过期条目
+        self._assign = np.full(0, -1, dtype=np.int64)
+        self.dirty = False
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _ensure_assign_capacity(self, max_row: int):
+        if max_row >= self._assign.shape[0]:
+            grow = max(max_row + 1, 2 * self._assign.shape[0]) - self._assign.shape[0]
+            self._assign = np.concatenate([self._assign, np.full(grow, -1, dtype=np.int64)])
+
+    def train(self, matrix: np.ndarray, rows: np.ndarray, seed: int = 0, block_rows: int = 65536):
+        """
+        训练簇中心并重建倒排列表
+
+        Args:
+            matrix: 行向量矩阵（LocalVectorIndex 的 memmap）
+            rows: 参与训练并加入索引的行号（全部存活行）
+            seed: 随机种子
+            block_rows: 重建倒排列表时每次读取的行数
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        num_vectors = rows.shape[0]
+        nlist = self.nlist or int(np.clip(4 * np.sqrt(num_vectors), 16, 65536))
+        nlist = min(nlist, num_vectors)
+        sample_size = min(num_vectors, nlist * self.train_sample_per_list)
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(rows, sample_size, replace=False))
+
+        print(f"Training IVF index: {num_vectors} vectors, nlist={nlist}, sample={sample_size}")
+        self.centroids = kmeans(
+            np.asarray(matrix[sample], dtype=np.float32),
+            nlist,
+            spherical=self.spherical,
+            seed=seed
+        )
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._sizes = np.zeros(nlist, dtype=np.int64)
+        self._owned = np.ones(nlist, dtype=bool)
+        self._assign = np.full(0, -1, dtype=np.int64)
+        for start in range(0, num_vectors, block_rows):
+            block = rows[start:start + block_rows]
+            self.add(block, matrix[block])
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """把行加入倒排列表（已在索引中的行会被重新分配）"""
+        if not self.is_trained or len(rows) == 0:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        assignments = assign_clusters(vectors, self.centroids, self.spherical)
+        self._ensure_assign_capacity(int(rows.max()))
+        self._assign[rows] = assignments
+
+        order = np.argsort(assignments, kind="stable")
+        sorted_lists = assignments[order]
+        boundaries = np.flatnonzero(np.diff(sorted_lists)) + 1
+        for group in np.split(order, boundaries):
+            self._append(int(assignments[group[0]]), rows[group])
+        self.dirty = True
+
+    def _append(self, list_id: int, new_rows: np.ndarray):
+        size = self._sizes[list_id]
+        data = self._lists[list_id]
+        needed = size + new_rows.shape[0]
+        if not self._owned[list_id] or needed > data.shape[0]:
+            # 加载后的列表是只读 mmap 视图，第一次追加时复制到可增长的内存数组
+            buffer = np.empty(max(needed, 2 * data.shape[0], 16), dtype=np.int64)
+            buffer[:size] = data[:size]
+            self._lists[list_id] = data = buffer
+            self._owned[list_id] = True
+        data[size:needed] = new_rows
+        self._sizes[list_id] = needed
+
+    def unindexed(self, rows: np.ndarray) -> np.ndarray:
+        """返回 rows 中尚未加入索引的行号"""
+        rows = np.asarray(rows, dtype=np.int64)
+        indexed = np.zeros(rows.shape[0], dtype=bool)
+        in_range = rows < self._assign.shape[0]
+        indexed[in_range] = self._assign[rows[in_range]] >= 0
+        return rows[~indexed]
+
+    def remove(self, rows: np.ndarray):
+        """从索引中移除行（倒排列表中的条目在检索和保存时被过滤）"""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < self._assign.shape[0]]
+        if rows.size:
+            self._assign[rows] = -1
+            self.dirty = True
+
+    def probe(self, queries: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """返回每个查询需要扫描的簇编号 (m, nprobe)"""
+        nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+        scores = _assign_scores(queries, self.centroids, self.spherical)
+        if nprobe >= scores.shape[1]:
+            return np.argsort(-scores, axis=1)
+        return np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe]
+
+    def candidates(self, list_ids: np.ndarray) -> np.ndarray:
+        """合并若干簇的倒排列表，过滤掉过期条目"""
+        parts = [self._lists[i][:self._sizes[i]] for i in list_ids]
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        owners = np.repeat(list_ids, self._sizes[list_ids])
+        return rows[self._assign[rows] == owners]
+
+    def search(
+        self,
+        queries: np.ndarray,
+        vectors: np.ndarray,
+        mask: np.ndarray,
+        top_k: int,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        近似检索
+
+        Args:
+            queries: 查询向量 (m, d)，float32
+            vectors: 行向量矩阵（LocalVectorIndex 的 memmap）
+            mask: 行是否可返回（存活且满足过滤条件）
+            top_k: 每个查询返回的数量
+            nprobe: 扫描的簇数量，None 使用默认值
+
+        Returns:
+            每个查询的 (行号数组, 分数数组)，按分数降序
+        """
+        results = []
+        for query, list_ids in zip(queries, self.probe(queries, nprobe)):
+            rows = self.candidates(list_ids)
+            # 去重（同一行被重复写入同一簇时）并按行号排序，memmap 上的访问更接近顺序读
+            rows = np.unique(rows[mask[rows]])
+            if rows.size == 0:
+                results.append((rows, np.empty(0, dtype=np.float32)))
+                continue
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+            if top_k < rows.size:
+                part = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                part = np.arange(rows.size)
+            order = part[np.argsort(-scores[part], kind="stable")]
+            results.append((rows[order], scores[order]))
+        return results
+
+    def save(self, directory: str):
+        """保存为 CSR 格式的 .npy 文件（过期条目在保存时清理）"""
+        if not self.is_trained:
+            return
+        parts = []
+        for list_id in range(self.centroids.shape[0]):
+            rows = self._lists[list_id][:self._sizes[list_id]]
+            parts.append(rows[self._assign[rows] == list_id])
+        sizes = np.array([part.shape[0] for part in parts], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+        for name, array in (
+            (self.CENTROIDS_FILE, self.centroids),
+            (self.ROWS_FILE, rows),
+            (self.OFFSETS_FILE, offsets),
+        ):
+            tmp_path = os.path.join(directory, name + ".tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(directory, name))
+        self.dirty = False
+
+    def load(self, directory: str) -> bool:
+        """
+        从目录加载索引（倒排列表通过 mmap 映射）
+
+        Returns:
+            是否加载成功
+        """
+        paths = [os.path.join(directory, name) for name in (self.CENTROIDS_FILE, self.ROWS_FILE, self.OFFSETS_FILE)]
+        if not all(os.path.exists(path) for path in paths):
+            return False
+        self.centroids = np.load(paths[0])
+        rows = np.load(paths[1], mmap_mode="r")
+        offsets = np.load(paths[2])
+        nlist = self.centroids.shape[0]
+        self._lists = [rows[offsets[i]:offsets[i + 1]] for i in range(nlist)]
+        self._sizes = np.diff(offsets).astype(np.int64)
+        self._owned = np.zeros(nlist, dtype=bool)
+
+        self._assign = np.full(int(rows.max()) + 1 if rows.size else 0, -1, dtype=np.int64)
+        self._assign[np.asarray(rows)] = np.repeat(np.arange(nlist), self._sizes)
+        self.dirty = False
+        return True
+
+    def reset(self, directory: Optional[str] = None):
+        """清空索引（并删除磁盘文件）"""
+        self.centroids = None
+        self._lists = []
+        self._sizes = np.zeros(0, dtype=np.int64)
+        self._owned = np.zeros(0, dtype=bool)
+        self._assign = np.full(0, -1, dtype=np.int64)
+        self.dirty = False
+        if directory:
+            for name in (self.CENTROIDS_FILE, self.ROWS_FILE, self.OFFSETS_FILE):
+                path = os.path.join(directory, name)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def stats(self) -> dict:
+        """返回索引统计"""
+        if not self.is_trained:
+            return {"trained": False}
+        return {
+            "trained": True,
+            "nlist": int(self.centroids.shape[0]),
+            "nprobe": self.nprobe,
+            "indexed": int(np.count_nonzero(self._assign >= 0)),
+            "max_list_size": int(self._sizes.max()) if self._sizes.size else 0,
+        }
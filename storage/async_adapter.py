@@ -0,0 +1,35 @@
+"""
+Async adapter for synchronous vector stores.
+把 LocalVectorIndex 等同步向量库包装成与 AsyncQdrantClient 一致的异步接口：
+每次调用通过 asyncio.to_thread 放到线程中执行，不阻塞事件循环。
+"""
+
+import asyncio
+from typing import Any
+
+
+class AsyncVectorStoreAdapter:
+    """同步向量库的异步包装，方法与被包装对象同名，返回协程"""
+
+    def __init__(self, store: Any):
+        """
+        Args:
+            store: 同步向量库（LocalVectorIndex 或 create_vector_store 返回的其他后端）
+        """
+        self.store = store
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.store, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+
+        return call
+
+    async def close(self):
+        """关闭后端（没有 close 的后端只把数据落盘；进程内共享的实例不会被关闭）"""
+        close = getattr(self.store, "close", None) or getattr(self.store, "flush", None)
+        if close is not None:
+            await asyncio.to_thread(close)
@@ -0,0 +1,208 @@
+"""
+Async Qdrant vector database client wrapper.
+与 QdrantClient 接口一致的 asyncio 版本，底层使用 qdrant_client.AsyncQdrantClient。
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from qdrant_client.models import Distance, VectorParams, PointStruct, SearchRequest
+
+from storage.qdrant_wrapper import (
+    QdrantClient,
+    Vector,
+    _to_vector,
+    make_point_id,
+    build_quantization_config,
+    build_search_params,
+)
+from storage.transport import TransportConfig, acquire_client, release_client, get_breaker, async_call_with_retry
+
+
+class AsyncQdrantClient:
+    """Qdrant 向量数据库异步客户端封装"""
+
+    def __init__(
+        self,
+        url: str = "http://localhost:6333",
+        api_key: Optional[str] = None,
+        collection_name: str = "rag_documents",
+        upsert_batch_size: int = 256,
+        upsert_parallel: int = 4,
+        quantization: Optional[str] = None,
+        oversampling: float = 2.0,
+        rescore: bool = True,
+        transport: Optional[TransportConfig] = None
+    ):
+        """
+        初始化异步 Qdrant 客户端
+
+        Args:
+            url: Qdrant 服务地址
+            api_key: API 密钥（可选）
+            collection_name: 集合名称
+            upsert_batch_size: 写入时每批的点数量
+            upsert_parallel: 同时在途的写入批次数量
+            quantization / oversampling / rescore / transport: 同 QdrantClient
+        """
+        if transport is None:
+            transport = TransportConfig(url=url, api_key=api_key)
+        self.transport = transport
+        self.url = transport.url
+        self.api_key = transport.api_key
+        self.collection_name = collection_name
+        self.upsert_batch_size = upsert_batch_size
+        self.upsert_parallel = upsert_parallel
+        self.quantization = quantization
+        self.search_params = build_search_params(quantization, oversampling, rescore)
+
+        self.client = acquire_client(transport, use_async=True)
+        self.breaker = get_breaker(transport)
+
+        print(f"Connected to Qdrant at {self.url} (async)")
+
+    async def _call(self, fn, description: str):
+        """经过重试和熔断器执行一次异步 SDK 调用，fn 每次调用返回新的协程"""
+        return await async_call_with_retry(
+            fn,
+            max_retries=self.transport.max_retries,
+            description=description,
+            breaker=self.breaker
+        )
+
+    async def create_collection(
+        self,
+        vector_size: int,
+        distance=None,
+        on_disk: Optional[bool] = None
+    ) -> bool:
+        """创建集合，参数同 QdrantClient.create_collection"""
+        if distance is None:
+            distance = Distance.COSINE
+        if on_disk is None:
+            on_disk = self.quantization is not None
+
+        try:
+            await self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(
+                    size=vector_size,
+                    distance=distance,
+                    on_disk=on_disk
+                ),
+                quantization_config=build_quantization_config(self.quantization)
+            )
+            print(f"Collection '{self.collection_name}' created successfully")
+            return True
+        except Exception as e:
+            print(f"Collection may already exist: {e}")
+            return False
+
+    async def add_documents(
+        self,
+        texts: List[str],
+        embeddings: Union[List[List[float]], np.ndarray],
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> List[str]:
+        """
+        添加文档到向量库，分批并发写入
+
+        Returns:
+            文档 ID 列表（与 QdrantClient 相同的确定性 ID）
+        """
+        if metadatas is None:
+            metadatas = [{}] * len(texts)
+
+        ids = [
+            make_point_id(text, str(metadata.get("source", "")))
+            for text, metadata in zip(texts, metadatas)
+        ]
+        semaphore = asyncio.Semaphore(self.upsert_parallel)
+
+        async def upsert_batch(start: int, end: int):
+            # 在信号量内构建点：同时存在的 PointStruct 不超过 upsert_parallel 个批次
+            async with semaphore:
+                points = [
+                    PointStruct(
+                        id=ids[i],
+                        vector=_to_vector(embeddings[i]),
+                        payload={"text": texts[i], **metadatas[i]}
+                    )
+                    for i in range(start, end)
+                ]
+                await self._call(
+                    lambda: self.client.upsert(
+                        collection_name=self.collection_name,
+                        points=points,
+                        wait=True
+                    ),
+                    description=f"Upsert batch [{start}:{end}]"
+                )
+
+        await asyncio.gather(*[
+            upsert_batch(start, min(start + self.upsert_batch_size, len(texts)))
+            for start in range(0, len(texts), self.upsert_batch_size)
+        ])
+
+        print(f"Added {len(ids)} documents to collection")
+        return ids
+
+    async def search(
+        self,
+        query_vector: Vector,
+        top_k: int = 5,
+        filter_conditions: Optional[Dict] = None
+    ) -> List[Dict]:
+        """搜索相似向量，返回格式同 QdrantClient.search"""
+        vector = _to_vector(query_vector)
+        results = await self._call(
+            lambda: self.client.search(
+                collection_name=self.collection_name,
+                query_vector=vector,
+                limit=top_k,
+                query_filter=filter_conditions,
+                search_params=self.search_params
+            ),
+            description="Search"
+        )
+        return [QdrantClient._to_result(result) for result in results]
+
+    async def search_batch(
+        self,
+        query_vectors: Union[List[List[float]], np.ndarray],
+        top_k: int = 5,
+        filter_conditions: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """批量搜索，返回格式同 QdrantClient.search_batch"""
+        if len(query_vectors) == 0:
+            return []
+
+        requests = [
+            SearchRequest(
+                vector=_to_vector(query_vector),
+                limit=top_k,
+                filter=filter_conditions,
+                params=self.search_params,
+                with_payload=True
+            )
+            for query_vector in query_vectors
+        ]
+        batch_results = await self._call(
+            lambda: self.client.search_batch(
+                collection_name=self.collection_name,
+                requests=requests
+            ),
+            description=f"Search batch ({len(requests)} queries)"
+        )
+        return [
+            [QdrantClient._to_result(result) for result in results]
+            for results in batch_results
+        ]
+
+    async def close(self):
+        """释放共享的底层客户端（最后一个使用者释放时关闭连接）"""
+        if self.client is not None and release_client(self.client):
+            await self.client.close()
+        self.client = None
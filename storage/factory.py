@@ -0,0 +1,118 @@
+"""
+Vector store factory.
+根据 config.yaml 的 vector_store.type 选择向量库后端：
+"qdrant" 使用 Qdrant 服务，"local" 使用进程内的 LocalVectorIndex；
+其他后端（例如基准测试中的内存替身）可以通过 register_vector_store 注册。
+"""
+
+import os
+from typing import Any, Callable, Dict, Optional
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VECTOR_STORE_TYPES = ("qdrant", "local")
+
+# 额外注册的后端：store_type -> builder(url, collection_name, store_config)
+_custom_stores: Dict[str, Callable[[str, str, Dict[str, Any]], Any]] = {}
+
+
+def register_vector_store(store_type: str, builder: Callable[[str, str, Dict[str, Any]], Any]):
+    """
+    注册向量库后端
+
+    Args:
+        store_type: 后端类型名称（不区分大小写），与内置类型同名时覆盖内置实现
+        builder: 创建函数，签名为 builder(url, collection_name, store_config)，
+                 返回与 QdrantClient 接口一致的对象
+    """
+    _custom_stores[store_type.lower()] = builder
+
+
+def create_vector_store(
+    store_type: str = "qdrant",
+    url: str = "http://localhost:6333",
+    collection_name: str = "rag_documents",
+    store_config: Optional[Dict[str, Any]] = None
+):
+    """
+    创建向量库客户端
+
+    Args:
+        store_type: 后端类型，"qdrant"、"local" 或通过 register_vector_store 注册的类型
+        url: Qdrant 服务地址（仅 qdrant）
+        collection_name: 集合名称
+        store_config: config.yaml 中的 vector_store 配置（可选），
+                      local 后端读取其中的 path（相对路径基于项目根目录）、dtype
+                      以及 index_type / nlist / nprobe；qdrant 后端读取 transport 配置；
+                      两种后端都读取 quantization 配置
+
+    Returns:
+        QdrantClient 或 LocalVectorIndex（接口一致）
+    """
+    store_config = store_config or {}
+    store_type = (store_type or "qdrant").lower()
+    if store_type in _custom_stores:
+        return _custom_stores[store_type](url, collection_name, store_config)
+    quantization = _quantization_kwargs(store_config)
+
+    if store_type == "qdrant":
+        from storage.qdrant_wrapper import QdrantClient
+        from storage.transport import TransportConfig
+        transport = TransportConfig.from_config(url, store_config.get("transport"))
+        return QdrantClient(collection_name=collection_name, transport=transport, **quantization)
+
+    if store_type == "local":
+        from storage.local_index import open_local_index
+        path = store_config.get("path", "./data/vector_index")
+        return open_local_index(
+            path=os.path.join(project_root, path),
+            collection_name=collection_name,
+            dtype=store_config.get("dtype"),
+            index_type=store_config.get("index_type", "flat"),
+            nlist=store_config.get("nlist"),
+            nprobe=store_config.get("nprobe", 16),
+            **quantization
+        )
+
+    available = list(VECTOR_STORE_TYPES) + sorted(_custom_stores)
+    raise ValueError(f"不支持的向量库类型: {store_type}，可选: {', '.join(available)}")
+
+
+def _quantization_kwargs(store_config: Dict[str, Any]) -> Dict[str, Any]:
+    """vector_store.quantization 配置转换为客户端参数"""
+    quantization_config = store_config.get("quantization") or {}
+    return {
+        "quantization": quantization_config.get("type"),
+        "oversampling": quantization_config.get("oversampling", 2.0),
+        "rescore": quantization_config.get("rescore", True),
+    }
+
+
+def create_async_vector_store(
+    store_type: str = "qdrant",
+    url: str = "http://localhost:6333",
+    collection_name: str = "rag_documents",
+    store_config: Optional[Dict[str, Any]] = None
+):
+    """
+    创建异步向量库客户端，参数同 create_vector_store（transport / quantization 配置同样生效）
+
+    qdrant 使用 AsyncQdrantClient；local 和注册的其他后端与 create_vector_store 返回同一个实例
+    （因此与同步系统读写同一份数据），由 AsyncVectorStoreAdapter 在线程中执行。
+
+    Returns:
+        AsyncQdrantClient 或 AsyncVectorStoreAdapter（接口一致）
+    """
+    store_config = store_config or {}
+    store_type = (store_type or "qdrant").lower()
+    if store_type != "qdrant" or store_type in _custom_stores:
+        from storage.async_adapter import AsyncVectorStoreAdapter
+        return AsyncVectorStoreAdapter(create_vector_store(store_type, url, collection_name, store_config))
+
+    from storage.async_qdrant_wrapper import AsyncQdrantClient
+    from storage.transport import TransportConfig
+    transport = TransportConfig.from_config(url, store_config.get("transport"))
+    return AsyncQdrantClient(
+        collection_name=collection_name,
+        transport=transport,
+        **_quantization_kwargs(store_config)
+    )
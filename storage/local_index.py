@@ -0,0 +1,775 @@
+"""
+In-process vector index backed by a memory-mapped matrix.
+与 QdrantClient 接口一致的本地向量库：向量存放在 memmap 矩阵中（float32 或 float16），
+检索时用矩阵乘法做精确搜索，再用 argpartition 取 top-k，不需要运行 Qdrant 服务。
+适合测试、CI 和小规模部署；百万级以上的集合可以使用 index_type="ivf" 做近似检索。
+"""
+
+import atexit
+import json
+import inspect
+import os
+import shutil
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from storage.qdrant_wrapper import Vector, make_point_id
+from storage.ann_index import IVFFlatIndex
+from storage.quantization import QUANTIZATION_TYPES, create_quantizer
+
+# 单次矩阵乘法处理的行数（float16 存储或量化编码时按块转换为 float32）
+SEARCH_BLOCK_ROWS = 65536
+
+# 训练量化器时最多采样的向量数
+QUANTIZER_SAMPLE_SIZE = 100000
+
+INDEX_TYPES = ("flat", "ivf")
+
+
+def _distance_name(distance) -> str:
+    """把 Qdrant 的 Distance 枚举或字符串统一成小写名称"""
+    if distance is None:
+        return "cosine"
+    name = str(getattr(distance, "value", distance)).lower()
+    if name.startswith("cos"):
+        return "cosine"
+    if name == "dot":
+        return "dot"
+    raise ValueError(f"本地向量库不支持的距离度量: {distance}，可选: cosine, dot")
+
+
+class LocalVectorIndex:
+    """本地向量库：memmap 向量矩阵 + 精确检索"""
+
+    VECTORS_FILE = "vectors.bin"
+    META_FILE = "meta.json"
+    PAYLOAD_FILE = "payloads.jsonl"
+    CODES_FILE = "codes.bin"
+    QUANTIZER_FILE = "quantizer.npz"
+
+    def __init__(
+        self,
+        path: str = "./data/vector_index",
+        collection_name: str = "rag_documents",
+        dtype: Optional[str] = None,
+        index_type: str = "flat",
+        nlist: Optional[int] = None,
+        nprobe: int = 16,
+        ivf_min_train_size: int = 10000,
+        quantization: Optional[str] = None,
+        oversampling: float = 2.0,
+        rescore: bool = True
+    ):
+        """
+        初始化本地向量库（已有集合会从磁盘加载）
+
+        Args:
+            path: 存储根目录，每个集合对应其中一个子目录
+            collection_name: 集合名称
+            dtype: 向量存储精度，"float32" 或 "float16"；None 表示沿用已有集合的精度，新集合使用 float32
+            index_type: "flat" 精确检索；"ivf" 使用 IVF-flat 近似检索
+            nlist: IVF 簇数量，None 表示训练时按集合大小自动选择
+            nprobe: IVF 默认检索的簇数量
+            ivf_min_train_size: 点数量达到该值时训练 IVF 索引，之前仍使用精确检索
+            quantization: 量化方式，None 不量化，"scalar"（int8）或 "binary"；
+                          量化编码单独存放，精确检索（flat）时先用编码粗排
+            oversampling: 量化粗排时取 top_k * oversampling 个候选
+            rescore: 是否用原始向量对候选重新打分
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}，可选: {', '.join(INDEX_TYPES)}")
+        if quantization is not None and quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f"不支持的量化方式: {quantization}，可选: {', '.join(QUANTIZATION_TYPES)}")
+        self.path = path
+        self.collection_name = collection_name
+        self.collection_dir = os.path.join(path, collection_name)
+        self._requested_dtype = dtype
+        self.dtype = np.dtype(dtype or "float32")
+        if self.dtype not in (np.float32, np.float16):
+            raise ValueError(f"不支持的存储精度: {dtype}，可选: float32, float16")
+
+        self.dimension: Optional[int] = None
+        self.distance = "cosine"
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        self._count = 0  # 已使用的行数（包括已删除的空行）
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_ids: List[Optional[str]] = []
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        self._log_lines = 0
+        self._lock = threading.RLock()
+
+        self.index_type = index_type
+        self._ann: Optional[IVFFlatIndex] = None
+        if index_type == "ivf":
+            self._ann = IVFFlatIndex(nlist=nlist, nprobe=nprobe, min_train_size=ivf_min_train_size)
+
+        self.quantization = quantization
+        self.oversampling = oversampling
+        self.rescore = rescore
+        self._quantizer = None
+        self._quantizer_fit_size = 0
+        self._codes: Optional[np.memmap] = None
+
+        self._load()
+        atexit.register(self.flush)
+        print(f"Opened local vector index at {self.collection_dir}")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.collection_dir, self.VECTORS_FILE)
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.collection_dir, self.META_FILE)
+
+    @property
+    def _payload_path(self) -> str:
+        return os.path.join(self.collection_dir, self.PAYLOAD_FILE)
+
+    @property
+    def _codes_path(self) -> str:
+        return os.path.join(self.collection_dir, self.CODES_FILE)
+
+    @property
+    def _quantizer_path(self) -> str:
+        return os.path.join(self.collection_dir, self.QUANTIZER_FILE)
+
+    def _load(self):
+        """从磁盘加载集合（元数据 + 向量文件 + 负载日志）"""
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if self._requested_dtype and meta.get("dtype") != self.dtype.name:
+            print(
+                f"Local index at {self.collection_dir} stores {meta.get('dtype')}, "
+                f"ignoring requested dtype {self.dtype.name}"
+            )
+        self.dtype = np.dtype(meta["dtype"])
+        self.dimension = meta["dimension"]
+        self.distance = meta.get("distance", "cosine")
+        self._capacity = meta["capacity"]
+        self._open_vectors()
+
+        self._row_ids = [None] * self._capacity
+        self._payloads = [None] * self._capacity
+        count = 0
+        if os.path.exists(self._payload_path):
+            with open(self._payload_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    row = record["row"]
+                    self._row_ids[row] = record.get("id")
+                    self._payloads[row] = record.get("payload")
+                    count = max(count, row + 1)
+                    self._log_lines += 1
+        self._count = count
+        self._alive = np.array([row_id is not None for row_id in self._row_ids], dtype=bool)
+        self._id_to_row = {
+            row_id: row for row, row_id in enumerate(self._row_ids) if row_id is not None
+        }
+        self._free_rows = [row for row in range(count - 1, -1, -1) if self._row_ids[row] is None]
+
+        if self._ann is not None:
+            self._ann.spherical = self.distance == "cosine"
+            if self._ann.load(self.collection_dir):
+                # 与负载日志对齐：移除已删除的行，上次退出前未保存的行重新加入索引
+                self._ann.remove(np.flatnonzero(~self._alive[:count]))
+                missing = self._ann.unindexed(np.flatnonzero(self._alive[:count]))
+                self._ann.add(missing, self._vectors[missing])
+            else:
+                self._update_ann(np.empty(0, dtype=np.int64))
+
+        self._init_quantizer()
+
+    def _open_vectors(self):
+        self._vectors = np.memmap(
+            self._vectors_path,
+            dtype=self.dtype,
+            mode="r+",
+            shape=(self._capacity, self.dimension)
+        )
+
+    def _resize(self, capacity: int):
+        """扩容磁盘向量文件"""
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        mode = "r+b" if os.path.exists(self._vectors_path) else "w+b"
+        with open(self._vectors_path, mode) as f:
+            f.truncate(capacity * self.dimension * self.dtype.itemsize)
+        grow = capacity - self._capacity
+        self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+        self._row_ids.extend([None] * grow)
+        self._payloads.extend([None] * grow)
+        self._capacity = capacity
+        self._open_vectors()
+        if self._quantizer is not None:
+            self._resize_codes()
+        self._write_meta()
+
+    def _resize_codes(self):
+        """量化编码文件与向量文件保持相同的行数"""
+        if self._codes is not None:
+            self._codes.flush()
+            self._codes = None
+        mode = "r+b" if os.path.exists(self._codes_path) else "w+b"
+        with open(self._codes_path, mode) as f:
+            f.truncate(self._capacity * self._quantizer.code_size)
+        self._codes = np.memmap(
+            self._codes_path,
+            dtype=np.uint8,
+            mode="r+",
+            shape=(self._capacity, self._quantizer.code_size)
+        )
+
+    def _init_quantizer(self):
+        """创建量化器；磁盘上有匹配的参数时直接加载，否则用现有数据重新训练并编码"""
+        if self.quantization is None or self._vectors is None:
+            return
+        self._quantizer = create_quantizer(self.quantization, self.dimension)
+        codes_ready = os.path.exists(self._codes_path) and os.path.exists(self._quantizer_path)
+        self._resize_codes()
+        if codes_ready:
+            params = dict(np.load(self._quantizer_path))
+            if str(params.pop("kind")) == self.quantization:
+                self._quantizer_fit_size = int(params.pop("fit_size"))
+                self._quantizer.load_dict(params)
+                return
+        self._fit_quantizer()
+
+    def _fit_quantizer(self):
+        """用存活行的样本训练量化器，并重新编码所有存活行"""
+        rows = np.flatnonzero(self._alive[:self._count])
+        if rows.size == 0:
+            return
+        sample = rows
+        if rows.size > QUANTIZER_SAMPLE_SIZE:
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(rows, QUANTIZER_SAMPLE_SIZE, replace=False))
+        self._quantizer.fit(np.asarray(self._vectors[sample], dtype=np.float32))
+        self._quantizer_fit_size = int(sample.size)
+        for start in range(0, rows.size, SEARCH_BLOCK_ROWS):
+            block = rows[start:start + SEARCH_BLOCK_ROWS]
+            self._codes[block] = self._quantizer.encode(self._vectors[block])
+        self._codes.flush()
+        np.savez(
+            self._quantizer_path,
+            kind=np.array(self.quantization),
+            fit_size=np.array(self._quantizer_fit_size),
+            **self._quantizer.to_dict()
+        )
+        print(f"Fitted {self.quantization} quantizer on {sample.size} vectors")
+
+    def _update_codes(self, rows: np.ndarray):
+        """
+        为新写入的行生成量化编码
+
+        第一次写入时训练量化器；训练样本较少时，集合每增长 4 倍重新训练一次，
+        直到样本数达到 QUANTIZER_SAMPLE_SIZE，避免量化范围只由最初几条数据决定。
+        """
+        if self._quantizer is None:
+            return
+        if not self._quantizer.is_fitted or (
+            self._quantizer_fit_size < QUANTIZER_SAMPLE_SIZE
+            and self.count() >= 4 * self._quantizer_fit_size
+        ):
+            self._fit_quantizer()
+            return
+        self._codes[rows] = self._quantizer.encode(self._vectors[rows])
+        self._codes.flush()
+
+    def train_quantizer(self):
+        """用当前全部数据重新训练量化器（数据分布变化较大后调用）"""
+        with self._lock:
+            self._require_collection()
+            if self._quantizer is None:
+                raise RuntimeError("未启用量化（quantization=None）")
+            self._fit_quantizer()
+
+    def _write_meta(self):
+        meta = {
+            "dimension": self.dimension,
+            "dtype": self.dtype.name,
+            "distance": self.distance,
+            "capacity": self._capacity,
+        }
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _append_log(self, records: List[Dict[str, Any]]):
+        """追加负载日志（同一行的后续记录覆盖之前的记录）"""
+        with open(self._payload_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._log_lines += len(records)
+        # 日志中过期记录过多时重写为当前状态
+        if self._log_lines > 2 * max(len(self._id_to_row), 1024):
+            self._compact_log()
+
+    def _compact_log(self):
+        tmp_path = self._payload_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row_id, row in self._id_to_row.items():
+                record = {"row": row, "id": row_id, "payload": self._payloads[row]}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._payload_path)
+        self._log_lines = len(self._id_to_row)
+
+    def _require_collection(self):
+        if self._vectors is None:
+            raise RuntimeError(
+                f"Collection '{self.collection_name}' does not exist, call create_collection first"
+            )
+
+    def create_collection(
+        self,
+        vector_size: int,
+        distance=None
+    ) -> bool:
+        """
+        创建集合
+
+        Args:
+            vector_size: 向量维度
+            distance: 距离度量方式（COSINE 或 DOT，接受 Qdrant 的 Distance 枚举或字符串），默认为 COSINE
+
+        Returns:
+            是否创建成功（集合已存在时返回 False）
+        """
+        with self._lock:
+            if self._vectors is not None:
+                print(f"Collection may already exist: '{self.collection_name}' at {self.collection_dir}")
+                return False
+            os.makedirs(self.collection_dir, exist_ok=True)
+            self.dimension = vector_size
+            self.distance = _distance_name(distance)
+            if self._ann is not None:
+                self._ann.spherical = self.distance == "cosine"
+            self._resize(1024)
+            self._init_quantizer()
+            print(f"Collection '{self.collection_name}' created successfully")
+            return True
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """转换为 float32 二维数组；余弦距离下做 L2 归一化"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        if self.distance == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1.0)
+        return vectors
+
+    def _allocate_rows(self, count: int) -> List[int]:
+        rows = []
+        while self._free_rows and len(rows) < count:
+            rows.append(self._free_rows.pop())
+        needed = count - len(rows)
+        if needed:
+            if self._count + needed > self._capacity:
+                capacity = self._capacity
+                while self._count + needed > capacity:
+                    capacity *= 2
+                self._resize(capacity)
+            rows.extend(range(self._count, self._count + needed))
+            self._count += needed
+        return rows
+
+    def add_documents(
+        self,
+        texts: List[str],
+        embeddings: Union[List[List[float]], np.ndarray],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        batch_size: Optional[int] = None,
+        parallel: Optional[int] = None
+    ) -> List[str]:
+        """
+        添加文档到向量库（参数同 QdrantClient.add_documents）
+
+        点 ID 与 QdrantClient 相同，由 (metadata["source"], 文本) 确定性生成，
+        已存在的 ID 会原地覆盖。batch_size/parallel 仅为兼容接口，本地写入不需要分批。
+
+        Returns:
+            文档 ID 列表
+        """
+        if metadatas is None:
+            metadatas = [{}] * len(texts)
+        ids = [
+            make_point_id(text, str(metadata.get("source", "")))
+            for text, metadata in zip(texts, metadatas)
+        ]
+        if not ids:
+            return ids
+
+        with self._lock:
+            self._require_collection()
+            vectors = self._prepare(embeddings)
+
+            # 同一批次内重复的 ID 只保留最后一条
+            latest = {point_id: i for i, point_id in enumerate(ids)}
+            new_ids = [point_id for point_id in latest if point_id not in self._id_to_row]
+            new_rows = dict(zip(new_ids, self._allocate_rows(len(new_ids))))
+
+            records = []
+            written_rows = []
+            for point_id, i in latest.items():
+                row = self._id_to_row.get(point_id, new_rows.get(point_id))
+                payload = {"text": texts[i], **metadatas[i]}
+                self._vectors[row] = vectors[i]
+                self._alive[row] = True
+                self._row_ids[row] = point_id
+                self._payloads[row] = payload
+                self._id_to_row[point_id] = row
+                records.append({"row": row, "id": point_id, "payload": payload})
+                written_rows.append(row)
+
+            self._vectors.flush()
+            self._append_log(records)
+            self._update_ann(np.asarray(written_rows, dtype=np.int64))
+            self._update_codes(np.asarray(written_rows, dtype=np.int64))
+
+        print(f"Added {len(ids)} documents to collection")
+        return ids
+
+    def _update_ann(self, rows: np.ndarray):
+        """把新写入的行加入 IVF 索引；未训练时在点数量达到阈值后训练"""
+        if self._ann is None:
+            return
+        if self._ann.is_trained:
+            self._ann.add(rows, self._vectors[rows])
+        elif self.count() >= self._ann.min_train_size:
+            self._ann.train(self._vectors, np.flatnonzero(self._alive[:self._count]))
+            self._ann.save(self.collection_dir)
+
+    def train_index(self):
+        """用当前全部数据重新训练 IVF 索引（集合规模增长较多后调用）"""
+        with self._lock:
+            self._require_collection()
+            if self._ann is None:
+                raise RuntimeError("index_type 为 flat，没有需要训练的索引")
+            self._ann.train(self._vectors, np.flatnonzero(self._alive[:self._count]))
+            self._ann.save(self.collection_dir)
+
+    def _filter_mask(self, filter_conditions: Optional[Dict]) -> np.ndarray:
+        """存活行掩码；filter_conditions 为负载字段的等值匹配条件，例如 {"source": "a.txt"}"""
+        mask = self._alive[:self._count].copy()
+        if filter_conditions:
+            if not isinstance(filter_conditions, dict):
+                raise TypeError("本地向量库只支持字典形式的等值过滤条件")
+            for row in np.flatnonzero(mask):
+                payload = self._payloads[row] or {}
+                if any(payload.get(key) != value for key, value in filter_conditions.items()):
+                    mask[row] = False
+        return mask
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """计算所有行与查询的相似度，形状为 (行数, 查询数)"""
+        count = self._count
+        if self.dtype == np.float32:
+            return np.asarray(self._vectors[:count]) @ queries.T
+        scores = np.empty((count, queries.shape[0]), dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, count)
+            block = np.asarray(self._vectors[start:end], dtype=np.float32)
+            scores[start:end] = block @ queries.T
+        return scores
+
+    @staticmethod
+    def _select(rows: np.ndarray, scores: np.ndarray, top_k: int):
+        """从候选行中选出分数最高的 top_k 个，返回按分数降序的 (行号, 分数)"""
+        if rows.size == 0 or top_k <= 0:
+            return rows[:0], scores[:0]
+        if top_k < rows.size:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            part = np.arange(rows.size)
+        order = part[np.argsort(-scores[part], kind="stable")]
+        return rows[order], scores[order]
+
+    def _top_k(self, scores: np.ndarray, mask: np.ndarray, top_k: int) -> List[Dict]:
+        """从一列分数中选出 top_k 个存活行"""
+        candidates = np.flatnonzero(mask)
+        return self._to_results(*self._select(candidates, scores[candidates], top_k))
+
+    def _quantized_search(self, queries: np.ndarray, mask: np.ndarray, top_k: int) -> List[List[Dict]]:
+        """量化粗排 + 原始向量重新打分"""
+        count = self._count
+        approx = np.empty((count, queries.shape[0]), dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, count)
+            approx[start:end] = self._quantizer.score(np.asarray(self._codes[start:end]), queries)
+
+        num_candidates = max(top_k, int(np.ceil(top_k * self.oversampling)))
+        candidates = np.flatnonzero(mask)
+        results = []
+        for i, query in enumerate(queries):
+            rows, scores = self._select(candidates, approx[candidates, i], num_candidates)
+            if self.rescore and rows.size:
+                rows = np.sort(rows)
+                scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+            results.append(self._to_results(*self._select(rows, scores, top_k)))
+        return results
+
+    def _to_results(self, rows: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        """行号和分数转换为与 QdrantClient 相同的结果字典"""
+        results = []
+        for row, score in zip(rows, scores):
+            payload = self._payloads[row] or {}
+            results.append({
+                "id": self._row_ids[row],
+                "score": float(score),
+                "text": payload.get("text", ""),
+                "metadata": {k: v for k, v in payload.items() if k != "text"}
+            })
+        return results
+
+    def search(
+        self,
+        query_vector: Vector,
+        top_k: int = 5,
+        filter_conditions: Optional[Dict] = None,
+        nprobe: Optional[int] = None,
+        exact: bool = False
+    ) -> List[Dict]:
+        """
+        搜索相似向量（返回格式同 QdrantClient.search）
+
+        Args:
+            query_vector: 查询向量（列表或一维 numpy 数组）
+            top_k: 返回前 k 个结果
+            filter_conditions: 负载字段的等值匹配条件（可选）
+            nprobe: IVF 检索的簇数量，None 使用初始化时的设置
+            exact: 为 True 时即使有 IVF 索引也做精确检索
+        """
+        return self.search_batch(
+            [query_vector],
+            top_k=top_k,
+            filter_conditions=filter_conditions,
+            nprobe=nprobe,
+            exact=exact
+        )[0]
+
+    def search_batch(
+        self,
+        query_vectors: Union[List[List[float]], np.ndarray],
+        top_k: int = 5,
+        filter_conditions: Optional[Dict] = None,
+        nprobe: Optional[int] = None,
+        exact: bool = False
+    ) -> List[List[Dict]]:
+        """
+        批量搜索（返回格式同 QdrantClient.search_batch，其余参数同 search）
+
+        精确检索时所有查询在一次矩阵乘法中完成（启用量化时先用编码粗排再重新打分）；
+        IVF 检索时每个查询只扫描 nprobe 个簇，过滤条件在簇内候选上生效，
+        满足条件的点很少时返回结果可能不足 top_k 个。exact=True 时跳过 IVF 和量化。
+        """
+        if len(query_vectors) == 0:
+            return []
+        with self._lock:
+            self._require_collection()
+            queries = self._prepare(query_vectors)
+            if self._count == 0:
+                return [[] for _ in range(queries.shape[0])]
+            mask = self._filter_mask(filter_conditions)
+            if self._ann is not None and self._ann.is_trained and not exact:
+                return [
+                    self._to_results(rows, scores)
+                    for rows, scores in self._ann.search(queries, self._vectors, mask, top_k, nprobe)
+                ]
+            if self._quantizer is not None and self._quantizer.is_fitted and not exact:
+                return self._quantized_search(queries, mask, top_k)
+            scores = self._scores(queries)
+            return [self._top_k(scores[:, i], mask, top_k) for i in range(queries.shape[0])]
+
+    def existing_ids(self, ids: Sequence[str], batch_size: int = 1000) -> Set[str]:
+        """查询哪些点 ID 已存在于集合中（batch_size 仅为兼容接口）"""
+        with self._lock:
+            return {point_id for point_id in ids if point_id in self._id_to_row}
+
+    def scroll_ids(self, match: Optional[Dict[str, Any]] = None, batch_size: int = 1000) -> Set[str]:
+        """遍历集合中满足等值匹配条件的所有点 ID（match 为 None 表示全部）"""
+        with self._lock:
+            if self._vectors is None:
+                return set()
+            return {self._row_ids[row] for row in np.flatnonzero(self._filter_mask(match))}
+
+    def scroll_documents(
+        self,
+        batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        """分页遍历集合中的所有文档，每页为 (点 ID 列表, 文本列表, 元数据列表)"""
+        with self._lock:
+            if self._vectors is None:
+                return
+            rows = np.flatnonzero(self._alive[:self._count])
+            pages = [
+                [(self._row_ids[row], self._payloads[row] or {}) for row in rows[start:start + batch_size]]
+                for start in range(0, rows.size, batch_size)
+            ]
+        for page in pages:
+            yield (
+                [point_id for point_id, _ in page],
+                [payload.get("text", "") for _, payload in page],
+                [{k: v for k, v in payload.items() if k != "text"} for _, payload in page]
+            )
+
+    def delete_points(self, ids: Iterable[str], batch_size: int = 1000) -> int:
+        """
+        按 ID 删除点（空出的行会被后续写入复用）
+
+        Returns:
+            删除的点数量
+        """
+        with self._lock:
+            records = []
+            removed_rows = []
+            for point_id in ids:
+                row = self._id_to_row.pop(point_id, None)
+                if row is None:
+                    continue
+                removed_rows.append(row)
+                self._alive[row] = False
+                self._row_ids[row] = None
+                self._payloads[row] = None
+                self._free_rows.append(row)
+                records.append({"row": row, "id": None})
+            if records:
+                self._append_log(records)
+                if self._ann is not None:
+                    self._ann.remove(np.asarray(removed_rows, dtype=np.int64))
+                print(f"Deleted {len(records)} documents from collection")
+            return len(records)
+
+    def count(self) -> int:
+        """集合中的点数量"""
+        return len(self._id_to_row)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """存储占用（字节）：原始向量、量化编码，以及每个点的平均占用"""
+        with self._lock:
+            vector_bytes = self._count * (self.dimension or 0) * self.dtype.itemsize
+            code_bytes = self._count * self._quantizer.code_size if self._quantizer is not None else 0
+            return {
+                "points": self.count(),
+                "vector_bytes": vector_bytes,
+                "code_bytes": code_bytes,
+                "bytes_per_vector": (self.dimension or 0) * self.dtype.itemsize,
+                "bytes_per_code": self._quantizer.code_size if self._quantizer is not None else 0,
+            }
+
+    def flush(self):
+        """将向量、量化编码和 IVF 倒排列表写回磁盘"""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                if self._codes is not None:
+                    self._codes.flush()
+                if self._ann is not None and self._ann.dirty:
+                    self._ann.save(self.collection_dir)
+
+    def delete_collection(self) -> bool:
+        """删除集合（包括磁盘文件）"""
+        with self._lock:
+            try:
+                self._vectors = None
+                self._codes = None
+                self._quantizer = None
+                if self._ann is not None:
+                    self._ann.reset()
+                shutil.rmtree(self.collection_dir, ignore_errors=True)
+                self.dimension = None
+                self._capacity = 0
+                self._count = 0
+                self._alive = np.zeros(0, dtype=bool)
+                self._row_ids = []
+                self._payloads = []
+                self._id_to_row = {}
+                self._free_rows = []
+                self._log_lines = 0
+                print(f"Collection '{self.collection_name}' deleted")
+                return True
+            except Exception as e:
+                print(f"Error deleting collection: {e}")
+                return False
+
+
+_indexes: Dict[str, tuple] = {}  # 集合目录 -> (实例, 打开时的索引参数)
+_indexes_lock = threading.Lock()
+
+
+def open_local_index(
+    path: str = "./data/vector_index",
+    collection_name: str = "rag_documents",
+    dtype: Optional[str] = None,
+    **index_kwargs
+) -> LocalVectorIndex:
+    """
+    打开（或复用）本地向量库，index_kwargs 传给 LocalVectorIndex（index_type, nlist, nprobe 等）
+
+    同一集合目录在进程内只对应一个 LocalVectorIndex 实例，
+    BasicRAG 和 RAGFusion 共用同一份数据，写入后检索立即可见。
+    复用已打开的实例时，索引参数（未指定的按默认值）必须与首次打开时一致，否则抛出 ValueError；
+    dtype 为 None 表示沿用已有精度，不参与比较。
+    """
+    settings = inspect.signature(LocalVectorIndex.__init__).bind(None, **index_kwargs)
+    settings.apply_defaults()
+    settings = {
+        name: value for name, value in settings.arguments.items()
+        if name not in ("self", "path", "collection_name", "dtype")
+    }
+    key = os.path.abspath(os.path.join(path, collection_name))
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is None:
+            index = LocalVectorIndex(path, collection_name=collection_name, dtype=dtype, **index_kwargs)
+            _indexes[key] = (index, settings)
+            return index
+
+        index, opened_settings = cached
+        conflicts = [
+            f"{name}={value!r}（已打开: {opened_settings[name]!r}）"
+            for name, value in settings.items() if value != opened_settings[name]
+        ]
+        if dtype is not None and np.dtype(dtype) != index.dtype:
+            conflicts.append(f"dtype={dtype!r}（已打开: {index.dtype.name!r}）")
+        if conflicts:
+            raise ValueError(f"本地向量库 {key} 已以不同参数打开: {', '.join(conflicts)}")
+        return index
+
+
+if __name__ == "__main__":
+    # 示例：不依赖 Qdrant 服务的本地检索（用随机向量演示）
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(0)
+    num_docs, dimension = 20000, 256
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = LocalVectorIndex(tmp_dir, dtype="float16")
+        index.create_collection(vector_size=dimension)
+        texts = [f"文档 {i}" for i in range(num_docs)]
+        vectors = rng.standard_normal((num_docs, dimension)).astype(np.float32)
+
+        start = time.perf_counter()
+        index.add_documents(texts, vectors)
+        print(f"写入 {num_docs} 个向量耗时 {time.perf_counter() - start:.3f}s")
+
+        queries = vectors[:8] + 0.01 * rng.standard_normal((8, dimension)).astype(np.float32)
+        start = time.perf_counter()
+        results = index.search_batch(queries, top_k=3)
+        print(f"批量检索 8 个查询耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+        for i, hits in enumerate(results):
+            print(f"  查询 {i}: {[(hit['text'], round(hit['score'], 4)) for hit in hits]}")
+
+        # 重新打开：从磁盘加载
+        reopened = LocalVectorIndex(tmp_dir)
+        print(f"重新加载后点数量: {reopened.count()}")
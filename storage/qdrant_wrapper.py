@@ -3,12 +3,86 @@ Qdrant vector database client wrapper.
 Day 3-4: 向量数据库
 """
 
-from typing import List, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from typing import Callable, List, Dict, Optional, Any, Iterable, Iterator, Sequence, Set, Tuple, Union
 import uuid
 
-# 直接导入，文件名已重命名，不再冲突
-from qdrant_client import QdrantClient as QdrantSDK
-from qdrant_client.models import Distance, VectorParams, PointStruct
+import numpy as np
+
+from qdrant_client.models import (
+    Distance,
+    VectorParams,
+    PointStruct,
+    SearchRequest,
+    Filter,
+    FieldCondition,
+    MatchValue,
+    PointIdsList,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    SearchParams,
+    QuantizationSearchParams,
+)
+
+from storage.transport import TransportConfig, acquire_client, release_client, get_breaker, call_with_retry
+
+
+# 生成确定性点 ID 的命名空间（固定值，修改会导致所有 ID 变化）
+POINT_ID_NAMESPACE = uuid.UUID("6f1c1d52-8a4e-4f43-9d55-0f3e8e2b7c11")
+
+
+def make_point_id(text: str, source: str = "") -> str:
+    """
+    根据文本内容和来源生成确定性的点 ID
+    
+    相同 (source, text) 总是得到相同的 UUID，重复入库只会覆盖而不会产生重复数据。
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\x00{text}"))
+
+
+# 向量可以是 Python 列表，也可以是 numpy 数组（EmbeddingModel.encode(output="numpy")）
+Vector = Union[Sequence[float], np.ndarray]
+
+
+def _to_vector(vector: Vector) -> List[float]:
+    """将向量转换为 Qdrant 请求所需的 float 列表（float16 会先提升为 float32）"""
+    if isinstance(vector, np.ndarray):
+        return vector.astype(np.float32, copy=False).tolist()
+    return vector
+
+
+def build_quantization_config(quantization: Optional[str], always_ram: bool = True):
+    """
+    构建 Qdrant 集合的量化配置
+
+    Args:
+        quantization: None 不量化，"scalar"（int8）或 "binary"
+        always_ram: 量化后的向量是否常驻内存
+
+    Returns:
+        ScalarQuantization / BinaryQuantization，或 None
+    """
+    if quantization is None:
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=always_ram)
+        )
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=always_ram))
+    raise ValueError(f"不支持的量化方式: {quantization}，可选: scalar, binary")
+
+
+def build_search_params(quantization: Optional[str], oversampling: float = 2.0, rescore: bool = True):
+    """构建检索参数：启用量化时按 oversampling 多取候选，并用原始向量重新打分"""
+    if quantization is None:
+        return None
+    return SearchParams(
+        quantization=QuantizationSearchParams(ignore=False, rescore=rescore, oversampling=oversampling)
+    )
 
 
 class QdrantClient:
@@ -18,31 +92,64 @@ class QdrantClient:
         self,
         url: str = "http://localhost:6333",
         api_key: Optional[str] = None,
-        collection_name: str = "rag_documents"
+        collection_name: str = "rag_documents",
+        upsert_batch_size: int = 256,
+        upsert_parallel: int = 4,
+        max_retries: int = 3,
+        quantization: Optional[str] = None,
+        oversampling: float = 2.0,
+        rescore: bool = True,
+        transport: Optional[TransportConfig] = None
     ):
         """
         初始化 Qdrant 客户端
         
+        底层 SDK 客户端按连接参数在进程内共享（见 storage.transport），
+        所有请求都经过超时、重试和熔断器。
+        
         Args:
             url: Qdrant 服务地址
             api_key: API 密钥（可选）
             collection_name: 集合名称
+            upsert_batch_size: 写入时每批的点数量
+            upsert_parallel: 同时在途的写入批次数量（工作线程数）
+            max_retries: 每个请求失败后的最大重试次数
+            quantization: 创建集合时使用的量化方式（None, "scalar", "binary"）
+            oversampling: 量化检索时的候选放大倍数
+            rescore: 量化检索时是否用原始向量重新打分
+            transport: 连接参数（gRPC、超时、连接池、熔断器），提供时覆盖 url / api_key / max_retries
         """
-        self.url = url
-        self.api_key = api_key
+        if transport is None:
+            transport = TransportConfig(url=url, api_key=api_key, max_retries=max_retries)
+        self.transport = transport
+        self.url = transport.url
+        self.api_key = transport.api_key
         self.collection_name = collection_name
+        self.upsert_batch_size = upsert_batch_size
+        self.upsert_parallel = upsert_parallel
+        self.max_retries = transport.max_retries
+        self.quantization = quantization
+        self.search_params = build_search_params(quantization, oversampling, rescore)
         
-        self.client = QdrantSDK(
-            url=url,
-            api_key=api_key
-        )
+        self.client = acquire_client(transport)
+        self.breaker = get_breaker(transport)
         
-        print(f"Connected to Qdrant at {url}")
+        print(f"Connected to Qdrant at {self.url}")
+    
+    def _call(self, fn: Callable[[], Any], description: str) -> Any:
+        """经过重试和熔断器执行一次 SDK 调用"""
+        return call_with_retry(
+            fn,
+            max_retries=self.max_retries,
+            description=description,
+            breaker=self.breaker
+        )
     
     def create_collection(
         self,
         vector_size: int,
-        distance=None
+        distance=None,
+        on_disk: Optional[bool] = None
     ) -> bool:
         """
         创建集合
@@ -50,20 +157,26 @@ class QdrantClient:
         Args:
             vector_size: 向量维度
             distance: 距离度量方式（COSINE, EUCLID, DOT），默认为 COSINE
+            on_disk: 原始向量是否存放在磁盘上，None 表示启用量化时放磁盘
+                     （内存中只保留量化后的向量，重新打分时读取磁盘）
             
         Returns:
             是否创建成功
         """
         if distance is None:
             distance = Distance.COSINE
+        if on_disk is None:
+            on_disk = self.quantization is not None
         
         try:
             self.client.create_collection(
                 collection_name=self.collection_name,
                 vectors_config=VectorParams(
                     size=vector_size,
-                    distance=distance
-                )
+                    distance=distance,
+                    on_disk=on_disk
+                ),
+                quantization_config=build_quantization_config(self.quantization)
             )
             print(f"Collection '{self.collection_name}' created successfully")
             return True
@@ -74,51 +187,89 @@ class QdrantClient:
     def add_documents(
         self,
         texts: List[str],
-        embeddings: List[List[float]],
-        metadatas: Optional[List[Dict[str, Any]]] = None
+        embeddings: Union[List[List[float]], np.ndarray],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        batch_size: Optional[int] = None,
+        parallel: Optional[int] = None
     ) -> List[str]:
         """
         添加文档到向量库
         
+        点 ID 由 (metadata["source"], 文本) 确定性生成，重复添加同一内容是幂等的。
+        数据按 batch_size 分批写入：除最后一批外均以 wait=False 提交，
+        由 parallel 个工作线程并发发送（在途批次数有上限）；
+        全部完成后再以 wait=True 写入最后一批，作为最终的 flush。
+        每个批次失败时按指数退避重试。
+        
         Args:
             texts: 文本列表
-            embeddings: 向量列表
+            embeddings: 向量列表或二维 numpy 数组
             metadatas: 元数据列表（可选）
+            batch_size: 每批点数量，None 使用初始化时的设置
+            parallel: 并发批次数，None 使用初始化时的设置
             
         Returns:
             文档 ID 列表
         """
         if metadatas is None:
             metadatas = [{}] * len(texts)
+        batch_size = batch_size or self.upsert_batch_size
+        parallel = max(1, parallel or self.upsert_parallel)
         
-        points = []
-        ids = []
+        ids = [
+            make_point_id(text, str(metadata.get("source", "")))
+            for text, metadata in zip(texts, metadatas)
+        ]
+        batches = [
+            (start, min(start + batch_size, len(texts)))
+            for start in range(0, len(texts), batch_size)
+        ]
+        if not batches:
+            return ids
         
-        for i, (text, embedding, metadata) in enumerate(zip(texts, embeddings, metadatas)):
-            point_id = str(uuid.uuid4())
-            ids.append(point_id)
-            
-            point = PointStruct(
-                id=point_id,
-                vector=embedding,
-                payload={
-                    "text": text,
-                    **metadata
-                }
+        def upsert_batch(start: int, end: int, wait: bool):
+            # PointStruct 在工作线程中按批构建，内存中只保留在途批次
+            points = [
+                PointStruct(
+                    id=ids[i],
+                    vector=_to_vector(embeddings[i]),
+                    payload={
+                        "text": texts[i],
+                        **metadatas[i]
+                    }
+                )
+                for i in range(start, end)
+            ]
+            self._call(
+                lambda: self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=points,
+                    wait=wait
+                ),
+                description=f"Upsert batch [{start}:{end}]"
             )
-            points.append(point)
         
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=points
-        )
+        if len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                in_flight = set()
+                for start, end in batches[:-1]:
+                    if len(in_flight) >= parallel:
+                        done, in_flight = wait_futures(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    in_flight.add(executor.submit(upsert_batch, start, end, False))
+                for future in in_flight:
+                    future.result()
         
-        print(f"Added {len(points)} documents to collection")
+        # 最后一批同步写入：Qdrant 按顺序应用更新，返回时之前的批次也已生效
+        upsert_batch(*batches[-1], wait=True)
+        
+        print(f"Added {len(ids)} documents to collection ({len(batches)} batches)")
         return ids
     
     def search(
         self,
-        query_vector: List[float],
+        query_vector: Vector,
         top_k: int = 5,
         filter_conditions: Optional[Dict] = None
     ) -> List[Dict]:
@@ -126,30 +277,202 @@ class QdrantClient:
         搜索相似向量
         
         Args:
-            query_vector: 查询向量
+            query_vector: 查询向量（列表或一维 numpy 数组）
             top_k: 返回前 k 个结果
             filter_conditions: 过滤条件（可选）
             
         Returns:
             搜索结果列表，每个结果包含 id, score, payload
         """
-        results = self.client.search(
-            collection_name=self.collection_name,
-            query_vector=query_vector,
-            limit=top_k,
-            query_filter=filter_conditions
+        vector = _to_vector(query_vector)
+        results = self._call(
+            lambda: self.client.search(
+                collection_name=self.collection_name,
+                query_vector=vector,
+                limit=top_k,
+                query_filter=filter_conditions,
+                search_params=self.search_params
+            ),
+            description="Search"
+        )
+        
+        return [self._to_result(result) for result in results]
+    
+    def search_batch(
+        self,
+        query_vectors: Union[List[List[float]], np.ndarray],
+        top_k: int = 5,
+        filter_conditions: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        批量搜索：多个查询向量在一次请求中完成
+        
+        Args:
+            query_vectors: 查询向量列表或二维 numpy 数组
+            top_k: 每个查询返回前 k 个结果
+            filter_conditions: 过滤条件（可选，对所有查询生效）
+            
+        Returns:
+            与 query_vectors 顺序一致的搜索结果列表
+        """
+        if len(query_vectors) == 0:
+            return []
+        
+        requests = [
+            SearchRequest(
+                vector=_to_vector(query_vector),
+                limit=top_k,
+                filter=filter_conditions,
+                params=self.search_params,
+                with_payload=True
+            )
+            for query_vector in query_vectors
+        ]
+        batch_results = self._call(
+            lambda: self.client.search_batch(
+                collection_name=self.collection_name,
+                requests=requests
+            ),
+            description=f"Search batch ({len(requests)} queries)"
         )
         
         return [
-            {
-                "id": result.id,
-                "score": result.score,
-                "text": result.payload.get("text", ""),
-                "metadata": {k: v for k, v in result.payload.items() if k != "text"}
-            }
-            for result in results
+            [self._to_result(result) for result in results]
+            for results in batch_results
         ]
     
+    def existing_ids(self, ids: Sequence[str], batch_size: int = 1000) -> Set[str]:
+        """
+        查询哪些点 ID 已存在于集合中
+        
+        Args:
+            ids: 待查询的点 ID 列表
+            batch_size: 每次请求查询的 ID 数量
+            
+        Returns:
+            已存在的 ID 集合
+        """
+        found = set()
+        for start in range(0, len(ids), batch_size):
+            batch_ids = list(ids[start:start + batch_size])
+            records = self._call(
+                lambda: self.client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=batch_ids,
+                    with_payload=False,
+                    with_vectors=False
+                ),
+                description="Retrieve"
+            )
+            found.update(str(record.id) for record in records)
+        return found
+    
+    def scroll_ids(self, match: Optional[Dict[str, Any]] = None, batch_size: int = 1000) -> Set[str]:
+        """
+        遍历集合中满足条件的所有点 ID
+        
+        Args:
+            match: 负载字段的等值匹配条件，例如 {"source": "a.txt"}；None 表示全部
+            batch_size: 每页数量
+            
+        Returns:
+            点 ID 集合
+        """
+        scroll_filter = None
+        if match:
+            scroll_filter = Filter(must=[
+                FieldCondition(key=key, match=MatchValue(value=value))
+                for key, value in match.items()
+            ])
+        
+        ids = set()
+        offset = None
+        while True:
+            page_offset = offset
+            records, offset = self._call(
+                lambda: self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=scroll_filter,
+                    limit=batch_size,
+                    offset=page_offset,
+                    with_payload=False,
+                    with_vectors=False
+                ),
+                description="Scroll"
+            )
+            ids.update(str(record.id) for record in records)
+            if offset is None:
+                return ids
+    
+    def scroll_documents(
+        self,
+        batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        """
+        分页遍历集合中的所有文档（用于从向量库重建 BM25 等内存索引）
+        
+        Args:
+            batch_size: 每页数量
+            
+        Yields:
+            (点 ID 列表, 文本列表, 元数据列表)
+        """
+        offset = None
+        while True:
+            page_offset = offset
+            records, offset = self._call(
+                lambda: self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=batch_size,
+                    offset=page_offset,
+                    with_payload=True,
+                    with_vectors=False
+                ),
+                description="Scroll"
+            )
+            if records:
+                payloads = [record.payload or {} for record in records]
+                yield (
+                    [str(record.id) for record in records],
+                    [payload.get("text", "") for payload in payloads],
+                    [{k: v for k, v in payload.items() if k != "text"} for payload in payloads]
+                )
+            if offset is None:
+                return
+    
+    def delete_points(self, ids: Iterable[str], batch_size: int = 1000) -> int:
+        """
+        按 ID 删除点
+        
+        Returns:
+            删除的点数量
+        """
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            selector = PointIdsList(points=ids[start:start + batch_size])
+            self._call(
+                lambda: self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=selector,
+                    wait=True
+                ),
+                description="Delete"
+            )
+        if ids:
+            print(f"Deleted {len(ids)} documents from collection")
+        return len(ids)
+    
+    @staticmethod
+    def _to_result(result) -> Dict:
+        """将 Qdrant 返回的 ScoredPoint 转换为字典"""
+        payload = result.payload or {}
+        return {
+            "id": result.id,
+            "score": result.score,
+            "text": payload.get("text", ""),
+            "metadata": {k: v for k, v in payload.items() if k != "text"}
+        }
+    
     def delete_collection(self) -> bool:
         """删除集合"""
         try:
@@ -159,6 +482,12 @@ class QdrantClient:
         except Exception as e:
             print(f"Error deleting collection: {e}")
             return False
+    
+    def close(self):
+        """释放共享的底层客户端（最后一个使用者释放时关闭连接）"""
+        if self.client is not None and release_client(self.client):
+            self.client.close()
+        self.client = None
 
 
 if __name__ == "__main__":
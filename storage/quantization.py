@@ -0,0 +1,140 @@
+"""
+Vector quantization for LocalVectorIndex.
+标量量化（int8，每维 1 字节）和二值量化（每维 1 位）把向量压缩为紧凑编码，
+检索时先用编码计算近似分数、按 oversampling 多取候选，再用原始向量重新打分（rescore）。
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+QUANTIZATION_TYPES = ("scalar", "binary")
+
+# numpy < 2.0 没有 bitwise_count，使用查表计算 popcount
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+    """按行统计 uint8 位数组中 1 的个数"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT_TABLE[bits].sum(axis=1, dtype=np.int64)
+
+
+class ScalarQuantizer:
+    """
+    int8 标量量化：每一维按 [low, high] 线性映射到 0-255
+
+    low/high 取训练数据的 (1 - quantile) / quantile 分位数，超出范围的值被截断。
+    近似内积 = codes @ (scale * q) + low @ q。
+    """
+
+    kind = "scalar"
+
+    def __init__(self, dimension: int, quantile: float = 0.99):
+        """
+        Args:
+            dimension: 向量维度
+            quantile: 用于确定取值范围的分位数
+        """
+        self.dimension = dimension
+        self.quantile = quantile
+        self.code_size = dimension
+        self.low: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.low is not None
+
+    def fit(self, vectors: np.ndarray):
+        """根据样本确定每一维的取值范围"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        low = np.quantile(vectors, 1 - self.quantile, axis=0).astype(np.float32)
+        high = np.quantile(vectors, self.quantile, axis=0).astype(np.float32)
+        self.low = low
+        self.scale = np.maximum(high - low, 1e-12).astype(np.float32) / 255.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """编码为 uint8 (n, dimension)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.rint((vectors - self.low) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """解码为近似的 float32 向量"""
+        return codes.astype(np.float32) * self.scale + self.low
+
+    def score(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """近似内积，形状为 (编码行数, 查询数)"""
+        queries = np.asarray(queries, dtype=np.float32)
+        return codes.astype(np.float32) @ (queries * self.scale).T + queries @ self.low
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        return {"low": self.low, "scale": self.scale}
+
+    def load_dict(self, params: Dict[str, np.ndarray]):
+        self.low = np.asarray(params["low"], dtype=np.float32)
+        self.scale = np.asarray(params["scale"], dtype=np.float32)
+
+
+class BinaryQuantizer:
+    """
+    二值量化：每一维与阈值（训练数据的均值）比较得到 1 位，按 8 维打包为 1 字节
+
+    近似相似度 = 1 - 2 * hamming / dimension（向量与查询的符号一致程度）。
+    """
+
+    kind = "binary"
+
+    def __init__(self, dimension: int):
+        """
+        Args:
+            dimension: 向量维度
+        """
+        self.dimension = dimension
+        self.code_size = (dimension + 7) // 8
+        self.threshold: Optional[np.ndarray] = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.threshold is not None
+
+    def fit(self, vectors: np.ndarray):
+        """以每一维的均值作为阈值（嵌入向量通常不是零均值的）"""
+        self.threshold = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """编码为打包后的位数组 uint8 (n, ceil(dimension / 8))"""
+        bits = np.asarray(vectors, dtype=np.float32) > self.threshold
+        return np.packbits(bits, axis=1)
+
+    def score(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """近似相似度，形状为 (编码行数, 查询数)"""
+        query_codes = self.encode(np.asarray(queries, dtype=np.float32).reshape(-1, self.dimension))
+        scores = np.empty((codes.shape[0], query_codes.shape[0]), dtype=np.float32)
+        for i, query_code in enumerate(query_codes):
+            hamming = _popcount_rows(np.bitwise_xor(codes, query_code))
+            scores[:, i] = 1.0 - 2.0 * hamming / self.dimension
+        return scores
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        return {"threshold": self.threshold}
+
+    def load_dict(self, params: Dict[str, np.ndarray]):
+        self.threshold = np.asarray(params["threshold"], dtype=np.float32)
+
+
+def create_quantizer(kind: str, dimension: int):
+    """
+    创建量化器
+
+    Args:
+        kind: "scalar"（int8）或 "binary"
+        dimension: 向量维度
+    """
+    if kind == "scalar":
+        return ScalarQuantizer(dimension)
+    if kind == "binary":
+        return BinaryQuantizer(dimension)
+    raise ValueError(f"不支持的量化方式: {kind}，可选: {', '.join(QUANTIZATION_TYPES)}")
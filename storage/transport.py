@@ -0,0 +1,424 @@
+"""
+Shared Qdrant transport layer.
+按 (url, api_key, prefer_grpc, ...) 共享底层 SDK 客户端（连接池 + keep-alive），
+并提供超时、带随机抖动的指数退避重试和熔断器。
+同一进程内的 BasicRAG、RAGFusion 等组件连接同一个 Qdrant 时复用同一组连接。
+"""
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败 failure_threshold 次后进入 open 状态，reset_timeout 秒内的请求直接失败；
+    之后进入 half_open 状态放行一个探测请求，成功则恢复 closed，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, name: str = "qdrant"):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后打开熔断器
+            reset_timeout: 打开后多久（秒）允许探测请求
+            name: 日志中使用的名称
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """请求前检查，熔断器打开时抛出 CircuitOpenError"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(f"Circuit '{self.name}' is open, retry in {remaining:.1f}s")
+            # 冷却结束：只放行一个探测请求
+            if self._probe_in_flight:
+                raise CircuitOpenError(f"Circuit '{self.name}' is half-open, probe in flight")
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f"Circuit '{self.name}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    print(f"Circuit '{self.name}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    判断错误是否值得重试（以及是否计入熔断器）
+
+    4xx 响应（408/429 除外）说明请求本身有问题，服务是健康的；
+    其余错误（连接失败、超时、5xx）视为暂时性故障。
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int) and 400 <= status_code < 500:
+        return status_code in (408, 429)
+    return True
+
+
+def _retry_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """第 attempt 次重试前的等待时间：指数退避 + 随机抖动"""
+    return min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+def call_with_retry(
+    fn: Callable[[], Any],
+    max_retries: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 8.0,
+    description: str = "request",
+    breaker: Optional[CircuitBreaker] = None
+) -> Any:
+    """
+    执行请求，失败时按指数退避（带随机抖动）重试
+
+    Args:
+        fn: 无参调用
+        max_retries: 最大重试次数（不含首次调用）
+        base_delay: 首次重试前的基础等待时间（秒）
+        max_delay: 单次等待的上限（秒）
+        description: 日志中使用的请求描述
+        breaker: 熔断器（可选），打开时不再重试，直接抛出 CircuitOpenError
+
+    不可重试的错误（见 is_retryable）直接抛出。
+    """
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_retryable(e):
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            delay = _retry_delay(attempt, base_delay, max_delay)
+            attempt += 1
+            print(f"{description} failed ({e}), retry {attempt}/{max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+async def async_call_with_retry(
+    fn: Callable[[], Awaitable[Any]],
+    max_retries: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 8.0,
+    description: str = "request",
+    breaker: Optional[CircuitBreaker] = None
+) -> Any:
+    """call_with_retry 的 asyncio 版本，fn 返回 awaitable"""
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await fn()
+        except Exception as e:
+            if not is_retryable(e):
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            delay = _retry_delay(attempt, base_delay, max_delay)
+            attempt += 1
+            print(f"{description} failed ({e}), retry {attempt}/{max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+class TransportConfig:
+    """连接参数（同样的参数共享同一个底层客户端）"""
+
+    def __init__(
+        self,
+        url: str = "http://localhost:6333",
+        api_key: Optional[str] = None,
+        prefer_grpc: bool = False,
+        grpc_port: int = 6334,
+        timeout: int = 10,
+        pool_size: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_retries: int = 3,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0
+    ):
+        """
+        Args:
+            url: Qdrant 服务地址
+            api_key: API 密钥（可选）
+            prefer_grpc: 是否优先使用 gRPC（向量以二进制传输，避免 JSON 序列化）
+            grpc_port: gRPC 端口
+            timeout: 单次请求超时（秒）
+            pool_size: REST 连接池大小（keep-alive 连接数上限）
+            keepalive_expiry: 空闲连接保持时间（秒）
+            max_retries: 每个请求失败后的最大重试次数
+            failure_threshold: 熔断器连续失败阈值
+            reset_timeout: 熔断器打开后的冷却时间（秒）
+        """
+        self.url = url
+        self.api_key = api_key
+        self.prefer_grpc = prefer_grpc
+        self.grpc_port = grpc_port
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.max_retries = max_retries
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    @classmethod
+    def from_config(cls, url: str, transport_config: Optional[Dict[str, Any]] = None) -> "TransportConfig":
+        """
+        从 config.yaml 的 vector_store.transport 配置创建
+
+        Args:
+            url: Qdrant 服务地址
+            transport_config: transport 配置字典（可选），未设置的项使用默认值
+        """
+        transport_config = dict(transport_config or {})
+        breaker_config = transport_config.pop("circuit_breaker", None) or {}
+        return cls(url=url, **transport_config, **breaker_config)
+
+    def client_key(self) -> Tuple:
+        """共享客户端的键：只包含影响连接本身的参数"""
+        return (
+            self.url, self.api_key, self.prefer_grpc, self.grpc_port,
+            self.timeout, self.pool_size, self.keepalive_expiry
+        )
+
+    def sdk_kwargs(self) -> Dict[str, Any]:
+        """构建 qdrant_client 的初始化参数"""
+        kwargs = {
+            "url": self.url,
+            "api_key": self.api_key,
+            "prefer_grpc": self.prefer_grpc,
+            "grpc_port": self.grpc_port,
+            "timeout": self.timeout,
+        }
+        try:
+            # REST 模式下额外参数透传给 httpx 客户端
+            import httpx
+            kwargs["limits"] = httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_expiry
+            )
+        except ImportError:
+            pass
+        return kwargs
+
+
+# 共享客户端：键 -> [客户端, 引用计数]；熔断器按服务地址共享
+_clients: Dict[Tuple, list] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_pool_lock = threading.Lock()
+
+
+def get_breaker(config: TransportConfig) -> CircuitBreaker:
+    """获取服务地址对应的共享熔断器"""
+    with _pool_lock:
+        breaker = _breakers.get(config.url)
+        if breaker is None:
+            breaker = CircuitBreaker(config.failure_threshold, config.reset_timeout, name=config.url)
+            _breakers[config.url] = breaker
+        return breaker
+
+
+def acquire_client(config: TransportConfig, use_async: bool = False):
+    """
+    获取共享的 SDK 客户端（不存在时创建），引用计数加一
+
+    Args:
+        config: 连接参数
+        use_async: True 返回 qdrant_client.AsyncQdrantClient
+
+    Returns:
+        qdrant_client.QdrantClient 或 AsyncQdrantClient
+    """
+    key = config.client_key() + (use_async,)
+    with _pool_lock:
+        entry = _clients.get(key)
+        if entry is None:
+            if use_async:
+                from qdrant_client import AsyncQdrantClient as SDKClient
+            else:
+                from qdrant_client import QdrantClient as SDKClient
+            entry = [SDKClient(**config.sdk_kwargs()), 0]
+            _clients[key] = entry
+            transport = "gRPC" if config.prefer_grpc else "REST"
+            print(f"Opened shared Qdrant {transport} transport to {config.url}")
+        entry[1] += 1
+        return entry[0]
+
+
+def release_client(client) -> bool:
+    """
+    引用计数减一，降为零时从池中移除
+
+    Returns:
+        是否需要由调用方关闭该客户端（AsyncQdrantClient.close 需要 await）
+    """
+    with _pool_lock:
+        for key, entry in list(_clients.items()):
+            if entry[0] is client:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del _clients[key]
+                    return True
+                return False
+    return True
+
+
+def close_all_clients():
+    """关闭所有共享的同步客户端并清空连接池（异步客户端仅移出池）"""
+    with _pool_lock:
+        entries = list(_clients.items())
+        _clients.clear()
+        _breakers.clear()
+    for key, (client, _) in entries:
+        if not key[-1]:
+            client.close()
+
+
+if __name__ == "__main__":
+    # 示例：用本地 stub 服务模拟 Qdrant 的 REST 接口，演示共享连接、重试和熔断
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from storage.qdrant_wrapper import QdrantClient
+
+    class StubQdrantHandler(BaseHTTPRequestHandler):
+        """最小化的 Qdrant REST stub：前 fail_next 个检索请求返回 503"""
+
+        protocol_version = "HTTP/1.1"  # 支持 keep-alive
+        fail_next = 0
+        connections = set()
+
+        def _reply(self, status: int, result: Any):
+            body = json.dumps({"result": result, "status": "ok", "time": 0.0}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            StubQdrantHandler.connections.add(self.client_address)
+            self._reply(200, {"title": "qdrant stub", "version": "1.9.0"})
+
+        def do_POST(self):
+            StubQdrantHandler.connections.add(self.client_address)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if StubQdrantHandler.fail_next > 0:
+                StubQdrantHandler.fail_next -= 1
+                self._reply(503, None)
+                return
+            point = {"id": 1, "version": 0, "score": 0.9, "payload": {"text": "stub document"}}
+            if self.path.endswith("/points/search/batch"):
+                self._reply(200, [[point]])
+            elif self.path.endswith("/points/query"):
+                self._reply(200, {"points": [point]})
+            else:
+                self._reply(200, [point])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubQdrantHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Stub Qdrant listening on {url}")
+
+    transport = TransportConfig(url=url, timeout=2, max_retries=2, failure_threshold=3, reset_timeout=1.0)
+    first = QdrantClient(collection_name="demo", transport=transport)
+    second = QdrantClient(collection_name="demo", transport=transport)
+    print(f"\n两个封装共享同一个 SDK 客户端: {first.client is second.client}")
+
+    for _ in range(5):
+        first.search([0.1, 0.2, 0.3], top_k=1)
+    print(f"5 次检索使用的 TCP 连接数: {len(StubQdrantHandler.connections)}")
+
+    print("\n前 2 个请求失败，重试后成功:")
+    StubQdrantHandler.fail_next = 2
+    print(first.search([0.1, 0.2, 0.3], top_k=1))
+
+    print("\n服务持续失败，熔断器打开后请求直接失败:")
+    StubQdrantHandler.fail_next = 100
+    for _ in range(2):
+        try:
+            first.search([0.1, 0.2, 0.3], top_k=1)
+        except Exception as e:
+            print(f"  {type(e).__name__}: {e}")
+
+    print("\n服务恢复，冷却结束后探测请求成功，熔断器关闭:")
+    StubQdrantHandler.fail_next = 0
+    time.sleep(transport.reset_timeout)
+    print(second.search([0.1, 0.2, 0.3], top_k=1))
+
+    close_all_clients()
+    server.shutdown()